@@ -4,7 +4,7 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Sum, F
 from django.db.models.functions import TruncDate
-from core.models import Asset, Transaction
+from core.models import Asset, DailyAssetRollup, Transaction
 from datetime import datetime, date, timedelta
 from django.utils import timezone
 from decimal import Decimal
@@ -26,7 +26,7 @@ class IndexStats(APIView):
         total_revenue = user_assets.aggregate(Sum('total_revenue'))['total_revenue__sum'] or Decimal('0.00')
 
         # Get the month and year from query parameters, default to current month
-        today = timezone.now().date()
+        today = timezone.localdate()
         year = int(request.query_params.get('year', today.year))
         month = int(request.query_params.get('month', today.month))
 
@@ -38,21 +38,35 @@ class IndexStats(APIView):
         # Ensure we don't query future dates
         end_date = min(end_date, today)
 
-        # Get daily revenue for each asset type
-        revenue_data = (
-            Transaction.objects
+        # Get daily revenue for each asset type: past days from the daily rollups (see core/rollups.py)
+        revenue_data = list(
+            DailyAssetRollup.objects
             .filter(
                 asset__in=user_assets,
-                payment_status='completed',
-                timestamp__date__gte=start_date,
-                timestamp__date__lte=end_date
+                date__gte=start_date,
+                date__lte=end_date,
+                date__lt=today
             )
-            .annotate(date=TruncDate('timestamp'))
             .values('date', 'asset__asset_type')
-            .annotate(daily_revenue=Sum('amount'))
+            .annotate(daily_revenue=Sum('revenue'))
             .order_by('date', 'asset__asset_type')
         )
 
+        # and the current day from the transactions, as it is still changing
+        if end_date == today:
+            revenue_data += list(
+                Transaction.objects
+                .filter(
+                    asset__in=user_assets,
+                    payment_status='completed',
+                    timestamp__date=today
+                )
+                .annotate(date=TruncDate('timestamp'))
+                .values('date', 'asset__asset_type')
+                .annotate(daily_revenue=Sum('amount'))
+                .order_by('date', 'asset__asset_type')
+            )
+
         # Organize data for the graph
         graph_data = {}
         asset_types = set(user_assets.values_list('asset_type', flat=True))
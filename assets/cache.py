@@ -0,0 +1,87 @@
+"""
+Cache of the asset list (AssetViewSet.list) of each user, stored as serialized rows.
+
+Every asset has a version in the Django cache (Redis when CACHE_REDIS_URL is set), bumped by
+the receivers in assets/signals.py whenever the asset, one of its roles, rooms or vehicles is
+written (and again when the write commits); every user has one bumped when their roles change.
+A cached list records the versions of its assets and is only served while they are all
+unchanged, so a write by any member of an asset invalidates the list of all its members, in
+every process. A missing version starts at a random value, so an evicted counter can never
+match a list cached before the eviction. Without a shared cache (SHARED_CACHE) the versions
+bumped in one process are invisible to the others, so lists are always rebuilt.
+"""
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _asset_key(asset_number):
+    return f'asset_version:{asset_number}'
+
+
+def _user_key(user_id):
+    return f'asset_list_version:{user_id}'
+
+
+def _new_version():
+    return random.getrandbits(48)
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:  # missing or evicted
+        cache.add(key, _new_version(), timeout=None)
+
+
+def bump_asset_version(asset_number):
+    _bump(_asset_key(asset_number))
+
+
+def bump_user_version(user_id):
+    _bump(_user_key(user_id))
+
+
+def asset_versions(asset_numbers):
+    keys = {asset_number: _asset_key(asset_number) for asset_number in asset_numbers}
+    versions = cache.get_many(keys.values())
+    missing = {key: _new_version() for key in keys.values() if key not in versions}
+    for key, version in missing.items():
+        # another process may have set it first, keep theirs
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key)
+        versions[key] = version
+    return {asset_number: versions[key] for asset_number, key in keys.items()}
+
+
+def user_version(user_id):
+    key = _user_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_asset_list(user_id, load_asset_numbers, build):
+    """
+    The cached rows of the user's asset list, or the rows returned by `build()` (a list of
+    serialized assets), which are cached for ASSET_LIST_CACHE_TTL seconds. On a miss the versions
+    of the user's assets (`load_asset_numbers()`) are read before the rows, so a write committed
+    while the rows are built leaves the new entry outdated instead of serving it.
+    """
+    if not settings.SHARED_CACHE:
+        return build()
+
+    key = f'asset_list:{user_id}:{user_version(user_id)}'
+    cached = cache.get(key)
+    if cached is not None:
+        versions, rows = cached
+        if asset_versions(versions) == versions:
+            return rows
+
+    versions = asset_versions(load_asset_numbers())
+    rows = build()
+    cache.set(key, (versions, rows), timeout=settings.ASSET_LIST_CACHE_TTL)
+    return rows
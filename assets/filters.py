@@ -0,0 +1,38 @@
+"""
+Filtering and paging of the room and vehicle lists.
+
+`?status=true|false`, `?room_type=` / `?vehicle_type=`, `?expiring_before=<date or datetime>`,
+`?ordering=<field>` (or `-<field>`, see the view's ordering_fields) and keyset pages of `?limit=`
+rows (see utils.helpers.KeysetPagination). These lists used to be unpaginated, so they are only
+paged when the client asks for it with `?limit=` or `?cursor=`.
+"""
+from django_filters import rest_framework as filters
+
+from core.models import HotelRoom, Vehicle
+from utils.helpers import KeysetPagination
+
+
+class SubAssetFilter(filters.FilterSet):
+    expiring_before = filters.DateTimeFilter(field_name='expiry_timestamp', lookup_expr='lt')
+
+
+class HotelRoomFilter(SubAssetFilter):
+    class Meta:
+        model = HotelRoom
+        fields = ['status', 'room_type']
+
+
+class VehicleFilter(SubAssetFilter):
+    class Meta:
+        model = Vehicle
+        fields = ['status', 'vehicle_type']
+
+
+class HotelRoomPagination(KeysetPagination):
+    ordering = ('room_number', 'id')
+    paginate_by_default = False
+
+
+class VehiclePagination(KeysetPagination):
+    ordering = ('vehicle_number', 'id')
+    paginate_by_default = False
@@ -1,8 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from django.contrib.contenttypes.models import ContentType
-from core.models import HotelRoom, Vehicle, Role, Transaction, AssetEvent, Asset
+from core.models import HotelRoom, Vehicle, Role, Transaction, Asset, SubAssetState
 from django.db.models import Count
+from core.roles import role_resolver
 
 User = get_user_model()
 
@@ -12,7 +12,14 @@ class TransactionHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = ['name', 'amount', 'sub_asset_number', 'payment_status', 'date_time']
-        
+
+    def __init__(self, *args, fields=None, **kwargs):
+        # sparse fieldset, e.g. ?fields=amount,date_time
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
 
 class AssetSerializer(serializers.ModelSerializer):
     user_role = serializers.SerializerMethodField()
@@ -24,13 +31,16 @@ class AssetSerializer(serializers.ModelSerializer):
         read_only_fields = ['asset_number', 'created_at', 'total_revenue', 'user_role', 'sub_asset_count']
 
     def get_user_role(self, obj):
+        if hasattr(obj, 'user_role'):  # annotated by AssetViewSet.get_queryset
+            return obj.user_role
         request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            role = Role.objects.filter(user=request.user, asset=obj).first()
-            return role.role if role else None
+        if request:
+            return role_resolver.role(request, obj.asset_number)
         return None
 
     def get_sub_asset_count(self, obj):
+        if hasattr(obj, 'sub_asset_count'):
+            return obj.sub_asset_count
         if obj.asset_type == 'hotel':
             return obj.rooms.count()
         elif obj.asset_type == 'vehicle':
@@ -63,11 +73,15 @@ class AssetUserSerializer(serializers.ModelSerializer):
         return f"{obj.first_name} {obj.last_name}".strip() or obj.username
 
     def get_role(self, obj):
+        if hasattr(obj, 'asset_role'):  # annotated by AssetUsersListView
+            return obj.asset_role
         asset_number = self.context.get('asset_number')
         role = obj.roles.filter(asset__asset_number=asset_number).first()
         return role.role if role else None
 
     def get_role_association_timestamp(self, obj):
+        if hasattr(obj, 'role_created_at'):
+            return obj.role_created_at
         asset_number = self.context.get('asset_number')
         role = obj.roles.filter(asset__asset_number=asset_number).first()
         return role.created_at if role else None
@@ -83,6 +97,8 @@ class DisassociateUserSerializer(serializers.Serializer):
 
 
 class HotelRoomSerializer(serializers.ModelSerializer):
+    # the FK value is the asset_number, no need to fetch the hotel for it
+    hotel = serializers.CharField(source='hotel_id', read_only=True)
     occupancy = serializers.SerializerMethodField()
 
     class Meta:
@@ -91,19 +107,30 @@ class HotelRoomSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'hotel']
 
     def get_occupancy(self, obj):
-        hotel_room_content_type = ContentType.objects.get_for_model(HotelRoom)
-        last_event = AssetEvent.objects.filter(
-            content_type=hotel_room_content_type,
-            object_id=obj.room_number,
-            event_type='occupancy'
-        ).order_by('-timestamp').first()
+        # annotated by HotelRoomViewSet for all the rooms at once
+        if hasattr(obj, 'last_occupancy'):
+            data = obj.last_occupancy
+        else:
+            data = HotelRoom.objects.filter(pk=obj.pk).values_list(
+                SubAssetState.latest_data(HotelRoom, 'occupancy', 'hotel_id', 'room_number'), flat=True
+            ).first()
+        # the number of guests, 0 without (valid) occupancy reports
+        return int(data) if data is not None and data.isdigit() else 0
+
+
+class VehicleUpdateMixin:
+    # a full save() would write back the location fields read with the vehicle, overwriting what
+    # the location accumulator (mqtt_handler/location.py) flushed since, so only save what was sent
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
 
-        if last_event:
-            return last_event.data
-        return 0  # Or any default value you prefer
 
+class VehicleSerializer(VehicleUpdateMixin, serializers.ModelSerializer):
+    fleet = serializers.CharField(source='fleet_id', read_only=True)
 
-class VehicleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Vehicle
         fields = ['id', 'vehicle_number', 'brand', 'vehicle_type', 'status', 'fleet']
@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from core.models import Asset, HotelRoom, Role, Vehicle
+from .cache import bump_asset_version, bump_user_version
+
+
+def _bump(asset_number, user_id=None):
+    # now, and once committed: a list rebuilt in between would hold the rows from before the write
+    def bump():
+        bump_asset_version(asset_number)
+        if user_id is not None:
+            bump_user_version(user_id)
+    bump()
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Asset)
+@receiver(post_delete, sender=Asset)
+def invalidate_asset_lists(sender, instance, **kwargs):
+    _bump(instance.asset_number)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_member_asset_lists(sender, instance, **kwargs):
+    _bump(instance.asset_id, instance.user_id)
+
+
+@receiver(post_save, sender=HotelRoom)
+@receiver(post_delete, sender=HotelRoom)
+def invalidate_hotel_asset_lists(sender, instance, **kwargs):
+    _bump(instance.hotel_id)
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def invalidate_fleet_asset_lists(sender, instance, **kwargs):
+    _bump(instance.fleet_id)
@@ -1,6 +1,9 @@
 import logging
 
-from django.core.cache import cache
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
 from rest_framework import status
 from rest_framework.exceptions import NotFound, PermissionDenied
@@ -10,12 +13,18 @@ from rest_framework.permissions import OR, IsAuthenticated
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.views import APIView
-from django.db.models import Count, Case, When, Value, IntegerField
+from django.db.models import Count, Case, F, When, Value, IntegerField
+from django_filters.rest_framework import DjangoFilterBackend
 
+from .cache import get_asset_list
+from .filters import HotelRoomFilter, HotelRoomPagination, VehicleFilter, VehiclePagination
 from .serializers import AssetSerializer, AssociateUserSerializer, HotelRoomSerializer, VehicleSerializer, DisassociateUserSerializer, AssetUserSerializer, TransactionHistorySerializer
-from core.models import Asset, Role, User, HotelRoom, Vehicle, Transaction
+from core.models import Asset, Role, User, HotelRoom, Vehicle, Transaction, SubAssetState
 from core.permissions import IsAdmin, IsManager
+from core.roles import role_level, role_resolver
+from core import PAYMENT_STATUS_CHOICES
 from assets import ROLE_CHOICES
+from utils.helpers import KeysetPagination
 
 
 logger = logging.getLogger(__name__)
@@ -31,23 +40,19 @@ class AssetViewSet(ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         logger.debug(f"Getting queryset for user: {user.id}")
-        cache_key = f'user_assets_{user.id}'
-        assets = cache.get(cache_key)
-        if not assets:
-            assets = Asset.objects.filter(roles__user=user).annotate(
-                sub_asset_count=Count(
-                    Case(
-                        When(asset_type='hotel', then='rooms'),
-                        When(asset_type='vehicle', then='fleet'),
-                        default=Value(None),
-                        output_field=IntegerField()
-                    )
-                )
+        # the user's role and the sub-asset count come with the assets (see AssetSerializer)
+        return Asset.objects.filter(roles__user=user).annotate(
+            user_role=F('roles__role'),
+            sub_asset_count=Count(
+                Case(
+                    When(asset_type='hotel', then='rooms'),
+                    When(asset_type='vehicle', then='fleet'),
+                    default=Value(None),
+                    output_field=IntegerField()
+                ),
+                distinct=True
             )
-            cache.set(cache_key, assets, 60 * 5)  # Cache for 5 minutes
-        
-        logger.debug(f"Queryset count: {assets.count()}")
-        return assets
+        )
 
     def get_object(self):
         queryset = self.get_queryset()
@@ -61,7 +66,7 @@ class AssetViewSet(ModelViewSet):
         logger.debug(f"Checking object permissions for user {request.user.id} on asset {asset.asset_number}")
         super().check_object_permissions(request, asset)
         if self.action in ['update', 'partial_update', 'destroy']:
-            is_admin = Role.objects.filter(user=request.user, asset__asset_number=asset.asset_number, role='admin').exists()
+            is_admin = role_resolver.has_role(request, asset.asset_number, 'admin')
             logger.debug(f"User is admin: {is_admin}")
             if not is_admin:
                 logger.debug("Permission denied: User is not admin for this asset")
@@ -72,11 +77,9 @@ class AssetViewSet(ModelViewSet):
     def perform_create(self, serializer):
         asset = serializer.save(user=self.request.user)
         Role.objects.create(user=self.request.user, asset=asset, role='admin')
-        cache.delete(f'user_assets_{self.request.user.id}')
 
     def perform_destroy(self, instance):
         logger.debug(f"Performing destroy on asset {instance.asset_number}")
-        cache.delete(f'user_assets_{self.request.user.id}')
         instance.delete()
         logger.debug(f"Asset {instance.asset_number} deleted")
 
@@ -95,9 +98,13 @@ class AssetViewSet(ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
         
     def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        # serialized rows, cached until a write to one of the assets (see assets/cache.py)
+        rows = get_asset_list(
+            request.user.id,
+            lambda: list(role_resolver.roles(request)),
+            lambda: [dict(row) for row in self.get_serializer(self.filter_queryset(self.get_queryset()), many=True).data],
+        )
+        return Response(rows)
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -114,7 +121,6 @@ class AssetViewSet(ModelViewSet):
 
     def perform_update(self, serializer):
         serializer.save(user=self.request.user)
-        cache.delete(f'user_assets_{self.request.user.id}')
 
 
 class AssetUsersListView(APIView):
@@ -122,16 +128,14 @@ class AssetUsersListView(APIView):
 
     def get(self, request, asset_number):
         asset = get_object_or_404(Asset, asset_number=asset_number)
-        users = User.objects.filter(roles__asset__asset_number=asset_number)
+        # each user's role on the asset comes with the user (see AssetUserSerializer)
+        users = User.objects.filter(roles__asset_id=asset_number).annotate(
+            asset_role=F('roles__role'), role_created_at=F('roles__created_at')
+        )
         serializer = AssetUserSerializer(users, many=True, context={'asset_number': asset_number})
         return Response(serializer.data)
 
 
-def get_role_level(role):
-    role_hierarchy = {'admin': 3, 'manager': 2, 'viewer': 1}
-    return role_hierarchy.get(role, 0)
-
-
 class AssociateUserView(APIView):
     permission_classes = [IsAuthenticated, (IsAdmin | IsManager)]
 
@@ -140,11 +144,11 @@ class AssociateUserView(APIView):
         asset = get_object_or_404(Asset, asset_number=asset_number)
 
         # Get the role of the requesting user
-        requester_role = Role.objects.filter(user=request.user, asset=asset).first()
+        requester_role = role_resolver.role(request, asset_number)
         if not requester_role:
             return Response({'error': 'You are not associated with this asset.'}, status=status.HTTP_403_FORBIDDEN)
 
-        requester_level = get_role_level(requester_role.role)
+        requester_level = role_level(requester_role)
 
         serializer = AssociateUserSerializer(data=request.data)
         if serializer.is_valid():
@@ -152,7 +156,7 @@ class AssociateUserView(APIView):
             new_role = serializer.validated_data['role']
 
             # Check if the new role is at the same level or lower than the requester's role
-            if get_role_level(new_role) > requester_level:
+            if role_level(new_role) > requester_level:
                 return Response({'error': 'You cannot assign a role higher than your own.'}, status=status.HTTP_403_FORBIDDEN)
 
             try:
@@ -175,11 +179,11 @@ class DisassociateUserView(APIView):
         asset = get_object_or_404(Asset, asset_number=asset_number)
 
         # Get the role of the requesting user
-        requester_role = Role.objects.filter(user=request.user, asset=asset).first()
+        requester_role = role_resolver.role(request, asset_number)
         if not requester_role:
             return Response({'error': 'You are not associated with this asset.'}, status=status.HTTP_403_FORBIDDEN)
 
-        requester_level = get_role_level(requester_role.role)
+        requester_level = role_level(requester_role)
 
         serializer = DisassociateUserSerializer(data=request.data)
         if serializer.is_valid():
@@ -193,7 +197,7 @@ class DisassociateUserView(APIView):
             role = Role.objects.filter(user=user, asset=asset).first()
             if role:
                 # Check if the requester has permission to disassociate this user
-                if get_role_level(role.role) >= requester_level and requester_role.role != 'admin':
+                if role_level(role.role) >= requester_level and requester_role != 'admin':
                     return Response({'error': 'You do not have permission to disassociate this user.'}, status=status.HTTP_403_FORBIDDEN)
 
                 if role.role == 'admin' and Role.objects.filter(asset=asset, role='admin').count() == 1:
@@ -207,138 +211,159 @@ class DisassociateUserView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class HotelRoomViewSet(ModelViewSet):
-    serializer_class = HotelRoomSerializer
-    permission_classes = [IsAuthenticated]
-    lookup_field = 'room_number'
-    lookup_url_kwarg = 'room_number'
-
-    def get_queryset(self):
-        asset_number = self.kwargs.get('asset_number')
-        asset = get_object_or_404(Asset, asset_number=asset_number)
-        if asset.asset_type != 'hotel':
-            raise NotFound("This asset is not a hotel.")
-        return HotelRoom.objects.filter(hotel__asset_number=asset_number)
+class ParentAssetMixin:
+    """
+    For viewsets nested under /assets/<asset_number>/: the parent asset is fetched once per
+    request and kept on the view, and its type and the user's role on it are checked before the
+    action runs. Reading requires any role on the asset, writing requires 'admin'.
+    """
+    parent_asset_type = None
+    parent_asset_error = "This asset does not have this kind of sub-asset."
+    admin_actions = ['create', 'update', 'partial_update', 'destroy']
+
+    def get_parent_asset(self):
+        if not hasattr(self, '_parent_asset'):
+            asset = get_object_or_404(Asset, asset_number=self.kwargs.get('asset_number'))
+            if asset.asset_type != self.parent_asset_type:
+                raise NotFound(self.parent_asset_error)
+            self._parent_asset = asset
+        return self._parent_asset
 
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in self.admin_actions:
             return [IsAuthenticated(), IsAdmin()]
         return [IsAuthenticated()]
 
     def check_permissions(self, request):
         super().check_permissions(request)
-        asset_number = self.kwargs.get('asset_number')
-        asset = get_object_or_404(Asset, asset_number=asset_number)
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
-            if not Role.objects.filter(user=request.user, asset__asset_number=asset_number, role='admin').exists():
-                self.permission_denied(request, message="You do not have admin permissions for this asset.")
+        asset = self.get_parent_asset()
+        roles = ['admin'] if self.action in self.admin_actions else []
+        if not role_resolver.has_role(request, asset.asset_number, *roles):
+            self.permission_denied(request, message="You do not have permissions for this asset.")
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
 
-    def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
-
-    def create(self, request, *args, **kwargs):
-        asset_number = self.kwargs.get('asset_number')
-        asset = get_object_or_404(Asset, asset_number=asset_number)
-        if asset.asset_type != 'hotel':
-            return Response({'error': 'This asset is not a hotel.'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        serializer.save(hotel=asset)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+class HotelRoomViewSet(ParentAssetMixin, ModelViewSet):
+    serializer_class = HotelRoomSerializer
+    permission_classes = [IsAuthenticated]
+    lookup_field = 'room_number'
+    lookup_url_kwarg = 'room_number'
+    parent_asset_type = 'hotel'
+    parent_asset_error = "This asset is not a hotel."
+    # see assets/filters.py
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = HotelRoomFilter
+    pagination_class = HotelRoomPagination
+    ordering_fields = ['room_number', 'room_type', 'price']
 
-    def update(self, request, *args, **kwargs):
-        partial = kwargs.pop('partial', False)
-        instance = self.get_object()
-        serializer = self.get_serializer(instance, data=request.data, partial=partial)
-        serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
-        return Response(serializer.data)
+    def get_queryset(self):
+        return HotelRoom.objects.filter(hotel_id=self.get_parent_asset().asset_number).annotate(
+            last_occupancy=SubAssetState.latest_data(HotelRoom, 'occupancy', 'hotel_id', 'room_number')
+        )
 
-    def destroy(self, request, *args, **kwargs):
-        instance = self.get_object()
-        self.perform_destroy(instance)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    def perform_create(self, serializer):
+        serializer.save(hotel=self.get_parent_asset())
 
 
-class VehicleViewSet(ModelViewSet):
+class VehicleViewSet(ParentAssetMixin, ModelViewSet):
     serializer_class = VehicleSerializer
     permission_classes = [IsAuthenticated]
     lookup_field = 'vehicle_number'
     lookup_url_kwarg = 'vehicle_number'
-
-    def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
-            return [IsAuthenticated(), IsAdmin()]
-        return [IsAuthenticated()]
+    parent_asset_type = 'vehicle'
+    parent_asset_error = "This asset is not a vehicle fleet."
+    # see assets/filters.py
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = VehicleFilter
+    pagination_class = VehiclePagination
+    ordering_fields = ['vehicle_number', 'vehicle_type', 'brand']
 
     def get_queryset(self):
-        asset_number = self.kwargs.get('asset_number')
-        asset = get_object_or_404(Asset, asset_number=asset_number)
-        if asset.asset_type != 'vehicle':
-            raise NotFound("This asset is not a vehicle fleet.")
-        return Vehicle.objects.filter(fleet__asset_number=asset_number)
-
-    def check_permissions(self, request):
-        super().check_permissions(request)
-        asset_number = self.kwargs.get('asset_number')
-        asset = get_object_or_404(Asset, asset_number=asset_number)
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
-            if not Role.objects.filter(user=request.user, asset__asset_number=asset_number, role='admin').exists():
-                raise PermissionDenied("You do not have admin permissions for this asset.")
+        return Vehicle.objects.filter(fleet_id=self.get_parent_asset().asset_number)
 
-    def create(self, request, *args, **kwargs):
-        asset_number = self.kwargs.get('asset_number')
-        asset = get_object_or_404(Asset, asset_number=asset_number)
-        if asset.asset_type != 'vehicle':
-            return Response({'error': 'This asset is not a vehicle fleet.'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        serializer.save(fleet=asset)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    def perform_create(self, serializer):
+        serializer.save(fleet=self.get_parent_asset())
 
-    def update(self, request, *args, **kwargs):
-        asset_number = self.kwargs.get('asset_number')
-        get_object_or_404(Asset, asset_number=asset_number)
-        partial = kwargs.pop('partial', False)
-        instance = self.get_object()
-        serializer = self.get_serializer(instance, data=request.data, partial=partial)
-        serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
-        return Response(serializer.data)
 
-    def destroy(self, request, *args, **kwargs):
-        asset_number = self.kwargs.get('asset_number')
-        get_object_or_404(Asset, asset_number=asset_number)
-        instance = self.get_object()
-        self.perform_destroy(instance)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+class TransactionHistoryPagination(KeysetPagination):
+    ordering = ('-timestamp', '-id')
 
 
 class TransactionHistoryView(APIView):
+    """
+    Transactions of an asset, newest first, in keyset pages (see utils.helpers.KeysetPagination):
+    `?limit=<n>` (default 100) and the X-Next-Cursor header passed back as `?cursor=`.
+
+    Filters: `status=<payment status>` (repeatable), `start_date` / `end_date` (a date, inclusive,
+    or a datetime) and `fields=name,amount,...` to only return some fields.
+    """
     permission_classes = [IsAuthenticated]
+    pagination_class = TransactionHistoryPagination
 
     def get(self, request, asset_number):
         # Get the asset
         asset = get_object_or_404(Asset, asset_number=asset_number)
 
         # Check if the user has permission to view this asset's transactions
-        if not request.user.roles.filter(asset=asset).exists():
+        if not role_resolver.has_role(request, asset.asset_number):
             return Response({"error": "You do not have permission to view transactions for this asset."},
                             status=status.HTTP_403_FORBIDDEN)
 
-        # Get all transactions for this asset
-        transactions = Transaction.objects.filter(asset=asset).order_by('-timestamp')
-
-        # Serialize the transactions
-        serializer = TransactionHistorySerializer(transactions, many=True)
-
-        return Response(serializer.data)
\ No newline at end of file
+        try:
+            transactions = self.filter_transactions(Transaction.objects.filter(asset=asset), request.query_params)
+            fields = self.get_fields(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if fields is not None:
+            sources = {TransactionHistorySerializer().fields[name].source for name in fields}
+            transactions = transactions.only('id', 'timestamp', *sources)
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(transactions, request, view=self)
+        serializer = TransactionHistorySerializer(page, many=True, fields=fields)
+
+        return paginator.get_paginated_response(serializer.data)
+
+    def filter_transactions(self, transactions, params):
+        statuses = [value for param in params.getlist('status') for value in param.split(',') if value]
+        if statuses:
+            unknown = set(statuses) - {choice for choice, _ in PAYMENT_STATUS_CHOICES}
+            if unknown:
+                raise ValueError(f"Unknown payment status: {', '.join(sorted(unknown))}")
+            transactions = transactions.filter(payment_status__in=statuses)
+
+        start, end = self.parse_bound(params, 'start_date'), self.parse_bound(params, 'end_date', end=True)
+        if start is not None:
+            transactions = transactions.filter(timestamp__gte=start)
+        if end is not None:
+            transactions = transactions.filter(timestamp__lt=end)
+        return transactions
+
+    def parse_bound(self, params, name, end=False):
+        """
+        A datetime, or the start of a date (of the next day for an inclusive end date).
+        """
+        value = params.get(name)
+        if not value:
+            return None
+        try:
+            day = parse_date(value)
+            if day is not None:
+                parsed = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+            else:
+                parsed = parse_datetime(value)
+                if parsed is None:
+                    raise ValueError
+        except ValueError:
+            raise ValueError(f"{name} must be a date (YYYY-MM-DD) or an ISO 8601 datetime.")
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def get_fields(self, params):
+        if 'fields' not in params:
+            return None
+        fields = [name for name in params['fields'].split(',') if name]
+        unknown = set(fields) - set(TransactionHistorySerializer.Meta.fields)
+        if not fields or unknown:
+            raise ValueError(f"fields must be a comma separated list of: {', '.join(TransactionHistorySerializer.Meta.fields)}")
+        return fields
@@ -15,4 +15,8 @@ EVENT_TYPE_CHOICES = [(event[0], event[1]) for event in conf['core']['event_type
 
 
 # ------------- views.py variables -----------------
-transfer_policy_config =  conf['core']['transfer_policy_config']
\ No newline at end of file
+transfer_policy_config =  conf['core']['transfer_policy_config']
+
+
+# ------------- management commands variables -----------------
+event_partitioning_config = conf['core']['event_partitioning']
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""
+Assets shared by the test modules: a hotel (ASSET002) and a vehicle fleet (ASSET001).
+"""
+from core.models import Asset
+
+
+def create_hotel(asset_number='ASSET002', **fields):
+    return Asset.objects.create(**{
+        'asset_number': asset_number,
+        'asset_type': 'hotel',
+        'asset_name': 'Test Hotel',
+        'location': 'Test Location',
+        'details': {'rooms': 50, 'stars': 4},
+        'account_number': '0987654321',
+        'bank': 'Test Bank',
+        **fields,
+    })
+
+
+def create_fleet(asset_number='ASSET001', **fields):
+    return Asset.objects.create(**{
+        'asset_number': asset_number,
+        'asset_type': 'vehicle',
+        'asset_name': 'Test Fleet',
+        'location': 'Test Location',
+        'details': {'make': 'Toyota'},
+        'account_number': '1234567890',
+        'bank': 'Test Bank',
+        **fields,
+    })
@@ -0,0 +1,95 @@
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from core.loadtest import benchmark_endpoints, clear_load_data, load_test_user, seed_load_data
+from core.models import *
+
+
+UNTIL = datetime(2024, 10, 15, 12, tzinfo=dt_timezone.utc)
+
+PROFILE = dict(
+    users=4, assets_per_user=3, rooms_per_hotel=4, vehicles_per_fleet=4, events=600, transactions=150, days=5,
+    seed=3, until=UNTIL,
+)
+
+
+class LoadDataTests(TestCase):
+    def snapshot(self):
+        return (
+            list(Asset.objects.order_by('asset_number').values_list('asset_number', 'asset_type', 'total_revenue')),
+            list(Role.objects.order_by('asset_id', 'user__email').values_list('asset_id', 'user__email', 'role')),
+            list(HotelRoom.objects.order_by('hotel_id', 'room_number').values_list('hotel_id', 'room_number', 'price', 'status')),
+            list(AssetEvent.objects.order_by('timestamp', 'id').values_list('asset_id', 'object_id', 'event_type', 'data', 'timestamp')),
+            list(Transaction.objects.order_by('transaction_ref').values_list('transaction_ref', 'asset_id', 'amount', 'payment_status')),
+        )
+
+    def test_same_options_give_the_same_dataset(self):
+        counts = seed_load_data(**PROFILE)
+        first = self.snapshot()
+        clear_load_data()
+        self.assertFalse(Asset.objects.exists())
+        self.assertFalse(AssetEvent.objects.exists())
+
+        self.assertEqual(seed_load_data(**PROFILE), counts)
+        self.assertEqual(self.snapshot(), first)
+
+        self.assertEqual(counts['events'], 600)
+        events = AssetEvent.objects.filter(timestamp__lte=UNTIL)
+        self.assertEqual(events.count(), 600)
+        # events belong to existing sub-assets of the right kind
+        self.assertFalse(events.filter(asset__asset_type='hotel', event_type__in=['location', 'ignition']).exists())
+        self.assertTrue(SubAssetState.objects.exists())
+        self.assertTrue(DailyAssetRollup.objects.exists())
+
+    def test_seeded_users_cannot_log_in(self):
+        seed_load_data(**PROFILE)
+        self.assertFalse(any(user.has_usable_password() for user in User.objects.all()))
+
+    def test_command_refuses_to_run_without_debug(self):
+        with self.assertRaisesMessage(CommandError, '--allow-non-debug'):
+            call_command('seed_load_data', users=1, events=0, transactions=0)
+        self.assertFalse(User.objects.exists())
+
+        call_command('seed_load_data', users=1, events=0, transactions=0, allow_non_debug=True, stdout=StringIO())
+        self.assertTrue(User.objects.exists())
+
+    def test_other_seed_gives_other_dataset(self):
+        seed_load_data(**PROFILE)
+        first = self.snapshot()
+        clear_load_data()
+        seed_load_data(**{**PROFILE, 'seed': 4})
+
+        self.assertNotEqual(self.snapshot(), first)
+
+
+class EndpointBenchmarkTests(TestCase):
+    def benchmark(self, **profile):
+        seed_load_data(**{**PROFILE, **profile})
+        results = benchmark_endpoints(load_test_user(), runs=2)
+        clear_load_data()
+        return results
+
+    def test_endpoints_respond(self):
+        results = self.benchmark()
+
+        self.assertEqual(
+            set(results),
+            {'asset_list', 'hotel_status', 'fleet_status', 'room_status', 'vehicle_status', 'index_stats',
+             'transaction_history', 'user_data'}
+        )
+        for name, result in results.items():
+            self.assertEqual(result['status'], 200, name)
+            self.assertLessEqual(result['min_ms'], result['p50_ms'])
+            self.assertLessEqual(result['p50_ms'], result['max_ms'])
+
+    def test_query_counts_do_not_grow_with_the_data(self):
+        # same users and assets (they are drawn first), more rooms, vehicles, events and transactions
+        small = self.benchmark()
+        large = self.benchmark(rooms_per_hotel=12, vehicles_per_fleet=12, events=3000, transactions=600)
+
+        for name in small:
+            self.assertEqual(large[name]['queries'], small[name]['queries'], name)
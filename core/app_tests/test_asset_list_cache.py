@@ -0,0 +1,99 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from ..models import *
+from .fixtures import create_fleet, create_hotel
+from assets.cache import bump_asset_version
+
+User = get_user_model()
+
+
+@override_settings(SHARED_CACHE=True)
+class AssetListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass', email='testuser@gmail.com')
+        self.other = User.objects.create_user(username='otheruser', password='testpass', email='otheruser@gmail.com')
+        self.client.force_authenticate(user=self.user)
+        self.hotel = create_hotel()
+        self.fleet = create_fleet()
+        Role.objects.create(user=self.user, asset=self.hotel, role='admin')
+        Role.objects.create(user=self.user, asset=self.fleet, role='viewer')
+        Role.objects.create(user=self.other, asset=self.hotel, role='manager')
+        for number in ['101', '102']:
+            HotelRoom.objects.create(hotel=self.hotel, room_number=number, room_type='Standard', price=100.00)
+        Vehicle.objects.create(fleet=self.fleet, vehicle_number='V001', brand='Toyota', vehicle_type='Sedan')
+
+    def get_assets(self):
+        response = self.client.get(reverse('asset-list'))
+        self.assertEqual(response.status_code, 200)
+        return {row['asset_number']: row for row in response.data}
+
+    def test_rows_are_built_in_one_query_and_then_cached(self):
+        with self.assertNumQueries(2):  # the user's roles, the annotated assets
+            assets = self.get_assets()
+
+        self.assertEqual(
+            {number: (row['user_role'], row['sub_asset_count']) for number, row in assets.items()},
+            {'ASSET002': ('admin', 2), 'ASSET001': ('viewer', 1)}
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_assets(), assets)
+
+    def test_writes_by_another_member_invalidate_the_list(self):
+        self.get_assets()
+
+        HotelRoom.objects.create(hotel=self.hotel, room_number='103', room_type='Suite', price=200.00)
+        self.assertEqual(self.get_assets()['ASSET002']['sub_asset_count'], 3)
+
+        Vehicle.objects.get(vehicle_number='V001').delete()
+        self.assertEqual(self.get_assets()['ASSET001']['sub_asset_count'], 0)
+
+        self.hotel.asset_name = 'Renamed Hotel'
+        self.hotel.save()
+        self.assertEqual(self.get_assets()['ASSET002']['asset_name'], 'Renamed Hotel')
+
+    def test_role_changes_invalidate_the_list(self):
+        self.get_assets()
+
+        Role.objects.filter(user=self.user, asset=self.fleet).get().delete()
+        self.assertEqual(set(self.get_assets()), {'ASSET002'})
+
+        role = Role.objects.get(user=self.user, asset=self.hotel)
+        role.role = 'viewer'
+        role.save()
+        self.assertEqual(self.get_assets()['ASSET002']['user_role'], 'viewer')
+
+    def test_created_asset_is_listed(self):
+        self.get_assets()
+        response = self.client.post(reverse('asset-list'), {
+            'asset_type': 'hotel', 'asset_name': 'New Hotel', 'location': 'Lagos', 'details': {},
+            'account_number': '1111111111', 'bank': 'Test Bank',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.get_assets()[response.data['asset_number']]['user_role'], 'admin')
+
+    def test_bumped_or_evicted_version_rebuilds_the_list(self):
+        self.get_assets()
+        Asset.objects.filter(asset_number='ASSET002').update(asset_name='Updated Hotel')
+        self.assertEqual(self.get_assets()['ASSET002']['asset_name'], 'Test Hotel')  # update() sends no signal
+
+        bump_asset_version('ASSET002')
+        self.assertEqual(self.get_assets()['ASSET002']['asset_name'], 'Updated Hotel')
+
+        Asset.objects.filter(asset_number='ASSET001').update(asset_name='Updated Fleet')
+        cache.delete('asset_version:ASSET001')
+        with self.assertNumQueries(1):  # the roles are still cached
+            self.assertEqual(self.get_assets()['ASSET001']['asset_name'], 'Updated Fleet')
+
+    @override_settings(SHARED_CACHE=False)
+    def test_list_is_not_cached_without_a_shared_cache(self):
+        self.get_assets()
+        Asset.objects.filter(asset_number='ASSET002').update(asset_name='Updated Hotel')  # e.g. by another process
+        with self.assertNumQueries(1):  # the annotated assets, no versions to check
+            self.assertEqual(self.get_assets()['ASSET002']['asset_name'], 'Updated Hotel')
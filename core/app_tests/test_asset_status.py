@@ -0,0 +1,106 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from ..models import *
+from .fixtures import create_fleet, create_hotel
+from ..rollups import rebuild_daily_rollups
+
+User = get_user_model()
+
+
+class CheckAssetStatusViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1', email='test1@gmail.com')
+        self.client.force_authenticate(user=self.user)
+
+        self.hotel = create_hotel()
+        self.fleet = create_fleet()
+        Role.objects.create(user=self.user, asset=self.hotel, role='viewer')
+        Role.objects.create(user=self.user, asset=self.fleet, role='viewer')
+
+        HotelRoom.objects.create(hotel=self.hotel, room_number='101', room_type='Standard', price=100.00, status=True)
+        HotelRoom.objects.create(hotel=self.hotel, room_number='102', room_type='Deluxe', price=250.00)
+        Vehicle.objects.create(fleet=self.fleet, vehicle_number='V001', brand='Toyota', vehicle_type='Sedan', status=True)
+        Vehicle.objects.create(fleet=self.fleet, vehicle_number='V002', brand='Honda', vehicle_type='SUV')
+
+        self.now = timezone.now()
+        room_type = ContentType.objects.get_for_model(HotelRoom)
+        vehicle_type = ContentType.objects.get_for_model(Vehicle)
+        AssetEvent.objects.bulk_create([
+            # today: both rooms occupied (101 twice), yesterday: only 102
+            AssetEvent(asset=self.hotel, content_type=room_type, object_id='101', event_type='occupancy', data='1', timestamp=self.now),
+            AssetEvent(asset=self.hotel, content_type=room_type, object_id='101', event_type='occupancy', data='1', timestamp=self.now),
+            AssetEvent(asset=self.hotel, content_type=room_type, object_id='102', event_type='occupancy', data='1', timestamp=self.now),
+            AssetEvent(asset=self.hotel, content_type=room_type, object_id='102', event_type='occupancy', data='1', timestamp=self.now - timedelta(days=1)),
+            AssetEvent(asset=self.hotel, content_type=room_type, object_id='101', event_type='occupancy', data='0', timestamp=self.now - timedelta(days=1)),
+            AssetEvent(asset=self.fleet, content_type=vehicle_type, object_id='V001', event_type='location', data='6.5,3.3', timestamp=self.now),
+            AssetEvent(asset=self.fleet, content_type=vehicle_type, object_id='V001', event_type='ignition', data='turn_on', timestamp=self.now),
+            AssetEvent(asset=self.fleet, content_type=vehicle_type, object_id='V002', event_type='ignition', data='turn_on', timestamp=self.now - timedelta(days=2)),
+        ])
+        # closed days are read from the daily rollups
+        today = timezone.localdate()
+        rebuild_daily_rollups(today - timedelta(days=offset) for offset in range(1, 4))
+
+    def get(self, asset_number, days):
+        return self.client.get(reverse('check-asset-status', kwargs={'asset_number': asset_number}), {'days': days})
+
+    def test_hotel_daily_stats(self):
+        response = self.get('ASSET002', 7)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.data['total_rooms'], response.data['total_active_rooms'], response.data['total_occupied_rooms']),
+            (2, 1, 2)
+        )
+        self.assertEqual(response.data['expected_yield'], Decimal('350.00'))
+
+        daily_stats = {day['date']: day for day in response.data['daily_stats']}
+        self.assertEqual(len(daily_stats), 8)
+        today = timezone.localdate()
+        self.assertEqual(daily_stats[today]['occupied_rooms'], 2)
+        self.assertEqual(daily_stats[today - timedelta(days=1)]['occupied_rooms'], 1)
+        self.assertEqual(daily_stats[today - timedelta(days=1)]['expected_yield'], Decimal('250.00'))
+        self.assertEqual(daily_stats[today - timedelta(days=2)]['occupied_rooms'], 0)
+        self.assertEqual(daily_stats[today - timedelta(days=2)]['active_rooms'], 1)
+
+    def test_vehicle_daily_stats(self):
+        response = self.get('ASSET001', 7)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.data['total_vehicles'], response.data['total_active_vehicles'], response.data['total_in_use_vehicles']),
+            (2, 1, 1)
+        )
+        daily_stats = {day['date']: day['vehicles_with_events'] for day in response.data['daily_stats']}
+        today = timezone.localdate()
+        self.assertEqual(daily_stats[today], 1)
+        self.assertEqual(daily_stats[today - timedelta(days=2)], 1)
+        self.assertEqual(sum(daily_stats.values()), 2)
+
+    def test_query_count_does_not_depend_on_days(self):
+        for asset_number in ['ASSET001', 'ASSET002']:
+            counts = []
+            for days in [1, 7, 90]:
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.get(asset_number, days)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['daily_stats']), days + 1)
+                counts.append(len(queries))
+            self.assertEqual(counts, [counts[0]] * 3)
+
+        with self.assertNumQueries(5) as queries:  # roles, asset, sub-assets, rollups, today's events
+            self.get('ASSET002', 90)
+        # one row per occupied room, not per occupancy event
+        [events] = [query['sql'] for query in queries.captured_queries if '"core_assetevent"' in query['sql']]
+        self.assertTrue(events.startswith('SELECT DISTINCT "core_assetevent"."object_id" FROM'))
+        self.assertNotIn('ORDER BY', events)
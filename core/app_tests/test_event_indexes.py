@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.test import TestCase
+from django.db import connection
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from ..models import *
+from core.management.commands.manage_event_partitions import TABLE
+
+
+class CreateEventIndexesTests(TestCase):
+    def index_tree(self, name):
+        # name -> (table, valid) of the index and of the indexes attached to it
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "WITH RECURSIVE tree AS (SELECT to_regclass(%s) AS oid "
+                "UNION ALL SELECT i.inhrelid FROM pg_inherits i JOIN tree t ON i.inhparent = t.oid) "
+                "SELECT c.relname, x.indrelid::regclass::text, x.indisvalid FROM tree t "
+                "JOIN pg_class c ON c.oid = t.oid JOIN pg_index x ON x.indexrelid = t.oid",
+                [name]
+            )
+            return {index: (table, valid) for index, table, valid in cursor.fetchall()}
+
+    def month_tables(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(%s)", [TABLE])
+            return [name for name, in cursor.fetchall()]
+
+    def test_builds_indexes_on_every_partition(self):
+        call_command('manage_event_partitions', convert=True, months_ahead=1, stdout=StringIO())
+        call_command('create_event_indexes', 'assetevent_occupied_idx', drop=True, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(self.index_tree('assetevent_occupied_idx'), {})
+
+        call_command('create_event_indexes', 'assetevent_occupied_idx', stdout=StringIO(), stderr=StringIO())
+
+        tree = self.index_tree('assetevent_occupied_idx')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*) FROM pg_inherits i JOIN pg_inherits l ON l.inhparent = i.inhrelid "
+                f"WHERE i.inhparent = to_regclass('{TABLE}')"
+            )
+            leaves, = cursor.fetchone()
+        # parent, every month, every event type of every month (the default partition is a leaf itself)
+        self.assertEqual(len(tree), 1 + (len(self.month_tables()) - 1) + leaves + 1)
+        self.assertTrue(all(valid for _, valid in tree.values()))
+        self.assertEqual(tree['assetevent_occupied_idx'][0], TABLE)
+
+        # nothing left to do on a second run
+        out = StringIO()
+        call_command('create_event_indexes', 'assetevent_occupied_idx', dry_run=True, stdout=out)
+        self.assertNotIn('CREATE INDEX', out.getvalue())
+
+    def test_dry_run_builds_concurrently(self):
+        call_command('create_event_indexes', 'assetevent_asset_ct_time_idx', drop=True, stdout=StringIO(), stderr=StringIO())
+        out = StringIO()
+        call_command('create_event_indexes', 'assetevent_asset_ct_time_idx', dry_run=True, stdout=out)
+
+        self.assertIn(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "assetevent_asset_ct_time_idx" ON "{TABLE}" '
+            '("asset_id", "content_type_id", "timestamp") INCLUDE ("object_id");',
+            out.getvalue()
+        )
+
+    def test_unknown_index(self):
+        with self.assertRaises(CommandError):
+            call_command('create_event_indexes', 'missing_idx', stdout=StringIO())
+
+
+class BenchEventQueriesTests(TestCase):
+    def test_seeds_events_and_writes_plans(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'plans.json')
+            call_command(
+                'bench_event_queries', seed_events=3000, assets=2, sub_assets=5, days=2, runs=1, output=output, stdout=StringIO()
+            )
+            with open(output) as f:
+                result = json.load(f)
+
+        self.assertEqual(result['events'], 3000)
+        self.assertEqual((result['hotel'], result['fleet']), ('BENCH-H0000', 'BENCH-F0000'))
+        self.assertEqual(HotelRoom.objects.filter(hotel_id='BENCH-H0001').count(), 5)
+        self.assertEqual(
+            set(result['queries']), {'hotel_occupied_today', 'vehicles_in_use_today', 'sub_asset_history', 'daily_activity'}
+        )
+        for query in result['queries'].values():
+            self.assertIn('Plan', query['plan'])
+            self.assertGreaterEqual(query['execution_ms'], 0)
+
+        # events only reference seeded sub-assets
+        self.assertFalse(AssetEvent.objects.filter(content_type__model='vehicle').exclude(object_id__in=[f'V{i}' for i in range(5)]).exists())
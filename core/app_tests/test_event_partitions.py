@@ -0,0 +1,108 @@
+from io import StringIO
+from unittest import mock
+
+from django.test import TestCase
+from django.db import connection
+from django.utils import timezone
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from ..models import *
+from .fixtures import create_fleet
+from core.management.commands.manage_event_partitions import TABLE, add_months, month_start, partition_name
+from hotel_demo.tasks import maintain_event_partitions
+
+
+RETENTION = {
+    'months_ahead': 2,
+    'expired_action': 'detach',
+    'retention_months': {'default': None, 'location': 3},
+}
+
+
+@mock.patch.dict('core.management.commands.manage_event_partitions.event_partitioning_config', RETENTION)
+class ManageEventPartitionsTests(TestCase):
+    def setUp(self):
+        self.asset = create_fleet()
+        self.vehicle = Vehicle.objects.create(fleet=self.asset, vehicle_number='V001', brand='Toyota', vehicle_type='Sedan')
+        self.content_type = ContentType.objects.get_for_model(Vehicle)
+        self.current_month = month_start(timezone.now())
+        self.old_month = add_months(self.current_month, -6)
+
+        for month in [self.old_month, self.current_month]:
+            for event_type in ['location', 'ignition']:
+                self.create_event(event_type, month.replace(day=2))
+
+    def create_event(self, event_type, timestamp):
+        return AssetEvent.objects.create(
+            asset=self.asset, content_type=self.content_type, object_id='V001',
+            event_type=event_type, data='on', timestamp=timestamp
+        )
+
+    def partitions(self, table=TABLE):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)",
+                [table]
+            )
+            return {name for name, in cursor.fetchall()}
+
+    def test_requires_convert_on_plain_table(self):
+        with self.assertRaises(CommandError):
+            call_command('manage_event_partitions', stdout=StringIO())
+
+    def test_beat_task_skips_plain_table(self):
+        with mock.patch('hotel_demo.tasks.call_command') as command:
+            maintain_event_partitions()
+        command.assert_not_called()
+
+        call_command('manage_event_partitions', convert=True, stdout=StringIO())
+        with mock.patch('hotel_demo.tasks.call_command') as command:
+            maintain_event_partitions()
+        command.assert_called_once_with('manage_event_partitions')
+
+    def test_convert_keeps_events_and_creates_future_months(self):
+        call_command('manage_event_partitions', convert=True, action='detach', stdout=StringIO())
+
+        months = [add_months(self.old_month, offset) for offset in range(6 + RETENTION['months_ahead'] + 1)]
+        self.assertEqual(self.partitions(), {partition_name(month) for month in months} | {f'{TABLE}_default'})
+        self.assertIn(f'{partition_name(self.current_month)}_location', self.partitions(partition_name(self.current_month)))
+
+        # the expired location partition of the old month was detached, ignition is kept forever
+        self.assertEqual(
+            set(AssetEvent.objects.values_list('event_type', 'timestamp')),
+            {('location', self.current_month.replace(day=2))} |
+            {('ignition', month.replace(day=2)) for month in [self.old_month, self.current_month]}
+        )
+
+        # new events get fresh ids and are routed to their partition
+        event = self.create_event('location', timezone.now())
+        self.assertGreater(event.pk, AssetEvent.objects.exclude(pk=event.pk).order_by('-pk').first().pk)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {partition_name(self.current_month)}_location")
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_new_month_takes_over_rows_from_default_partition(self):
+        call_command('manage_event_partitions', convert=True, months_ahead=0, stdout=StringIO())
+        next_month = add_months(self.current_month, 1)
+        self.create_event('ignition', next_month.replace(day=3))
+
+        call_command('manage_event_partitions', months_ahead=1, stdout=StringIO())
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {TABLE}_default")
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute(f"SELECT count(*) FROM {partition_name(next_month)}_ignition")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_drop_removes_whole_month_when_every_event_type_expired(self):
+        retention = {**RETENTION, 'retention_months': {'default': 3}}
+        with mock.patch.dict('core.management.commands.manage_event_partitions.event_partitioning_config', retention):
+            call_command('manage_event_partitions', convert=True, action='drop', stdout=StringIO())
+
+        self.assertNotIn(partition_name(self.old_month), self.partitions())
+        self.assertFalse(AssetEvent.objects.filter(timestamp__lt=self.current_month).exists())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", [partition_name(self.old_month)])
+            self.assertIsNone(cursor.fetchone()[0])
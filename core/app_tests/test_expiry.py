@@ -0,0 +1,198 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.utils import timezone
+from django.contrib.contenttypes.models import ContentType
+
+from ..models import *
+from .fixtures import create_fleet, create_hotel
+from ..expiry import cancel_expiry, claim_due_expiries, process_due_expiries, sweep_expired_sub_assets
+from mqtt_handler.publisher import PublishQueueFull
+
+
+class SubAssetExpiryTests(TestCase):
+    def setUp(self):
+        self.hotel = create_hotel()
+        self.fleet = create_fleet()
+        self.room = HotelRoom.objects.create(hotel=self.hotel, room_number='101', room_type='Standard', price=100.00, status=True)
+        self.vehicle = Vehicle.objects.create(fleet=self.fleet, vehicle_number='V001', brand='Toyota', vehicle_type='Sedan', status=True)
+        self.now = timezone.now()
+
+        patcher = mock.patch('mqtt_handler.ledger.get_publisher')
+        self.publisher = patcher.start().return_value
+        self.publisher.qos = 1
+        self.addCleanup(patcher.stop)
+
+    def expiry(self, sub_asset, action_type, data, expires_at):
+        # as left by the expiry sweep when the command could not be published
+        asset_id = sub_asset.hotel_id if isinstance(sub_asset, HotelRoom) else sub_asset.fleet_id
+        number = sub_asset.room_number if isinstance(sub_asset, HotelRoom) else sub_asset.vehicle_number
+        return SubAssetExpiry.objects.create(
+            asset_id=asset_id, content_type=ContentType.objects.get_for_model(sub_asset), object_id=number,
+            expires_at=expires_at, action_type=action_type, data=data,
+        )
+
+    def test_due_expiries_are_sent_once(self):
+        self.expiry(self.room, 'access', 'lock', self.now - timedelta(minutes=1))
+        self.expiry(self.vehicle, 'ignition', 'turn_off', self.now - timedelta(minutes=2))
+
+        self.assertEqual(process_due_expiries(self.now), 2)
+        self.assertEqual(process_due_expiries(self.now), 0)
+
+        self.assertEqual(
+            [call.args[:2] for call in self.publisher.publish.call_args_list],
+            [('vehicles/ASSET001/V001/ignition', 'turn_off'), ('rooms/ASSET002/101/access', 'lock')]
+        )
+        self.assertFalse(SubAssetExpiry.objects.exists())
+
+    def test_sub_asset_activated_again_is_not_sent_its_expiry(self):
+        self.expiry(self.room, 'access', 'lock', self.now - timedelta(minutes=1))
+        self.expiry(self.vehicle, 'ignition', 'turn_off', self.now - timedelta(minutes=1))
+        # paid for again after the sweep deactivated it
+        HotelRoom.objects.filter(pk=self.room.pk).update(expiry_timestamp=self.now + timedelta(days=1))
+
+        self.assertEqual(process_due_expiries(self.now), 1)
+
+        self.publisher.publish.assert_called_once_with('vehicles/ASSET001/V001/ignition', 'turn_off', retain=True, on_ack=mock.ANY)
+        self.assertFalse(SubAssetExpiry.objects.exists())
+        self.assertTrue(HotelRoom.objects.get(pk=self.room.pk).status)
+
+    def test_unpublished_expiries_are_kept_for_next_run(self):
+        self.expiry(self.room, 'access', 'lock', self.now - timedelta(minutes=2))
+        self.expiry(self.vehicle, 'ignition', 'turn_off', self.now - timedelta(minutes=1))
+        self.publisher.publish.side_effect = [mock.Mock(), PublishQueueFull('full')]
+
+        self.assertEqual(process_due_expiries(self.now), 1)
+
+        self.assertEqual(list(SubAssetExpiry.objects.values_list('object_id', flat=True)), ['V001'])
+
+    def test_claimed_expiry_is_kept_until_sent(self):
+        self.expiry(self.room, 'access', 'lock', self.now - timedelta(minutes=1))
+
+        # a worker claimed it and died before publishing
+        self.assertEqual(len(claim_due_expiries(self.now)), 1)
+        self.assertEqual(process_due_expiries(self.now + timedelta(seconds=10)), 0)
+
+        self.assertEqual(process_due_expiries(self.now + timedelta(seconds=settings.SUB_ASSET_EXPIRY_CLAIM_TIMEOUT + 1)), 1)
+        self.publisher.publish.assert_called_once()
+        self.assertFalse(SubAssetExpiry.objects.exists())
+
+    def test_rejected_expiry_is_dropped(self):
+        self.expiry(self.room, 'ignition', 'turn_off', self.now - timedelta(minutes=1))
+
+        self.assertEqual(process_due_expiries(self.now), 0)
+        self.assertFalse(SubAssetExpiry.objects.exists())
+
+    def test_cancel(self):
+        self.expiry(self.room, 'access', 'lock', self.now)
+
+        self.assertEqual(cancel_expiry(self.room), 1)
+        self.assertEqual(cancel_expiry(self.room), 0)
+
+
+class ExpirySweepTests(TestCase):
+    def setUp(self):
+        self.hotel = create_hotel()
+        self.fleet = create_fleet()
+        self.now = timezone.now()
+
+        patcher = mock.patch('mqtt_handler.ledger.get_publisher')
+        self.publisher = patcher.start().return_value
+        self.publisher.qos = 1
+        self.addCleanup(patcher.stop)
+
+    def rooms(self, count, start=100, expires_in=timedelta(minutes=-1), status=True):
+        return HotelRoom.objects.bulk_create([
+            HotelRoom(hotel=self.hotel, room_number=str(start + i), room_type='Standard', price=100.00,
+                      status=status, expiry_timestamp=self.now + expires_in)
+            for i in range(count)
+        ])
+
+    def test_expired_sub_assets_are_swept_in_bulk(self):
+        self.rooms(3)
+        self.rooms(1, start=200, expires_in=timedelta(hours=1))  # not due
+        self.rooms(1, start=300, status=False)  # already inactive
+        Vehicle.objects.create(fleet=self.fleet, vehicle_number='V001', brand='Toyota', vehicle_type='Sedan',
+                               status=True, expiry_timestamp=self.now - timedelta(days=2))  # missed while down
+
+        self.assertEqual(sweep_expired_sub_assets(self.now), 4)
+
+        self.assertEqual(
+            set(HotelRoom.objects.filter(status=True).values_list('room_number', flat=True)), {'200'}
+        )
+        self.assertFalse(Vehicle.objects.get().status)
+        self.assertEqual(
+            sorted(call.args[:2] for call in self.publisher.publish.call_args_list),
+            [('rooms/ASSET002/100/access', 'lock'), ('rooms/ASSET002/101/access', 'lock'),
+             ('rooms/ASSET002/102/access', 'lock'), ('vehicles/ASSET001/V001/ignition', 'turn_off')]
+        )
+        self.assertEqual(AssetEvent.objects.count(), 4)
+        self.assertEqual(ControlCommand.objects.count(), 4)
+        self.assertEqual(SubAssetState.objects.get(object_id='V001').data, 'turn_off')
+        # every command was published, nothing is left to retry
+        self.assertFalse(SubAssetExpiry.objects.exists())
+
+        self.assertEqual(sweep_expired_sub_assets(self.now), 0)
+
+    def test_query_count_does_not_depend_on_expired_count(self):
+        self.rooms(2)
+        with CaptureQueriesContext(connection) as small:
+            sweep_expired_sub_assets(self.now)
+        self.rooms(20, start=500)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(sweep_expired_sub_assets(self.now), 20)
+
+        self.assertEqual(len(small), len(large))
+
+    def test_commands_lost_after_deactivation_are_sent_by_scheduled_expiries(self):
+        self.rooms(2)
+        with mock.patch('core.expiry.ledger.send_many', side_effect=SystemExit):  # the worker dies
+            with self.assertRaises(SystemExit):
+                sweep_expired_sub_assets(self.now)
+
+        self.assertFalse(HotelRoom.objects.filter(status=True).exists())
+        self.assertEqual(process_due_expiries(self.now), 0)  # still claimed by the dead worker
+
+        later = self.now + timedelta(seconds=settings.SUB_ASSET_EXPIRY_CLAIM_TIMEOUT + 1)
+        self.assertEqual(process_due_expiries(later), 2)
+        self.assertEqual(
+            sorted(call.args[:2] for call in self.publisher.publish.call_args_list),
+            [('rooms/ASSET002/100/access', 'lock'), ('rooms/ASSET002/101/access', 'lock')]
+        )
+        self.assertFalse(SubAssetExpiry.objects.exists())
+
+    def test_claims_of_same_numbers_in_other_hotels_are_kept_apart(self):
+        self.rooms(2)
+        other = create_hotel('ASSET003', asset_name='Other Hotel')
+        HotelRoom.objects.bulk_create([
+            HotelRoom(hotel=other, room_number=number, room_type='Standard', price=100.00,
+                      status=True, expiry_timestamp=self.now - timedelta(minutes=1))
+            for number in ['100', '101']
+        ])
+        self.publisher.publish.side_effect = [mock.Mock(), mock.Mock(), PublishQueueFull('full'), PublishQueueFull('full')]
+
+        self.assertEqual(sweep_expired_sub_assets(self.now), 4)
+
+        dropped = set(ControlCommand.objects.filter(dropped=True).values_list('asset_id', 'sub_asset_id'))
+        self.assertEqual(len(dropped), 2)
+        self.assertEqual(set(SubAssetExpiry.objects.values_list('asset_id', 'object_id')), dropped)
+        self.assertFalse(SubAssetExpiry.objects.filter(claimed_at__isnull=False).exists())
+
+    def test_unpublished_commands_are_retried_by_scheduled_expiries(self):
+        self.rooms(3)
+        self.publisher.publish.side_effect = [mock.Mock(), PublishQueueFull('full'), PublishQueueFull('full')]
+
+        self.assertEqual(sweep_expired_sub_assets(self.now), 3)
+
+        self.assertFalse(HotelRoom.objects.filter(status=True).exists())
+        self.assertEqual(AssetEvent.objects.count(), 1)
+        self.assertEqual(ControlCommand.objects.filter(dropped=True).count(), 2)
+        self.assertEqual(SubAssetExpiry.objects.count(), 2)
+
+        self.publisher.publish.side_effect = None
+        self.assertEqual(process_due_expiries(self.now), 2)
+        self.assertEqual(AssetEvent.objects.count(), 3)
@@ -0,0 +1,99 @@
+import time
+from unittest import mock
+
+from django.test import TestCase, RequestFactory, override_settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from rest_framework import exceptions
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ..identity import SystemIdentity, system_identity, is_system_user
+from ..permissions import SystemUserAuthentication
+
+User = get_user_model()
+
+
+@override_settings(SHARED_CACHE=True)
+class SystemIdentityTests(TestCase):
+    def setUp(self):
+        self.system_user = User.objects.create_user(username='info@trykey.com', password='password1', email='info@trykey.com')
+        self.user = User.objects.create_user(username='user1', password='password1', email='test1@gmail.com')
+        self.identity = SystemIdentity(token_lifetime=120, refresh_margin=30)
+        self.identity.invalidate()
+        self.addCleanup(cache.clear)
+
+    def test_is_system_user_needs_no_query(self):
+        with self.assertNumQueries(0):
+            self.assertTrue(is_system_user(self.system_user))
+            self.assertFalse(is_system_user(self.user))
+            self.assertFalse(is_system_user(None))
+
+    def test_user_is_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.identity.get_user(), self.system_user)
+            self.assertEqual(self.identity.get_user(), self.system_user)
+
+    def test_token_is_reused_until_close_to_expiry(self):
+        token = self.identity.get_token()
+        self.assertEqual(AccessToken(token)['user_id'], self.system_user.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.identity.get_token(), token)
+
+        # a second process picks the token up from the shared cache
+        other = SystemIdentity(token_lifetime=120, refresh_margin=30)
+        with self.assertNumQueries(0):
+            self.assertEqual(other.get_token(), token)
+
+        # re-signed once less than refresh_margin seconds are left
+        with mock.patch('core.identity.time.time', return_value=time.time() + 100):
+            self.assertNotEqual(self.identity.get_token(), token)
+
+    def test_saving_the_system_user_invalidates_the_cache(self):
+        system_identity.get_user()
+        self.system_user.first_name = 'System'
+        self.system_user.save()
+
+        self.assertEqual(system_identity.get_user().first_name, 'System')
+
+    def test_change_in_another_process_reloads_the_user(self):
+        self.identity.get_user()
+        token = self.identity.get_token()
+
+        # the receivers of the other process invalidate its own instance only
+        User.objects.filter(pk=self.system_user.pk).update(is_active=False)
+        SystemIdentity().invalidate()
+
+        self.assertFalse(self.identity.get_user().is_active)
+        self.assertNotEqual(self.identity.get_token(), token)
+
+    def test_evicted_version_reloads_the_user(self):
+        self.identity.get_user()
+        User.objects.filter(pk=self.system_user.pk).update(first_name='System')
+        cache.clear()
+
+        self.assertEqual(self.identity.get_user().first_name, 'System')
+
+    @override_settings(SHARED_CACHE=False)
+    def test_user_is_read_on_every_call_without_shared_cache(self):
+        with self.assertNumQueries(2):
+            self.identity.get_user()
+            self.identity.get_user()
+
+    def test_inactive_system_user_cannot_authenticate(self):
+        self.system_user.is_active = False
+        self.system_user.save()
+        request = RequestFactory().get('/', HTTP_X_SYSTEM_TOKEN='system-secret')
+
+        with mock.patch('core.permissions.os.getenv', return_value='system-secret'):
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                SystemUserAuthentication().authenticate(request)
+
+    def test_system_token_authentication_uses_cached_user(self):
+        system_identity.get_user()
+        request = RequestFactory().get('/', HTTP_X_SYSTEM_TOKEN='system-secret')
+
+        with mock.patch('core.permissions.os.getenv', return_value='system-secret'), self.assertNumQueries(0):
+            user, _ = SystemUserAuthentication().authenticate(request)
+
+        self.assertEqual(user, self.system_user)
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import threading
+
+import paho.mqtt.client as mqtt
+from django.test import SimpleTestCase, TransactionTestCase
+
+from ..models import *
+from .fixtures import create_fleet, create_hotel
+from mqtt_handler.bench import read_stream, run_benchmark, synthetic_stream, write_stream
+from mqtt_handler.localbroker import LocalBroker
+
+
+class LocalBrokerTests(SimpleTestCase):
+    def setUp(self):
+        self.broker = LocalBroker().start()
+        self.addCleanup(self.broker.stop)
+
+    def connect(self, topics=(), qos=0):
+        received, subscribed = [], threading.Event()
+        client = mqtt.Client()
+        client.on_message = lambda client, userdata, message: received.append(
+            (message.topic, message.payload, message.qos, message.retain)
+        )
+        client.on_subscribe = lambda *args: subscribed.set()
+        client.connect(self.broker.host, self.broker.port)
+        client.loop_start()
+        self.addCleanup(client.loop_stop)
+        self.addCleanup(client.disconnect)
+        if topics:
+            client.subscribe([(topic, qos) for topic in topics])
+            self.assertTrue(subscribed.wait(5))
+        return client, received
+
+    def wait_for(self, condition):
+        event = threading.Event()
+        for _ in range(500):
+            if condition():
+                return
+            event.wait(0.01)
+        self.fail("Timed out")
+
+    def test_delivers_to_matching_subscriptions(self):
+        _, rooms = self.connect(['rooms/+/+/occupancy'])
+        _, everything = self.connect(['#'])
+        publisher, _ = self.connect()
+
+        publisher.publish('rooms/ASSET002/101/occupancy', b'1')
+        publisher.publish('vehicles/ASSET001/V001/ignition', b'turn_on')
+
+        self.wait_for(lambda: len(everything) == 2)
+        self.assertEqual(rooms, [('rooms/ASSET002/101/occupancy', b'1', 0, False)])
+        self.assertEqual(self.broker.stats()['delivered'], 3)
+
+    def test_retained_message_is_sent_on_subscribe(self):
+        publisher, _ = self.connect()
+        publisher.publish('rooms/ASSET002/101/access', b'lock', qos=1, retain=True).wait_for_publish(5)
+
+        _, received = self.connect(['rooms/#'], qos=1)
+
+        self.wait_for(lambda: received)
+        self.assertEqual(received, [('rooms/ASSET002/101/access', b'lock', 1, True)])
+        self.assertEqual(self.broker.stats()['retained'], 1)
+
+    def test_qos_1_publish_is_acknowledged(self):
+        publisher, _ = self.connect()
+        info = publisher.publish('vehicles/ASSET001/V001/location', b'6.5,3.4', qos=1)
+
+        info.wait_for_publish(5)
+        self.assertTrue(info.is_published())
+        self.assertEqual(self.broker.stats()['received'], 1)
+
+
+class IngestBenchmarkTests(TransactionTestCase):
+    def setUp(self):
+        self.hotel = create_hotel()
+        self.fleet = create_fleet()
+        for number in ['101', '102']:
+            HotelRoom.objects.create(hotel=self.hotel, room_number=number, room_type='Standard', price=100.00)
+        for number in ['V001', 'V002']:
+            Vehicle.objects.create(fleet=self.fleet, vehicle_number=number, brand='Toyota', vehicle_type='Sedan')
+
+    def test_synthetic_stream_is_deterministic(self):
+        stream = synthetic_stream(200, unknown_share=0.1, seed=1)
+
+        self.assertEqual(synthetic_stream(200, unknown_share=0.1, seed=1), stream)
+        self.assertNotEqual(synthetic_stream(200, unknown_share=0.1, seed=2), stream)
+        topics = {topic.rsplit('/', 1)[0] for topic, _ in stream}
+        self.assertTrue({'rooms/ASSET002/101', 'rooms/ASSET002/102', 'vehicles/ASSET001/V001', 'vehicles/ASSET001/V002'} <= topics)
+        self.assertTrue(any(topic.startswith('vehicles/UNKNOWN/') for topic in topics))
+
+    def test_stream_file_roundtrip(self):
+        stream = synthetic_stream(50)
+        path = os.path.join(tempfile.mkdtemp(), 'stream.txt')
+        write_stream(stream, path)
+
+        self.assertEqual(read_stream(path), stream)
+
+    def test_replay_writes_every_event(self):
+        stream = synthetic_stream(300, unknown_share=0.1) + [('machines/ASSET001/M1/power', b'on')]
+        known = sum(1 for topic, _ in stream if '/UNKNOWN/' not in topic and not topic.startswith('machines/'))
+
+        for mode in ['direct', 'broker']:
+            with self.subTest(mode=mode):
+                before = AssetEvent.objects.count()
+                result = run_benchmark(stream, mode, workers=2, timeout=30)
+
+                self.assertTrue(result['complete'])
+                self.assertEqual(result['handled'], len(stream) - 1)  # the unsupported topic never reaches the workers
+                self.assertEqual((result['dropped'], result['failed']), (0, 0))
+                self.assertEqual(result['events_written'], known)
+                self.assertEqual(AssetEvent.objects.count() - before, known)
+                self.assertGreater(result['messages_per_sec'], 0)
+                self.assertIsNotNone(result['latency']['handling']['p99_ms'])
+                # resolutions are cached, and events are written in batches
+                self.assertLess(result['queries_per_message'], 1)
+                if mode == 'broker':
+                    self.assertEqual(result['broker']['received'], len(stream))
@@ -0,0 +1,243 @@
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from geopy.distance import geodesic
+from django.test import TestCase, SimpleTestCase
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+
+from ..models import *
+from .fixtures import create_fleet, create_hotel
+from mqtt_handler.buffer import EventBuffer
+from mqtt_handler.resolver import SubAssetResolver, resolver
+from mqtt_handler.workers import IngestWorkerPool
+from mqtt_handler.location import LocationAccumulator
+from mqtt_handler.management.commands.mqtt_subscriber import MQTTSubscriber
+import mqtt_handler.signals  # connects the resolver invalidation receivers (mqtt_handler is not installed in tests)
+
+User = get_user_model()
+
+
+class EventBufferTests(TestCase):
+    def setUp(self):
+        self.asset = create_hotel()
+        self.room = HotelRoom.objects.create(hotel=self.asset, room_number='101', room_type='Standard', price=100.00)
+        self.content_type = ContentType.objects.get_for_model(HotelRoom)
+
+    def make_event(self, data='1'):
+        return AssetEvent(
+            asset=self.asset,
+            content_type=self.content_type,
+            object_id=self.room.room_number,
+            event_type='occupancy',
+            data=data
+        )
+
+    def test_flush_writes_pending_events_in_one_batch(self):
+        buffer = EventBuffer(max_size=10, flush_size=5)
+        for data in ['1', '0', '1']:
+            self.assertTrue(buffer.add(self.make_event(data)))
+
+        self.assertEqual(AssetEvent.objects.count(), 0)
+        with self.assertNumQueries(4):  # savepoint, events, latest state, release
+            self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(AssetEvent.objects.count(), 3)
+        state = SubAssetState.objects.get()
+        self.assertEqual((state.asset_id, state.object_id, state.event_type, state.data), ('ASSET002', '101', 'occupancy', '1'))
+        self.assertEqual(state.timestamp, AssetEvent.objects.first().timestamp)
+        stats = buffer.stats()
+        self.assertEqual((stats['pending'], stats['buffered'], stats['flushed'], stats['dropped']), (0, 3, 3, 0))
+        self.assertEqual(stats['flush_latency']['count'], 1)
+
+    def test_full_buffer_drops_events(self):
+        buffer = EventBuffer(max_size=2, flush_size=2, block_timeout=0)
+        self.assertTrue(buffer.add(self.make_event()))
+        self.assertTrue(buffer.add(self.make_event()))
+        self.assertFalse(buffer.add(self.make_event()))
+
+        self.assertEqual(buffer.stats()['dropped'], 1)
+        self.assertEqual(buffer.pending, 2)
+
+    def test_close_flushes_and_rejects_new_events(self):
+        buffer = EventBuffer(max_size=10, flush_size=5, flush_interval=60).start()
+        buffer.add(self.make_event('0'))
+        buffer.close(timeout=5)
+
+        self.assertEqual(AssetEvent.objects.filter(data='0').count(), 1)
+        self.assertFalse(buffer.add(self.make_event()))
+        self.assertEqual(buffer.stats()['dropped'], 1)
+
+    def test_flush_size_cannot_exceed_max_size(self):
+        with self.assertRaises(ValueError):
+            EventBuffer(max_size=5, flush_size=10)
+
+
+class SubAssetResolverTests(TestCase):
+    def setUp(self):
+        self.asset = create_fleet()
+        self.vehicle = Vehicle.objects.create(fleet=self.asset, vehicle_number='V001', brand='Toyota', vehicle_type='Sedan')
+        resolver.clear()
+
+    def test_cached_resolution_needs_no_queries(self):
+        resolved = resolver.resolve('vehicles', 'ASSET001', 'V001')
+        self.assertEqual(resolved.sub_asset_id, self.vehicle.pk)
+        self.assertEqual(resolved.content_type_id, ContentType.objects.get_for_model(Vehicle).id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.resolve('vehicles', 'ASSET001', 'V001'), resolved)
+
+    def test_unknown_sub_asset_is_cached(self):
+        self.assertIsNone(resolver.resolve('vehicles', 'ASSET001', 'V999'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(resolver.resolve('vehicles', 'ASSET001', 'V999'))
+
+    def test_save_and_delete_invalidate_entries(self):
+        self.assertIsNone(resolver.resolve('vehicles', 'ASSET001', 'V002'))
+        vehicle = Vehicle.objects.create(fleet=self.asset, vehicle_number='V002', brand='Honda', vehicle_type='SUV')
+        self.assertEqual(resolver.resolve('vehicles', 'ASSET001', 'V002').sub_asset_id, vehicle.pk)
+
+        vehicle.vehicle_number = 'V003'
+        vehicle.save()
+        self.assertIsNone(resolver.resolve('vehicles', 'ASSET001', 'V002'))
+
+        vehicle.delete()
+        self.assertIsNone(resolver.resolve('vehicles', 'ASSET001', 'V003'))
+
+    def test_lru_eviction(self):
+        small = SubAssetResolver(max_entries=1)
+        small.resolve('vehicles', 'ASSET001', 'V001')
+        small.resolve('vehicles', 'ASSET001', 'V999')
+        self.assertEqual(small.stats()['entries'], 1)
+        with self.assertNumQueries(1):
+            small.resolve('vehicles', 'ASSET001', 'V001')
+
+    def test_unsupported_asset_type(self):
+        with self.assertRaises(ValueError):
+            resolver.resolve('machines', 'ASSET001', 'V001')
+
+
+class IngestWorkerPoolTests(SimpleTestCase):
+    def test_messages_from_one_device_keep_their_order(self):
+        handled = []
+        pool = IngestWorkerPool(lambda key, seq: handled.append((key, seq)), workers=4, queue_size=100).start()
+        for seq in range(50):
+            for device in ('V001', 'V002', 'V003'):
+                pool.submit(('ASSET001', device), device, seq)
+        pool.stop(timeout=5)
+
+        for device in ('V001', 'V002', 'V003'):
+            self.assertEqual([seq for key, seq in handled if key == device], list(range(50)))
+        stats = pool.stats()
+        self.assertEqual((stats['submitted'], stats['dropped'], stats['queue_depth']), (150, 0, 0))
+        self.assertEqual(stats['latency']['handling']['count'], 150)
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        release = threading.Event()
+        pool = IngestWorkerPool(lambda: release.wait(5), workers=1, queue_size=1, put_timeout=0).start()
+        results = [pool.submit(('ASSET001', 'V001')) for _ in range(5)]
+        release.set()
+        pool.stop(timeout=5)
+
+        self.assertFalse(all(results))
+        self.assertEqual(pool.stats()['dropped'], results.count(False))
+
+    def test_failing_handler_is_counted(self):
+        def handler():
+            raise RuntimeError("boom")
+
+        pool = IngestWorkerPool(handler, workers=1).start()
+        pool.submit(('ASSET001', 'V001'))
+        pool.stop(timeout=5)
+        self.assertEqual(pool.stats()['failed'], 1)
+
+    def test_subscriber_failures_are_counted_by_the_pool(self):
+        resolver = mock.Mock()
+        resolver.resolve.side_effect = RuntimeError("database is gone")
+        subscriber = MQTTSubscriber('broker.test', 1883, [], buffer=mock.Mock(), resolver=resolver)
+        subscriber.workers.start()
+
+        subscriber.workers.submit(('ASSET001', 'V001'), 'vehicles/ASSET001/V001/ignition', b'turn_on', None)
+        subscriber.workers.submit(('ASSET001', 'V001'), 'machines/ASSET001/V001/ignition', b'turn_on', None)  # ignored
+        subscriber.workers.stop(timeout=5)
+
+        self.assertEqual(subscriber.workers.stats()['failed'], 1)
+
+    def test_stop_gives_up_on_a_stuck_worker(self):
+        release = threading.Event()
+        pool = IngestWorkerPool(lambda: release.wait(5), workers=1, queue_size=1, put_timeout=0).start()
+        pool.submit(('ASSET001', 'V001'))
+        pool.submit(('ASSET001', 'V001'))  # fills the queue while the first one is handled
+
+        started = time.monotonic()
+        pool.stop(timeout=0.2)
+        self.assertLess(time.monotonic() - started, 2)
+        release.set()
+
+
+class LocationAccumulatorTests(TestCase):
+    def setUp(self):
+        self.asset = create_fleet()
+        self.vehicle = Vehicle.objects.create(
+            fleet=self.asset,
+            vehicle_number='V001',
+            brand='Toyota',
+            vehicle_type='Sedan',
+            last_latitude=6.5244,
+            last_longitude=3.3792,
+            total_distance=10.0
+        )
+
+    def test_fixes_are_integrated_and_flushed_once(self):
+        accumulator = LocationAccumulator()
+        accumulator.add(self.vehicle.pk, 6.5300, 3.3792)
+        accumulator.add(self.vehicle.pk, 6.5400, 3.3792)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(accumulator.flush(), 1)
+        self.assertEqual(accumulator.flush(), 0)
+
+        self.vehicle.refresh_from_db()
+        self.assertEqual((self.vehicle.last_latitude, self.vehicle.last_longitude), (6.5400, 3.3792))
+        expected = geodesic((6.5244, 3.3792), (6.5400, 3.3792)).kilometers
+        self.assertAlmostEqual(self.vehicle.total_distance, 10.0 + expected, places=4)
+
+    def test_new_process_resumes_from_persisted_position(self):
+        accumulator = LocationAccumulator()
+        accumulator.add(self.vehicle.pk, 6.5300, 3.3792)
+        accumulator.close()
+
+        restarted = LocationAccumulator()
+        restarted.add(self.vehicle.pk, 6.5400, 3.3792)
+        restarted.close()
+
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.last_latitude, 6.5400)
+        expected = geodesic((6.5244, 3.3792), (6.5400, 3.3792)).kilometers
+        self.assertAlmostEqual(self.vehicle.total_distance, 10.0 + expected, places=4)
+
+    def test_flush_does_not_overwrite_concurrent_distance_updates(self):
+        accumulator = LocationAccumulator()
+        accumulator.add(self.vehicle.pk, 6.5300, 3.3792)
+        Vehicle.objects.filter(pk=self.vehicle.pk).update(total_distance=20.0)
+        accumulator.flush()
+
+        self.vehicle.refresh_from_db()
+        expected = geodesic((6.5244, 3.3792), (6.5300, 3.3792)).kilometers
+        self.assertAlmostEqual(self.vehicle.total_distance, 20.0 + expected, places=4)
+
+    def test_backfill_recomputes_distance_from_location_events(self):
+        content_type = ContentType.objects.get_for_model(Vehicle)
+        for data in ['6.5244,3.3792', 'garbage', '6.5300,3.3792', '6.5400,3.3792']:
+            AssetEvent.objects.create(
+                asset=self.asset, content_type=content_type, object_id='V001', event_type='location', data=data
+            )
+
+        call_command('backfill_vehicle_distance', chunk_size=2, stdout=StringIO())
+
+        self.vehicle.refresh_from_db()
+        self.assertEqual((self.vehicle.last_latitude, self.vehicle.last_longitude), (6.5400, 3.3792))
+        expected = geodesic((6.5244, 3.3792), (6.5400, 3.3792)).kilometers
+        self.assertAlmostEqual(self.vehicle.total_distance, expected, places=4)
@@ -0,0 +1,244 @@
+from datetime import timedelta
+from unittest import mock
+
+import paho.mqtt.client as mqtt
+from django.test import TestCase, SimpleTestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from ..models import *
+from .fixtures import create_fleet, create_hotel
+from hotel_demo.tasks import schedule_sub_asset_expiry, send_control_request
+from mqtt_handler.ledger import CommandLedger, command_latency
+from mqtt_handler.management.commands.mqtt_subscriber import MQTTSubscriber
+from mqtt_handler.publisher import MQTTPublisher, PublishQueueFull
+
+User = get_user_model()
+
+
+class MQTTPublisherTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('mqtt_handler.publisher.mqtt.Client')
+        self.client_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = self.client_class.return_value
+        self.client.publish.return_value = mqtt.MQTTMessageInfo(1)
+
+    def test_connects_once_in_the_background(self):
+        publisher = MQTTPublisher('broker.test', 1883, queue_size=5)
+
+        publisher.publish('rooms/ASSET002/101/access', 'unlock')
+        publisher.publish('rooms/ASSET002/101/access', 'lock', qos=0, retain=False)
+
+        self.client_class.assert_called_once_with()
+        self.client.connect_async.assert_called_once_with('broker.test', 1883, 60)
+        self.client.connect.assert_not_called()
+        self.client.loop_start.assert_called_once_with()
+        self.client.max_queued_messages_set.assert_called_once_with(5)
+        self.client.publish.assert_has_calls([
+            mock.call('rooms/ASSET002/101/access', 'unlock', qos=1, retain=True),
+            mock.call('rooms/ASSET002/101/access', 'lock', qos=0, retain=False),
+        ])
+        self.assertEqual(publisher.stats()['published'], 2)
+
+    def test_full_queue_raises(self):
+        info = mqtt.MQTTMessageInfo(2)
+        info.rc = mqtt.MQTT_ERR_QUEUE_SIZE
+        self.client.publish.return_value = info
+        publisher = MQTTPublisher('broker.test')
+
+        with self.assertRaises(PublishQueueFull):
+            publisher.publish('vehicles/ASSET001/V001/ignition', 'turn_off')
+        self.assertEqual((publisher.published, publisher.dropped), (0, 1))
+
+    def test_connection_state_follows_callbacks(self):
+        publisher = MQTTPublisher('broker.test').start()
+        self.assertFalse(publisher.connected)
+
+        publisher.on_connect(self.client, None, {}, 0)
+        self.assertTrue(publisher.connected)
+        publisher.on_disconnect(self.client, None, 7)
+        self.assertFalse(publisher.connected)
+        publisher.on_connect(self.client, None, {}, 0)
+        self.assertEqual((publisher.connects, publisher.disconnects), (2, 1))
+
+        publisher.stop()
+        self.client.disconnect.assert_called_once_with()
+        self.client.loop_stop.assert_called_once_with()
+
+    def test_ack_callbacks_by_message_id(self):
+        publisher = MQTTPublisher('broker.test')
+        acks = []
+
+        publisher.publish('rooms/ASSET002/101/access', 'unlock', on_ack=lambda acked_at: acks.append(('first', acked_at)))
+        self.assertEqual(acks, [])
+        publisher.on_publish(self.client, None, 1)
+        self.assertEqual([name for name, _ in acks], ['first'])
+
+        # the PUBACK can beat publish() back to the caller
+        publisher.on_publish(self.client, None, 2)
+        self.client.publish.return_value = mqtt.MQTTMessageInfo(2)
+        publisher.publish('rooms/ASSET002/101/access', 'lock', on_ack=lambda acked_at: acks.append(('second', acked_at)))
+        self.assertEqual([name for name, _ in acks], ['first', 'second'])
+        self.assertEqual(publisher.stats()['awaiting_ack'], 0)
+
+
+class ControlAssetViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1', email='test1@gmail.com')
+        self.client.force_authenticate(user=self.user)
+        self.hotel = create_hotel()
+        Role.objects.create(user=self.user, asset=self.hotel, role='admin')
+        HotelRoom.objects.create(hotel=self.hotel, room_number='101', room_type='Standard', price=100.00)
+
+        patcher = mock.patch('mqtt_handler.ledger.get_publisher')
+        self.publisher = patcher.start().return_value
+        self.publisher.qos = 1
+        self.addCleanup(patcher.stop)
+        self.url = reverse('control_asset', kwargs={'asset_number': 'ASSET002', 'sub_asset_id': '101'})
+
+    def test_command_is_published_through_shared_publisher(self):
+        response = self.client.post(self.url, {'action_type': 'access', 'data': 'unlock'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.publisher.publish.assert_called_once_with('rooms/ASSET002/101/access', 'unlock', retain=True, on_ack=mock.ANY)
+        self.assertEqual(SubAssetState.objects.get(event_type='access').data, 'unlock')
+        command = ControlCommand.objects.get()
+        self.assertEqual(str(command.correlation_id), response.data['command_id'])
+        self.assertEqual((command.topic, command.user), ('rooms/ASSET002/101/access', self.user))
+
+    def test_full_publish_queue_returns_503(self):
+        self.publisher.publish.side_effect = PublishQueueFull('full')
+
+        response = self.client.post(self.url, {'action_type': 'access', 'data': 'unlock'}, format='json')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(AssetEvent.objects.exists())
+        self.assertTrue(ControlCommand.objects.get().dropped)
+
+
+class CommandLedgerTests(TestCase):
+    def setUp(self):
+        self.hotel = create_hotel()
+        self.room = HotelRoom.objects.create(hotel=self.hotel, room_number='101', room_type='Standard', price=100.00)
+        self.publisher = mock.Mock(qos=1)
+        self.ledger = CommandLedger(publisher=self.publisher, flush_interval=3600)
+        self.ledger._thread = mock.Mock()  # flushed explicitly below
+
+    def send(self, payload='unlock'):
+        return self.ledger.send(self.hotel, '101', 'access', 'rooms/ASSET002/101/access', payload)
+
+    def test_broker_ack_is_written_on_flush(self):
+        command = self.send()
+        on_ack = self.publisher.publish.call_args.kwargs['on_ack']
+        acked_at = command.published_at + timedelta(milliseconds=40)
+
+        on_ack(acked_at)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.ledger.flush(), 1)
+
+        command.refresh_from_db()
+        self.assertEqual(command.ack_latency, timedelta(milliseconds=40))
+
+    def test_device_state_confirms_oldest_matching_command(self):
+        first, second = self.send(), self.send()
+        self.send('lock')
+
+        with self.assertNumQueries(1):
+            self.assertTrue(self.ledger.confirm('ASSET002', '101', 'access', 'unlock', timezone.now()))
+        self.assertTrue(self.ledger.confirm('ASSET002', '101', 'access', 'unlock', timezone.now()))
+        self.assertFalse(self.ledger.confirm('ASSET002', '101', 'access', 'unlock', timezone.now()))
+
+        self.assertEqual(
+            set(ControlCommand.objects.filter(confirmed_at__isnull=False).values_list('pk', flat=True)),
+            {first.pk, second.pk}
+        )
+        self.assertEqual(self.ledger.stats()['unmatched_confirmations'], 1)
+
+    def test_confirmation_outside_window_is_ignored(self):
+        command = self.send()
+        later = command.published_at + timedelta(seconds=self.ledger.confirm_window + 1)
+
+        self.assertFalse(self.ledger.confirm('ASSET002', '101', 'access', 'unlock', later))
+
+    def test_subscriber_routes_state_topics_to_ledger(self):
+        self.send()
+        buffer = mock.Mock()
+        subscriber = MQTTSubscriber('broker.test', 1883, [], buffer=buffer, ledger=self.ledger)
+
+        subscriber.process_message('rooms/ASSET002/101/access/state', b'unlock', timezone.now())
+
+        self.assertIsNotNone(ControlCommand.objects.get().confirmed_at)
+        buffer.add.assert_not_called()
+
+    def test_latency_percentiles_per_asset_type(self):
+        fleet = create_fleet()
+        now = timezone.now()
+        commands = []
+        for offset, confirm_ms in enumerate([100, 200, 300, None]):
+            published_at = now - timedelta(minutes=10 + offset)
+            commands.append(ControlCommand(
+                asset=self.hotel, sub_asset_id='101', action_type='access', payload='unlock',
+                topic='rooms/ASSET002/101/access', published_at=published_at,
+                acked_at=published_at + timedelta(milliseconds=10),
+                confirmed_at=published_at + timedelta(milliseconds=confirm_ms) if confirm_ms else None,
+            ))
+        commands.append(ControlCommand(
+            asset=fleet, sub_asset_id='V001', action_type='ignition', payload='turn_off',
+            topic='vehicles/ASSET001/V001/ignition', published_at=now, dropped=True,
+        ))
+        ControlCommand.objects.bulk_create(commands)
+
+        latency = command_latency(now - timedelta(hours=1))
+
+        hotel = latency['hotel']
+        self.assertEqual((hotel['sent'], hotel['acked'], hotel['confirmed'], hotel['lost']), (4, 4, 3, 1))
+        self.assertEqual((hotel['ack_p50_ms'], hotel['confirm_p50_ms']), (10.0, 200.0))
+        self.assertEqual(hotel['confirm_p99_ms'], 298.0)
+        vehicle = latency['vehicle']
+        self.assertEqual((vehicle['sent'], vehicle['queue_full'], vehicle['lost'], vehicle['ack_p50_ms']), (1, 1, 0, None))
+
+
+class ControlTaskTests(TestCase):
+    def setUp(self):
+        self.hotel = create_hotel()
+        self.room = HotelRoom.objects.create(hotel=self.hotel, room_number='101', room_type='Standard', price=100.00, status=True)
+
+        patcher = mock.patch('mqtt_handler.ledger.get_publisher')
+        self.publisher = patcher.start().return_value
+        self.publisher.qos = 1
+        self.addCleanup(patcher.stop)
+
+    def test_command_publishes_in_process(self):
+        # no system user or token is needed, and active rooms can be controlled by the system
+        command_id = send_control_request('ASSET002', '101', 'access', 'lock')
+
+        self.publisher.publish.assert_called_once_with('rooms/ASSET002/101/access', 'lock', retain=True, on_ack=mock.ANY)
+        command = ControlCommand.objects.get()
+        self.assertEqual((str(command.correlation_id), command.user), (command_id, None))
+        self.assertEqual(SubAssetState.objects.get(event_type='access').data, 'lock')
+
+    def test_system_cannot_control_an_active_vehicle(self):
+        # only the expiry sweep turns off active vehicles (see core/expiry.py)
+        fleet = create_fleet()
+        Vehicle.objects.create(fleet=fleet, vehicle_number='V001', brand='Toyota', vehicle_type='Sedan', status=True)
+
+        self.assertIsNone(send_control_request('ASSET001', 'V001', 'ignition', 'turn_off'))
+        self.publisher.publish.assert_not_called()
+
+    def test_queued_expiry_tasks_are_ignored(self):
+        self.assertIsNone(schedule_sub_asset_expiry('ASSET002', '101', 'access', 'lock', True))
+
+        self.publisher.publish.assert_not_called()
+        self.room.refresh_from_db()
+        self.assertTrue(self.room.status)
+
+    def test_rejected_command_is_not_published(self):
+        self.assertIsNone(send_control_request('ASSET002', '101', 'ignition', 'turn_on'))
+        self.assertIsNone(send_control_request('ASSET999', '101', 'access', 'unlock'))
+
+        self.publisher.publish.assert_not_called()
+        self.assertFalse(ControlCommand.objects.exists())
@@ -0,0 +1,98 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from ..models import *
+from .fixtures import create_fleet, create_hotel
+
+User = get_user_model()
+
+
+class NestedViewSetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass', email='testuser@gmail.com')
+        self.client.force_authenticate(user=self.user)
+        self.hotel = create_hotel()
+        self.fleet = create_fleet()
+        self.role = Role.objects.create(user=self.user, asset=self.hotel, role='admin')
+        Role.objects.create(user=self.user, asset=self.fleet, role='admin')
+        HotelRoom.objects.create(hotel=self.hotel, room_number='101', room_type='Standard', price=100.00)
+        Vehicle.objects.create(fleet=self.fleet, vehicle_number='V001', brand='Toyota', vehicle_type='Sedan')
+
+    def rooms_url(self, room_number=None, asset_number='ASSET002'):
+        if room_number is None:
+            return reverse('hotel-room-list', kwargs={'asset_number': asset_number})
+        return reverse('hotel-room-detail', kwargs={'asset_number': asset_number, 'room_number': room_number})
+
+    def vehicles_url(self, vehicle_number=None, asset_number='ASSET001'):
+        if vehicle_number is None:
+            return reverse('vehicle-list', kwargs={'asset_number': asset_number})
+        return reverse('vehicle-detail', kwargs={'asset_number': asset_number, 'vehicle_number': vehicle_number})
+
+    # each request: the asset, the user's roles, then the action's own queries
+
+    def test_room_actions_fetch_the_hotel_once(self):
+        with self.assertNumQueries(3):  # + the rooms with their occupancy
+            self.assertEqual(self.client.get(self.rooms_url()).status_code, 200)
+        cache.clear()
+        with self.assertNumQueries(3):  # + the room with its occupancy
+            self.assertEqual(self.client.get(self.rooms_url('101')).status_code, 200)
+        cache.clear()
+        with self.assertNumQueries(4):  # + the insert, the new room's occupancy
+            response = self.client.post(self.rooms_url(), {'room_number': '102', 'room_type': 'Suite', 'price': '250.00'})
+        self.assertEqual(response.status_code, 201)
+        cache.clear()
+        with self.assertNumQueries(4):  # + the room with its occupancy, the update
+            response = self.client.patch(self.rooms_url('102'), {'price': '300.00'})
+        self.assertEqual(response.data['price'], '300.00')
+        cache.clear()
+        with self.assertNumQueries(4):  # + the room, the delete
+            self.assertEqual(self.client.delete(self.rooms_url('102')).status_code, 204)
+
+    def test_vehicle_actions_fetch_the_fleet_once(self):
+        with self.assertNumQueries(3):  # + the vehicles
+            self.assertEqual(self.client.get(self.vehicles_url()).status_code, 200)
+        cache.clear()
+        with self.assertNumQueries(3):  # + the vehicle
+            self.assertEqual(self.client.get(self.vehicles_url('V001')).status_code, 200)
+        cache.clear()
+        with self.assertNumQueries(3):  # + the insert
+            response = self.client.post(self.vehicles_url(), {'vehicle_number': 'V002', 'brand': 'Honda', 'vehicle_type': 'SUV'})
+        self.assertEqual(response.status_code, 201)
+        cache.clear()
+        with self.assertNumQueries(4):  # + the vehicle, the update
+            response = self.client.patch(self.vehicles_url('V002'), {'brand': 'Kia'})
+        self.assertEqual(response.data['brand'], 'Kia')
+        cache.clear()
+        with self.assertNumQueries(4):  # + the vehicle, the delete
+            self.assertEqual(self.client.delete(self.vehicles_url('V002')).status_code, 204)
+
+    def test_vehicle_update_leaves_the_location_fields_alone(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.vehicles_url('V001'), {'brand': 'Kia'})
+        self.assertEqual(response.status_code, 200)
+        [update] = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertIn('"brand"', update)
+        # flushed by the location accumulator while the request runs (see mqtt_handler/location.py)
+        for field in ['total_distance', 'last_latitude', 'last_longitude']:
+            self.assertNotIn(field, update)
+
+    def test_asset_type_and_role_are_checked(self):
+        self.assertEqual(self.client.get(self.rooms_url(asset_number='ASSET001')).status_code, 404)
+        self.assertEqual(self.client.get(self.vehicles_url(asset_number='ASSET002')).status_code, 404)
+        self.assertEqual(self.client.get(self.rooms_url(asset_number='MISSING')).status_code, 404)
+
+        self.role.role = 'viewer'
+        self.role.save()
+        self.assertEqual(self.client.get(self.rooms_url()).status_code, 200)
+        self.assertEqual(self.client.patch(self.rooms_url('101'), {'price': '120.00'}).status_code, 403)
+
+        self.role.delete()
+        self.assertEqual(self.client.get(self.rooms_url()).status_code, 403)
+        self.assertEqual(self.client.get(self.rooms_url('101')).status_code, 403)
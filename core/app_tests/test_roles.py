@@ -0,0 +1,77 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from ..models import *
+from .fixtures import create_hotel
+
+User = get_user_model()
+
+
+@override_settings(SHARED_CACHE=True)
+class RoleResolverTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass', email='testuser@gmail.com')
+        self.invitee = User.objects.create_user(username='invitee', password='testpass', email='invitee@gmail.com')
+        self.client.force_authenticate(user=self.user)
+        self.asset = create_hotel()
+        self.role = Role.objects.create(user=self.user, asset=self.asset, role='manager')
+
+    def invite(self, role='viewer'):
+        return self.client.post(reverse('invite-user', args=['ASSET002']), {'email': 'invitee@gmail.com', 'role': role})
+
+    def role_queries(self, queries):
+        # lookups of the requesting user's roles (the views also write the invitee's)
+        return [
+            query for query in queries.captured_queries
+            if 'FROM "core_role" WHERE' in query['sql'] and f'"core_role"."user_id" = {self.user.id}' in query['sql']
+        ]
+
+    def test_permissions_and_view_share_one_query(self):
+        # IsAdmin | IsManager, then the view's own role check
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.invite().status_code, 200)
+        self.assertEqual(len(self.role_queries(queries)), 1)
+
+        # and the next request reads them from the cache
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.invite('manager').status_code, 200)
+        self.assertEqual(self.role_queries(queries), [])
+
+    def test_role_changes_take_effect_on_the_next_request(self):
+        self.assertEqual(self.invite('admin').status_code, 403)  # higher than the requester's role
+
+        self.role.role = 'admin'
+        self.role.save()
+        self.assertEqual(self.invite('admin').status_code, 200)
+
+        self.role.delete()
+        self.assertEqual(self.invite().status_code, 403)
+
+    def test_list_views_resolve_all_roles_at_once(self):
+        for number in ['ASSET003', 'ASSET004']:
+            asset = create_hotel(number, asset_name=number)
+            Role.objects.create(user=self.user, asset=asset, role='viewer')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('asset-list'))
+        self.assertEqual(
+            {row['asset_number']: row['user_role'] for row in response.data},
+            {'ASSET002': 'manager', 'ASSET003': 'viewer', 'ASSET004': 'viewer'}
+        )
+        self.assertEqual(len(self.role_queries(queries)), 1)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_roles_are_read_on_each_request_without_a_shared_cache(self):
+        self.assertEqual(self.invite().status_code, 200)
+        Role.objects.filter(pk=self.role.pk).update(role='viewer')  # e.g. by another process, no signal here
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.invite().status_code, 403)
+        self.assertEqual(len(self.role_queries(queries)), 1)
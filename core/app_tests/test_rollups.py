@@ -0,0 +1,141 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from ..models import *
+from .fixtures import create_fleet, create_hotel
+from ..rollups import rebuild_daily_rollups, update_recent_rollups
+
+User = get_user_model()
+
+
+class DailyRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='password1', email='test1@gmail.com')
+        self.hotel = create_hotel()
+        self.fleet = create_fleet()
+        Role.objects.create(user=self.user, asset=self.hotel, role='admin')
+        Role.objects.create(user=self.user, asset=self.fleet, role='admin')
+        HotelRoom.objects.create(hotel=self.hotel, room_number='101', room_type='Standard', price=100.00)
+        Vehicle.objects.create(fleet=self.fleet, vehicle_number='V001', brand='Toyota', vehicle_type='Sedan')
+
+        self.today = timezone.localdate()
+        self.now = timezone.now()
+        self.room_type = ContentType.objects.get_for_model(HotelRoom)
+        self.vehicle_type = ContentType.objects.get_for_model(Vehicle)
+
+    def transaction(self, asset, sub_asset_number, amount, days_ago, payment_status='completed'):
+        transaction = Transaction.objects.create(
+            name='Guest', amount=amount, asset=asset, sub_asset_number=sub_asset_number,
+            transaction_ref=f'REF-{Transaction.objects.count()}', payment_status=payment_status, payment_type='card'
+        )
+        Transaction.objects.filter(pk=transaction.pk).update(timestamp=self.now - timedelta(days=days_ago))
+        return transaction
+
+    def event(self, asset, content_type, object_id, event_type, data, days_ago):
+        return AssetEvent.objects.create(
+            asset=asset, content_type=content_type, object_id=object_id, event_type=event_type,
+            data=data, timestamp=self.now - timedelta(days=days_ago)
+        )
+
+    def test_rebuild_aggregates_assets_and_sub_assets(self):
+        self.transaction(self.hotel, '101', '100.00', days_ago=1)
+        self.transaction(self.hotel, '101', '50.00', days_ago=1)
+        self.transaction(self.hotel, '101', '75.00', days_ago=1, payment_status='pending')
+        self.transaction(self.fleet, 'V001', '30.00', days_ago=1)
+        self.event(self.hotel, self.room_type, '101', 'occupancy', '1', days_ago=1)
+        self.event(self.hotel, self.room_type, '101', 'access', 'unlock', days_ago=1)
+        self.event(self.fleet, self.vehicle_type, 'V001', 'ignition', 'turn_on', days_ago=1)
+        self.event(self.fleet, self.vehicle_type, 'V001', 'ignition', 'turn_on', days_ago=2)
+
+        yesterday = self.today - timedelta(days=1)
+        self.assertEqual(rebuild_daily_rollups([yesterday]), 2)
+
+        hotel = DailyAssetRollup.objects.get(asset=self.hotel, date=yesterday)
+        self.assertEqual((hotel.revenue, hotel.completed_transactions), (Decimal('150.00'), 2))
+        self.assertEqual((hotel.occupied_rooms, hotel.expected_yield), (1, Decimal('100.00')))
+        fleet = DailyAssetRollup.objects.get(asset=self.fleet, date=yesterday)
+        self.assertEqual((fleet.revenue, fleet.vehicles_with_events), (Decimal('30.00'), 1))
+
+        room = DailySubAssetRollup.objects.get(content_type=self.room_type, object_id='101')
+        self.assertEqual((room.revenue, room.events, room.occupied), (Decimal('150.00'), 2, True))
+        # only the requested day was built
+        self.assertFalse(DailyAssetRollup.objects.filter(date=self.today - timedelta(days=2)).exists())
+
+        # rebuilding replaces the rows instead of adding to them
+        rebuild_daily_rollups([yesterday])
+        self.assertEqual(DailyAssetRollup.objects.get(asset=self.hotel, date=yesterday).revenue, Decimal('150.00'))
+
+    def test_recent_update_picks_up_late_transaction_changes(self):
+        transaction = self.transaction(self.hotel, '101', '100.00', days_ago=10, payment_status='pending')
+        self.event(self.fleet, self.vehicle_type, 'V001', 'ignition', 'turn_on', days_ago=0)
+        update_recent_rollups(timezone.now())
+        since = timezone.now()
+        Transaction.objects.filter(pk=transaction.pk).update(payment_status='completed', updated_at=timezone.now())
+
+        update_recent_rollups(since)
+
+        rollup = DailyAssetRollup.objects.get(asset=self.hotel)
+        self.assertEqual((rollup.date, rollup.revenue), (self.today - timedelta(days=10), Decimal('100.00')))
+
+    def test_recent_update_picks_up_late_events(self):
+        self.event(self.fleet, self.vehicle_type, 'V001', 'ignition', 'turn_on', days_ago=0)
+        update_recent_rollups(timezone.now())
+        since = timezone.now()
+
+        # received while the database was unreachable, written after newer ones
+        self.now = timezone.now()
+        self.event(self.fleet, self.vehicle_type, 'V001', 'ignition', 'turn_on', days_ago=0)
+        self.event(self.fleet, self.vehicle_type, 'V001', 'ignition', 'turn_off', days_ago=5)
+        update_recent_rollups(since)
+
+        self.assertEqual(
+            DailyAssetRollup.objects.get(asset=self.fleet, date=self.today - timedelta(days=5)).vehicles_with_events, 1
+        )
+
+    def test_first_update_backfills_past_days(self):
+        self.transaction(self.hotel, '101', '100.00', days_ago=40)
+        self.event(self.fleet, self.vehicle_type, 'V001', 'ignition', 'turn_on', days_ago=20)
+
+        update_recent_rollups(timezone.now())
+
+        self.assertEqual(
+            sorted(DailyAssetRollup.objects.values_list('asset_id', 'date')),
+            [('ASSET001', self.today - timedelta(days=20)), ('ASSET002', self.today - timedelta(days=40))]
+        )
+
+    def test_backfill_command(self):
+        self.transaction(self.hotel, '101', '100.00', days_ago=40)
+        self.transaction(self.hotel, '101', '20.00', days_ago=3)
+
+        call_command('backfill_rollups', chunk_days=7, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(DailyAssetRollup.objects.values_list('date', 'revenue')),
+            [(self.today - timedelta(days=40), Decimal('100.00')), (self.today - timedelta(days=3), Decimal('20.00'))]
+        )
+
+    def test_index_stats_combines_rollups_and_today(self):
+        self.transaction(self.hotel, '101', '100.00', days_ago=1)
+        self.transaction(self.hotel, '101', '40.00', days_ago=0)
+        rebuild_daily_rollups([self.today - timedelta(days=1)])
+        # later changes to closed days only show up once the rollups are refreshed
+        self.transaction(self.hotel, '101', '999.00', days_ago=1)
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get(reverse('user-asset-statistics'), {'year': self.today.year, 'month': self.today.month})
+
+        self.assertEqual(response.status_code, 200)
+        revenue = {day['date']: day['hotel'] for day in response.data['revenue_graph_data']}
+        self.assertEqual(revenue[self.today.strftime('%Y-%m-%d')], 40.0)
+        if self.today.day > 1:
+            self.assertEqual(revenue[(self.today - timedelta(days=1)).strftime('%Y-%m-%d')], 100.0)
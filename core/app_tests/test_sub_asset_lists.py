@@ -0,0 +1,100 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from ..models import *
+from .fixtures import create_fleet, create_hotel
+
+User = get_user_model()
+
+
+class SubAssetListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass', email='testuser@gmail.com')
+        self.client.force_authenticate(user=self.user)
+        self.hotel = create_hotel()
+        self.fleet = create_fleet()
+        self.other_fleet = create_fleet('ASSET003', asset_name='Other Fleet')
+        Role.objects.create(user=self.user, asset=self.hotel, role='viewer')
+        Role.objects.create(user=self.user, asset=self.fleet, role='viewer')
+
+        expiry = datetime(2024, 10, 2, 12, tzinfo=dt_timezone.utc)
+        for number, room_type, price, active in [
+            ('104', 'Suite', 300.00, True), ('101', 'Standard', 100.00, False),
+            ('103', 'Standard', 120.00, True), ('102', 'Deluxe', 200.00, False),
+        ]:
+            HotelRoom.objects.create(
+                hotel=self.hotel, room_number=number, room_type=room_type, price=price, status=active,
+                expiry_timestamp=expiry if active else None
+            )
+            expiry = expiry.replace(day=expiry.day + 1)
+        for fleet, number, vehicle_type in [
+            (self.fleet, 'V002', 'SUV'), (self.fleet, 'V001', 'Sedan'), (self.other_fleet, 'V003', 'Sedan'),
+        ]:
+            Vehicle.objects.create(fleet=fleet, vehicle_number=number, brand='Toyota', vehicle_type=vehicle_type)
+
+    def get_rooms(self, **params):
+        response = self.client.get(reverse('hotel-room-list', kwargs={'asset_number': 'ASSET002'}), params)
+        self.assertEqual(response.status_code, 200)
+        return [row['room_number'] for row in response.data]
+
+    def test_rooms_are_filtered(self):
+        self.assertEqual(self.get_rooms(), ['101', '102', '103', '104'])
+        self.assertEqual(self.get_rooms(status='true'), ['103', '104'])
+        self.assertEqual(self.get_rooms(room_type='Standard'), ['101', '103'])
+        self.assertEqual(self.get_rooms(expiring_before='2024-10-04'), ['104'])
+        self.assertEqual(self.get_rooms(expiring_before='2024-10-04T12:00:01Z'), ['103', '104'])
+
+    def test_rooms_are_ordered_and_paged(self):
+        self.assertEqual(self.get_rooms(ordering='-price'), ['104', '102', '103', '101'])
+
+        url = reverse('hotel-room-list', kwargs={'asset_number': 'ASSET002'})
+        pages, cursor = [], None
+        while True:
+            params = {'ordering': '-price', 'limit': 3}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(url, params)
+            pages.append([row['room_number'] for row in response.data])
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+        self.assertEqual(pages, [['104', '102', '103'], ['101']])
+
+        response = self.client.get(url, {'ordering': 'expiry_timestamp'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.data)
+
+    def test_lists_are_whole_unless_a_page_is_requested(self):
+        for number in range(105, 215):
+            HotelRoom.objects.create(hotel=self.hotel, room_number=str(number), room_type='Standard', price=100.00)
+        url = reverse('hotel-room-list', kwargs={'asset_number': 'ASSET002'})
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.data), 114)
+        self.assertFalse(response.has_header('X-Next-Cursor'))
+
+        response = self.client.get(url, {'cursor': self.client.get(url, {'limit': 100})['X-Next-Cursor']})
+        self.assertEqual(len(response.data), 14)
+
+    def test_fleet_vehicles_are_filtered(self):
+        response = self.client.get(reverse('vehicle-list', kwargs={'asset_number': 'ASSET001'}), {'vehicle_type': 'Sedan'})
+        self.assertEqual([row['vehicle_number'] for row in response.data], ['V001'])
+
+    def test_vehicles_of_all_fleets_are_listed_in_pages(self):
+        with self.assertNumQueries(2):  # the user's roles, the vehicles with their fleet
+            response = self.client.get(reverse('vehicle-list-create'), {'limit': 1})
+        self.assertEqual([row['vehicle_number'] for row in response.data], ['V001'])
+
+        response = self.client.get(reverse('vehicle-list-create'), {'limit': 1, 'cursor': response.headers['X-Next-Cursor']})
+        self.assertEqual([row['vehicle_number'] for row in response.data], ['V002'])
+        self.assertNotIn('X-Next-Cursor', response.headers)  # not V003, of a fleet the user has no role on
+
+        response = self.client.get(reverse('vehicle-list-create'), {'vehicle_type': 'SUV'})
+        self.assertEqual([row['vehicle_number'] for row in response.data], ['V002'])
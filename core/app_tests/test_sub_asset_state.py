@@ -0,0 +1,158 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from assets.serializers import HotelRoomSerializer
+
+from ..models import *
+from .fixtures import create_fleet, create_hotel
+
+User = get_user_model()
+
+
+class SubAssetStateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='user1', password='password1', email='test1@gmail.com')
+        self.client.force_authenticate(user=self.user)
+
+        self.hotel = create_hotel()
+        self.fleet = create_fleet()
+        Role.objects.create(user=self.user, asset=self.hotel, role='viewer')
+        Role.objects.create(user=self.user, asset=self.fleet, role='viewer')
+        self.room = HotelRoom.objects.create(hotel=self.hotel, room_number='101', room_type='Standard', price=100.00)
+        self.vehicle = Vehicle.objects.create(fleet=self.fleet, vehicle_number='V001', brand='Toyota', vehicle_type='Sedan')
+        self.now = timezone.now()
+
+    def event(self, asset, sub_asset, object_id, event_type, data, minutes_ago=0):
+        return AssetEvent(
+            asset=asset,
+            content_type=ContentType.objects.get_for_model(sub_asset),
+            object_id=object_id,
+            event_type=event_type,
+            data=data,
+            timestamp=self.now - timedelta(minutes=minutes_ago)
+        )
+
+    def test_record_keeps_latest_event_per_key(self):
+        SubAssetState.record([
+            self.event(self.hotel, self.room, '101', 'occupancy', '1', minutes_ago=5),
+            self.event(self.hotel, self.room, '101', 'occupancy', '0', minutes_ago=1),
+            self.event(self.hotel, self.room, '101', 'occupancy', '2', minutes_ago=3),
+            self.event(self.hotel, self.room, '101', 'access', 'granted'),
+        ])
+        self.assertEqual(SubAssetState.objects.count(), 2)
+        self.assertEqual(SubAssetState.objects.get(event_type='occupancy').data, '0')
+
+        # later batches overwrite the row in place
+        with self.assertNumQueries(1):
+            SubAssetState.record([self.event(self.hotel, self.room, '101', 'occupancy', '3')])
+        self.assertEqual(SubAssetState.objects.count(), 2)
+        self.assertEqual(SubAssetState.objects.get(event_type='occupancy').data, '3')
+
+    def test_record_never_replaces_a_newer_state(self):
+        SubAssetState.record([self.event(self.hotel, self.room, '101', 'access', 'lock', minutes_ago=1)])
+
+        # e.g. a buffered unlock flushed after the expiry locked the room
+        SubAssetState.record([
+            self.event(self.hotel, self.room, '101', 'access', 'unlock', minutes_ago=2),
+            self.event(self.hotel, self.room, '101', 'occupancy', '1', minutes_ago=2),
+        ])
+        self.assertEqual(
+            dict(SubAssetState.objects.values_list('event_type', 'data')), {'access': 'lock', 'occupancy': '1'}
+        )
+
+    def test_room_status_reads_state_only(self):
+        SubAssetState.record([
+            self.event(self.hotel, self.room, '101', 'access', 'granted', minutes_ago=2),
+            self.event(self.hotel, self.room, '101', 'occupancy', '2'),
+        ])
+        url = reverse('check_sub_asset_status', kwargs={'asset_number': 'ASSET002', 'sub_asset_id': '101'})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['last_access_command']['command'], 'granted')
+        self.assertEqual(response.data['last_occupancy']['status'], '2')
+        self.assertEqual(response.data['last_electricity_command']['command'], 'No electricity command found')
+        self.assertFalse([query for query in queries.captured_queries if 'core_assetevent' in query['sql']])
+
+    def test_vehicle_status_uses_vehicle_number(self):
+        SubAssetState.record([
+            self.event(self.fleet, self.vehicle, 'V001', 'location', '6.5244,3.3792'),
+            self.event(self.fleet, self.vehicle, 'V001', 'ignition', 'turn_on'),
+        ])
+
+        response = self.client.get(reverse('vehicle-status', kwargs={'pk': self.vehicle.pk}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['events'], {'location': '6.5244,3.3792', 'ignition': 'turn_on'})
+
+    def test_room_occupancy_is_scoped_to_hotel(self):
+        other_hotel = create_hotel('ASSET003', asset_name='Other Hotel')
+        SubAssetState.record([self.event(other_hotel, self.room, '101', 'occupancy', '4')])
+
+        response = self.client.get(reverse('hotel-room-detail', kwargs={'asset_number': 'ASSET002', 'room_number': '101'}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['occupancy'], 0)
+
+    def test_room_list_annotates_occupancy_in_one_query(self):
+        other_hotel = create_hotel('ASSET003', asset_name='Other Hotel')
+        for number in ['102', '103', '104']:
+            HotelRoom.objects.create(hotel=self.hotel, room_number=number, room_type='Standard', price=100.00)
+        SubAssetState.record([
+            self.event(self.hotel, self.room, '101', 'occupancy', '2'),
+            self.event(self.hotel, self.room, '103', 'occupancy', '1'),
+            self.event(self.hotel, self.room, '103', 'access', 'unlock'),
+            self.event(other_hotel, self.room, '102', 'occupancy', '4'),
+        ])
+        url = reverse('hotel-room-list', kwargs={'asset_number': 'ASSET002'})
+
+        with self.assertNumQueries(3):  # the hotel, the user's roles, the annotated rooms
+            response = self.client.get(url)
+
+        self.assertEqual(
+            {row['room_number']: row['occupancy'] for row in response.data},
+            {'101': 2, '102': 0, '103': 1, '104': 0}
+        )
+
+    def test_occupancy_falls_back_to_events_without_a_state(self):
+        # written before the states were backfilled
+        AssetEvent.objects.bulk_create([
+            self.event(self.hotel, self.room, '101', 'occupancy', '1', minutes_ago=10),
+            self.event(self.hotel, self.room, '101', 'occupancy', '3', minutes_ago=1),
+        ])
+
+        response = self.client.get(reverse('hotel-room-list', kwargs={'asset_number': 'ASSET002'}))
+        self.assertEqual(response.data[0]['occupancy'], 3)
+        self.assertEqual(HotelRoomSerializer(self.room).data['occupancy'], 3)
+
+        SubAssetState.record([self.event(self.hotel, self.room, '101', 'occupancy', '2')])
+        response = self.client.get(reverse('hotel-room-list', kwargs={'asset_number': 'ASSET002'}))
+        self.assertEqual(response.data[0]['occupancy'], 2)
+        self.assertEqual(HotelRoomSerializer(self.room).data['occupancy'], 2)
+
+    def test_backfill_from_events(self):
+        AssetEvent.objects.bulk_create([
+            self.event(self.hotel, self.room, '101', 'occupancy', '1', minutes_ago=10),
+            self.event(self.hotel, self.room, '101', 'occupancy', '3', minutes_ago=1),
+            self.event(self.fleet, self.vehicle, 'V001', 'ignition', 'turn_off'),
+        ])
+
+        call_command('backfill_sub_asset_state', stdout=StringIO())
+
+        self.assertEqual(
+            set(SubAssetState.objects.values_list('asset_id', 'object_id', 'event_type', 'data')),
+            {('ASSET002', '101', 'occupancy', '3'), ('ASSET001', 'V001', 'ignition', 'turn_off')}
+        )
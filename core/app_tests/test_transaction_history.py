@@ -0,0 +1,100 @@
+import base64
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from ..models import *
+from .fixtures import create_hotel
+
+User = get_user_model()
+
+
+class TransactionHistoryViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass', email='testuser@gmail.com')
+        self.client.force_authenticate(user=self.user)
+        self.asset = create_hotel()
+        Role.objects.create(user=self.user, asset=self.asset, role='admin')
+
+        # two per day from Oct 1 to Oct 4, the two of a day at the same time
+        self.transactions = []
+        for day in range(1, 5):
+            for index, payment_status in enumerate(['completed', 'pending']):
+                transaction = Transaction.objects.create(
+                    name=f'Guest {day}-{index}', amount='100.00', asset=self.asset, sub_asset_number='101',
+                    transaction_ref=f'REF{day}-{index}', payment_status=payment_status, payment_type='card'
+                )
+                Transaction.objects.filter(pk=transaction.pk).update(timestamp=datetime(2024, 10, day, 12, tzinfo=dt_timezone.utc))
+                self.transactions.append(transaction)
+        self.newest_first = sorted(self.transactions, key=lambda t: (t.transaction_ref[3], t.pk), reverse=True)
+
+    def get(self, **params):
+        return self.client.get(reverse('asset-transaction-history', args=['ASSET002']), params)
+
+    def test_pages_follow_the_cursor(self):
+        names, cursor, pages = [], None, 0
+        while True:
+            response = self.get(limit=3, **({'cursor': cursor} if cursor else {}))
+            self.assertEqual(response.status_code, 200)
+            names += [row['name'] for row in response.data]
+            pages += 1
+            cursor = response.get('X-Next-Cursor')
+            if cursor is None:
+                break
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(names, [t.name for t in self.newest_first])
+
+    def test_cursor_header_is_readable_cross_origin(self):
+        response = self.client.get(
+            reverse('asset-transaction-history', args=['ASSET002']), {'limit': 3}, HTTP_ORIGIN='https://trykeyprotocol.com'
+        )
+        self.assertIn('X-Next-Cursor', response['Access-Control-Expose-Headers'])
+
+    def test_page_costs_the_same_queries_at_any_depth(self):
+        first = self.get(limit=2)
+        cursor = self.get(limit=6)['X-Next-Cursor']
+        with self.assertNumQueries(3):  # roles, asset, page
+            deep = self.get(limit=2, cursor=cursor)
+
+        self.assertEqual([row['name'] for row in first.data], [t.name for t in self.newest_first[:2]])
+        self.assertEqual([row['name'] for row in deep.data], [t.name for t in self.newest_first[6:]])
+        self.assertFalse(deep.has_header('X-Next-Cursor'))
+
+    def test_status_and_date_filters(self):
+        response = self.get(status='pending', start_date='2024-10-02', end_date='2024-10-03')
+
+        self.assertEqual([row['name'] for row in response.data], ['Guest 3-1', 'Guest 2-1'])
+        self.assertEqual(
+            len(self.get(start_date='2024-10-02T12:00:00Z', end_date='2024-10-02T12:00:00Z').data), 0
+        )
+        self.assertEqual(len(self.get(status='completed,pending').data), 8)
+
+    def test_sparse_fieldset(self):
+        response = self.get(fields='amount,date_time', limit=1)
+
+        # rendered in TIME_ZONE (Africa/Lagos)
+        self.assertEqual(response.data, [{'amount': '100.00', 'date_time': '2024-10-04 13:00:00'}])
+
+    def test_invalid_parameters(self):
+        for params in [{'limit': 0}, {'limit': 'x'}, {'cursor': 'abc'}, {'status': 'lost'},
+                       {'start_date': 'yesterday'}, {'fields': 'name,secret'}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.get(**params).status_code, 400)
+
+    def test_crafted_cursors_are_rejected(self):
+        for values in [[1, 5], [None, 5], ['2024-10-02T12:00:00Z'], {'timestamp': 1}, [['x'], 5]]:
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            with self.subTest(values=values):
+                response = self.get(cursor=cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['cursor'], 'Invalid cursor.')
+
+    def test_requires_a_role_on_the_asset(self):
+        Role.objects.all().delete()
+        self.assertEqual(self.get().status_code, 403)
@@ -0,0 +1,72 @@
+import json
+
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from ..models import *
+from .fixtures import create_fleet, create_hotel
+
+User = get_user_model()
+
+
+class UserDataViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.users = [
+            User.objects.create_user(username=f'user{i}', password='password', email=f'user{i}@gmail.com')
+            for i in range(3)
+        ]
+        self.client.force_authenticate(user=self.users[0])
+
+        for i, user in enumerate(self.users):
+            hotel = create_hotel(f'HOTEL{i}', asset_name=f'Hotel {i}')
+            fleet = create_fleet(f'FLEET{i}', asset_name=f'Fleet {i}')
+            Role.objects.create(user=user, asset=hotel, role='admin')
+            Role.objects.create(user=user, asset=fleet, role='admin')
+            for number in ['101', '102']:
+                HotelRoom.objects.create(hotel=hotel, room_number=number, room_type='Standard', price=100.00)
+            Vehicle.objects.create(fleet=fleet, vehicle_number='V001', brand='Toyota', vehicle_type='Sedan')
+            Transaction.objects.create(
+                name='Guest', amount='100.00', asset=hotel, sub_asset_number='101',
+                transaction_ref=f'REF{i}', payment_status='completed', payment_type='card'
+            )
+
+    def get(self, params=None):
+        response = self.client.get(reverse('user-data'), params or {})
+        return response, json.loads(b''.join(response.streaming_content))
+
+    def test_export_uses_a_fixed_number_of_queries(self):
+        # users, roles with assets, rooms, vehicles, transactions
+        with self.assertNumQueries(5):
+            response, data = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user['id'] for user in data], [user.id for user in self.users])
+        user = data[0]
+        self.assertEqual(len(user['assets']['hotel']), 1)
+        self.assertEqual([room['room_number'] for room in user['assets']['hotel'][0]['rooms']], ['101', '102'])
+        self.assertEqual(user['assets']['logistics'][0]['vehicles'][0]['vehicle_number'], 'V001')
+        self.assertEqual(user['payments'], [{
+            'id': Transaction.objects.get(transaction_ref='REF0').id,
+            'asset_id': str(Asset.objects.get(asset_number='HOTEL0').id),
+            'sub_asset_id': '101',
+            'amount': 100.0,
+            'status': 'completed',
+            'timestamp': Transaction.objects.get(transaction_ref='REF0').timestamp.isoformat(),
+            'payment_type': 'card'
+        }])
+
+    def test_cursor_pagination(self):
+        response, data = self.get({'limit': 2})
+        self.assertEqual([user['id'] for user in data], [self.users[0].id, self.users[1].id])
+        self.assertEqual(response['X-Next-Cursor'], str(self.users[1].id))
+
+        response, data = self.get({'limit': 2, 'after': response['X-Next-Cursor']})
+        self.assertEqual([user['id'] for user in data], [self.users[2].id])
+        self.assertFalse(response.has_header('X-Next-Cursor'))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(reverse('user-data'), {'after': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('user-data'), {'limit': 0}).status_code, 400)
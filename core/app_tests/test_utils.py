@@ -0,0 +1,49 @@
+import numpy as np
+from django.test import SimpleTestCase
+from geopy.distance import geodesic
+
+from utils.geo import ellipsoidal_km, haversine_km, segment_distances, track_distances
+
+
+class GeoDistanceTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.lat1 = rng.uniform(-70, 70, 200)
+        self.lon1 = rng.uniform(-180, 180, 200)
+        self.lat2 = self.lat1 + rng.uniform(-0.2, 0.2, 200)
+        self.lon2 = self.lon1 + rng.uniform(-0.2, 0.2, 200)
+        self.expected = np.array([
+            geodesic((a, b), (c, d)).kilometers for a, b, c, d in zip(self.lat1, self.lon1, self.lat2, self.lon2)
+        ])
+
+    def test_ellipsoidal_error_bound(self):
+        error = np.abs(ellipsoidal_km(self.lat1, self.lon1, self.lat2, self.lon2) - self.expected) / self.expected
+        self.assertLess(error.max(), 5e-5)
+
+    def test_haversine_error_bound(self):
+        error = np.abs(haversine_km(self.lat1, self.lon1, self.lat2, self.lon2) - self.expected) / self.expected
+        self.assertLess(error.max(), 6e-3)
+
+    def test_long_segments_fall_back_to_haversine(self):
+        lagos, london = (6.5244, 3.3792), (51.5072, -0.1276)
+        distance = ellipsoidal_km(*lagos, *london)
+        self.assertAlmostEqual(float(distance), geodesic(lagos, london).kilometers, delta=geodesic(lagos, london).kilometers * 6e-3)
+
+    def test_antimeridian_crossing(self):
+        self.assertAlmostEqual(float(ellipsoidal_km(0, 179.99, 0, -179.99)), geodesic((0, 179.99), (0, -179.99)).kilometers, places=3)
+
+    def test_track_distances_handles_interleaved_tracks(self):
+        track_ids = [1, 2, 1, 2, 1]
+        latitudes = [6.50, 9.00, 6.51, 9.01, 6.52]
+        longitudes = [3.30, 7.40, 3.30, 7.40, 3.30]
+
+        result = track_distances(track_ids, latitudes, longitudes)
+
+        self.assertAlmostEqual(result[1][0], segment_distances([6.50, 6.51, 6.52], [3.30] * 3).sum())
+        self.assertAlmostEqual(result[2][0], segment_distances([9.00, 9.01], [7.40] * 2).sum())
+        self.assertEqual(result[1][1:], (6.52, 3.30))
+        self.assertEqual(result[2][1:], (9.01, 7.40))
+
+    def test_single_point_tracks_have_no_distance(self):
+        self.assertEqual(track_distances([7], [6.5], [3.3]), {7: (0.0, 6.5, 3.3)})
+        self.assertEqual(track_distances([], [], []), {})
@@ -0,0 +1,210 @@
+"""
+Expiry of room and vehicle sessions.
+
+A session ends at the expiry_timestamp of its room or vehicle, so extending a booking only moves
+that timestamp. Celery beat runs sweep_expired_sub_assets() and then process_due_expiries()
+every SUB_ASSET_EXPIRY_POLL_INTERVAL seconds.
+
+sweep_expired_sub_assets() handles every active room and vehicle whose expiry_timestamp has
+passed in bulk: one locking SELECT per model on a partial index, one UPDATE to deactivate them
+with one upsert of claimed expiries, one insert of ledger rows, the publishes, one bulk_create
+of AssetEvents, then one lookup per model and one delete of the published claims. Because it
+works from expiry_timestamp, it also catches expiries that were missed while the broker or the
+workers were down.
+
+SubAssetExpiry is the outbox of the sweep: each deactivation commits together with a claimed row
+holding the sub-asset's expiry command, deleted once the command is published. Commands that
+could not be published because the broker is down are released, and the claims of a worker that
+died are claimed again after SUB_ASSET_EXPIRY_CLAIM_TIMEOUT seconds; process_due_expiries() sends
+them, claiming the rows with SELECT ... FOR UPDATE SKIP LOCKED so several workers never send the
+same one. A sub-asset activated again in the meantime is not sent its expiry command:
+VerifyPaymentView cancels the row, and process_due_expiries() re-checks the sub-asset under lock.
+"""
+import logging
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import Asset, AssetEvent, ControlCommand, HotelRoom, SubAssetExpiry, SubAssetState, Vehicle
+from mqtt_handler.control import ControlError, control_topic, send_control_command
+from mqtt_handler.ledger import ledger
+from mqtt_handler.publisher import PublishQueueFull
+
+
+logger = logging.getLogger(__name__)
+
+# sub-asset model -> (FK to the parent asset, sub-asset number field, parent asset type, expiry command)
+EXPIRY_COMMANDS = {
+    HotelRoom: ('hotel', 'room_number', 'hotel', ('access', 'lock')),
+    Vehicle: ('fleet', 'vehicle_number', 'vehicle', ('ignition', 'turn_off')),
+}
+
+
+def cancel_expiry(sub_asset):
+    asset_id, object_id = _sub_asset_key(sub_asset)
+    return SubAssetExpiry.objects.filter(
+        asset_id=asset_id, content_type=ContentType.objects.get_for_model(sub_asset), object_id=object_id
+    ).delete()[0]
+
+
+def claim_due_expiries(now=None, limit=500):
+    """
+    Claim and return up to `limit` expiries that are due, oldest first, skipping the ones claimed
+    by another worker less than SUB_ASSET_EXPIRY_CLAIM_TIMEOUT seconds ago.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = list(
+            SubAssetExpiry.objects.select_for_update(skip_locked=True)
+            .filter(expires_at__lte=now)
+            .filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - timedelta(seconds=settings.SUB_ASSET_EXPIRY_CLAIM_TIMEOUT)))
+            .order_by('expires_at')[:limit]
+        )
+        if due:
+            SubAssetExpiry.objects.filter(pk__in=[expiry.pk for expiry in due]).update(claimed_at=now)
+            for expiry in due:
+                expiry.claimed_at = now
+    return due
+
+
+def _claimed(expiries):
+    # the rows of these claims, unless the expiry was scheduled again meanwhile
+    return SubAssetExpiry.objects.filter(pk__in=[expiry.pk for expiry in expiries], claimed_at=expiries[0].claimed_at)
+
+
+def process_due_expiries(now=None, limit=500):
+    """
+    Send the control commands of due expiries. Returns the number of commands sent.
+    """
+    now = now or timezone.now()
+    due = claim_due_expiries(now, limit)
+    assets = Asset.objects.in_bulk({expiry.asset_id for expiry in due}, field_name='asset_number')
+
+    sent = 0
+    for index, expiry in enumerate(due):
+        try:
+            if _renewed(expiry, now):
+                logger.info(f"Skipping expiry of {expiry.object_id} in {expiry.asset_id}, it was activated again")
+            else:
+                send_control_command(assets[expiry.asset_id], expiry.object_id, expiry.action_type, expiry.data, force=True)
+                sent += 1
+        except ControlError as e:
+            logger.error(f"Dropping expiry of {expiry.object_id} in {expiry.asset_id}: {str(e)}")
+        except PublishQueueFull:
+            # retried on the next run
+            _claimed(due[index:]).update(claimed_at=None)
+            logger.warning(f"MQTT publish queue is full, postponed {len(due) - index} expiries")
+            break
+        _claimed([expiry]).delete()
+    return sent
+
+
+def _renewed(expiry, now):
+    # whether the sub-asset was activated again after it expired; the lock waits for a payment
+    # that is saving it to commit (the command itself is published outside of the transaction,
+    # the ledger records its acknowledgement from another thread)
+    model = ContentType.objects.get_for_id(expiry.content_type_id).model_class()
+    if model not in EXPIRY_COMMANDS:
+        return False
+    parent, number_field, _, _ = EXPIRY_COMMANDS[model]
+    with transaction.atomic():
+        return model.objects.select_for_update().filter(
+            **{f'{parent}_id': expiry.asset_id, number_field: expiry.object_id}, status=True, expiry_timestamp__gt=now
+        ).exists()
+
+
+def sweep_expired_sub_assets(now=None, limit=1000):
+    """
+    Deactivate up to `limit` expired rooms and vehicles of each kind and send their expiry
+    commands in bulk. Returns the number of sub-assets deactivated.
+
+    The deactivation commits together with a claimed SubAssetExpiry per sub-asset, deleted once
+    its command is published: if the worker dies before that, process_due_expiries() sends the
+    command after SUB_ASSET_EXPIRY_CLAIM_TIMEOUT.
+    """
+    now = now or timezone.now()
+    expired = []  # (model, asset_number, sub-asset number)
+    content_types = {model: ContentType.objects.get_for_model(model) for model in EXPIRY_COMMANDS}
+    with transaction.atomic():
+        for model, (parent, number_field, _, _) in EXPIRY_COMMANDS.items():
+            rows = list(
+                model.objects.select_for_update(skip_locked=True)
+                .filter(status=True, expiry_timestamp__lte=now)
+                .order_by('expiry_timestamp')
+                .values_list('pk', f'{parent}_id', number_field)[:limit]
+            )
+            if rows:
+                model.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(status=False)
+                expired.extend((model, asset_id, number) for _, asset_id, number in rows)
+
+        if not expired:
+            return 0
+        SubAssetExpiry.objects.bulk_create(
+            [
+                SubAssetExpiry(
+                    asset_id=asset_id, content_type=content_types[model], object_id=number, expires_at=now,
+                    action_type=EXPIRY_COMMANDS[model][3][0], data=EXPIRY_COMMANDS[model][3][1], claimed_at=now,
+                )
+                for model, asset_id, number in expired
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=SubAssetExpiry.KEY_FIELDS,
+            update_fields=['expires_at', 'action_type', 'data', 'scheduled_at', 'claimed_at'],
+        )
+
+    commands = []
+    for model, asset_id, number in expired:
+        _, _, asset_type, (action_type, data) = EXPIRY_COMMANDS[model]
+        commands.append(ControlCommand(
+            asset_id=asset_id, sub_asset_id=number, action_type=action_type, payload=data,
+            topic=control_topic(asset_type, asset_id, number, action_type),
+        ))
+    published, dropped = ledger.send_many(commands)
+
+    events = [
+        AssetEvent(
+            asset_id=command.asset_id, content_type=content_types[model], object_id=command.sub_asset_id,
+            event_type=command.action_type, data=command.payload, timestamp=command.published_at,
+        )
+        for (model, _, _), command in zip(expired, published)
+    ]
+    AssetEvent.objects.bulk_create(events, batch_size=1000)
+    SubAssetState.record(events)
+
+    def claims(sub_assets):
+        # one lookup on the unique index per model; rows matching the IN lists that are not among
+        # sub_assets (e.g. room 101 of another of the hotels) are left out by their key
+        keys = {(content_types[model].id, asset_id, number) for model, asset_id, number in sub_assets}
+        pks = []
+        for model in {model for model, _, _ in sub_assets}:
+            rows = [(asset_id, number) for row_model, asset_id, number in sub_assets if row_model is model]
+            pks.extend(
+                pk for pk, *key in SubAssetExpiry.objects.filter(
+                    asset_id__in={asset_id for asset_id, _ in rows}, content_type=content_types[model],
+                    object_id__in={number for _, number in rows}, claimed_at=now,
+                ).values_list('pk', 'content_type_id', 'asset_id', 'object_id')
+                if tuple(key) in keys
+            )
+        return SubAssetExpiry.objects.filter(pk__in=pks)
+
+    if published:
+        claims(expired[:len(published)]).delete()
+    if dropped:
+        # the sub-assets stay deactivated; their commands are retried by process_due_expiries()
+        claims(expired[len(published):]).update(claimed_at=None)
+        logger.warning(f"MQTT publish queue is full, postponed {len(dropped)} expiry commands")
+
+    return len(expired)
+
+
+def _sub_asset_key(sub_asset):
+    # AssetEvent-style key: the parent asset_number and the room/vehicle number
+    if hasattr(sub_asset, 'room_number'):
+        return sub_asset.hotel_id, sub_asset.room_number
+    return sub_asset.fleet_id, sub_asset.vehicle_number
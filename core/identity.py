@@ -0,0 +1,127 @@
+"""
+Identity of the system user that internal jobs and devices act as.
+
+The user is kept in memory for at most SYSTEM_IDENTITY_CACHE_TTL seconds; its token is signed
+with a short lifetime (SYSTEM_TOKEN_LIFETIME) and shared with other processes through the Django
+cache (Redis when CACHE_REDIS_URL is set). A new token is signed SYSTEM_TOKEN_REFRESH_MARGIN
+seconds before the current one expires, so callers never get a token that is about to be
+rejected. Both are tagged with a version in the shared cache, bumped by the receivers in
+core/signals.py whenever the system user is saved or deleted, so a user deactivated or renamed in
+one process is reloaded by all the others on their next read. Without a shared cache
+(SHARED_CACHE) the bumps of other processes are invisible, so the user is read on every call.
+is_system_user() is a plain attribute check.
+"""
+import copy
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+SYSTEM_USERNAME = 'info@trykey.com'
+
+TOKEN_CACHE_KEY = 'system_identity:token'
+VERSION_CACHE_KEY = 'system_identity:version'
+
+
+class SystemIdentity:
+    def __init__(self, username=SYSTEM_USERNAME, user_ttl=300, token_lifetime=900, refresh_margin=60):
+        if refresh_margin >= token_lifetime:
+            raise ValueError("refresh_margin must be shorter than token_lifetime")
+
+        self.username = username
+        self.user_ttl = user_ttl
+        self.token_lifetime = token_lifetime
+        self.refresh_margin = refresh_margin
+        self._user = None
+        self._user_expires = 0.0
+        self._user_version = None
+        self._token = None
+        self._token_expires = 0.0  # epoch seconds
+        self._token_version = None
+        self._lock = threading.Lock()
+
+    def is_system_user(self, user):
+        return user is not None and getattr(user, 'is_authenticated', False) and user.username == self.username
+
+    def get_user(self):
+        """
+        The system user; raises User.DoesNotExist if it has not been created.
+        """
+        if not settings.SHARED_CACHE:
+            return get_user_model().objects.get(username=self.username)
+
+        # read before the user, so a change committed in between leaves the copy outdated
+        version = self.version()
+        with self._lock:
+            if self._user is None or self._user_version != version or self._user_expires <= time.monotonic():
+                self._user = get_user_model().objects.get(username=self.username)
+                self._user_expires = time.monotonic() + self.user_ttl
+                self._user_version = version
+            # callers may modify the instance they get (e.g. request.user)
+            return copy.copy(self._user)
+
+    def get_token(self):
+        """
+        A signed access token for the system user, valid for at least refresh_margin seconds.
+        """
+        version = self.version()
+        with self._lock:
+            if (self._token is not None and self._token_version == version
+                    and self._token_expires - self.refresh_margin > time.time()):
+                return self._token
+
+        cached = cache.get(TOKEN_CACHE_KEY)
+        if cached is not None and cached[2] == version and cached[1] - self.refresh_margin > time.time():
+            token, expires, _ = cached
+        else:
+            token = AccessToken.for_user(self.get_user())
+            token.set_exp(lifetime=timedelta(seconds=self.token_lifetime))
+            token, expires = str(token), token['exp']
+            cache.set(TOKEN_CACHE_KEY, (token, expires, version), timeout=self.token_lifetime - self.refresh_margin)
+
+        with self._lock:
+            self._token, self._token_expires, self._token_version = token, expires, version
+        return token
+
+    def version(self):
+        """
+        Version of the system user in the Django cache; a missing one starts at a random value,
+        so an evicted counter can never match a copy loaded before the eviction.
+        """
+        version = cache.get(VERSION_CACHE_KEY)
+        if version is None:
+            # another process may have set it first, keep theirs
+            cache.add(VERSION_CACHE_KEY, random.getrandbits(48), timeout=None)
+            version = cache.get(VERSION_CACHE_KEY)
+        return version
+
+    def invalidate(self):
+        """
+        Forget the cached user and token in every process, e.g. after the system user was changed.
+        """
+        with self._lock:
+            self._user = None
+            self._token = None
+            self._token_expires = 0.0
+        try:
+            cache.incr(VERSION_CACHE_KEY)
+        except ValueError:  # missing or evicted
+            cache.add(VERSION_CACHE_KEY, random.getrandbits(48), timeout=None)
+        cache.delete(TOKEN_CACHE_KEY)
+
+
+system_identity = SystemIdentity(
+    user_ttl=settings.SYSTEM_IDENTITY_CACHE_TTL,
+    token_lifetime=settings.SYSTEM_TOKEN_LIFETIME,
+    refresh_margin=settings.SYSTEM_TOKEN_REFRESH_MARGIN,
+)
+
+
+def is_system_user(user):
+    return system_identity.is_system_user(user)
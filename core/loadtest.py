@@ -0,0 +1,305 @@
+"""
+Synthetic production-scale data and the endpoint benchmark that runs against it.
+
+seed_load_data() creates users, hotels and fleets with their rooms, vehicles and roles, then
+AssetEvents and Transactions in arrival order, and finally the rollups and sub-asset states the
+dashboards read. Assets, transactions and users are named with LOAD_PREFIX so the dataset can be
+told apart from real rows and removed with clear_load_data(). The dataset only depends on the
+arguments, including `seed` and `until`: rows created from Python come from random.Random(seed),
+events and transactions are generated by PostgreSQL after setseed().
+
+benchmark_endpoints() requests the key API endpoints as one of the seeded users and returns, per
+endpoint, the status code, the number of queries and the response times.
+"""
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Asset, AssetEvent, HotelRoom, Role, Transaction, User, Vehicle
+
+
+LOAD_PREFIX = 'LT-'
+USER_DOMAIN = 'loadtest.invalid'
+
+# share of the events of a room / vehicle per event type
+HOTEL_EVENT_MIX = {'occupancy': 0.4, 'access': 0.3, 'electricity': 0.3}
+VEHICLE_EVENT_MIX = {'location': 0.7, 'ignition': 0.2, 'passenger_count': 0.1}
+
+
+def seed_load_data(users=200, assets_per_user=3, hotel_share=0.5, rooms_per_hotel=40, vehicles_per_fleet=25,
+                   members_per_asset=2, active_share=0.3, events=1_000_000, transactions=100_000, completed_share=0.8,
+                   days=90, skew=1.0, seed=0, until=None, rollups=True, log=None):
+    """
+    Create the dataset and return the number of rows created per model.
+
+    Counts per user and per asset are drawn uniformly around the given means. Each event and
+    transaction belongs to a random room or vehicle; with skew > 1 they concentrate on the first
+    sub-assets (a share x of the sub-assets gets a share x ** (1 / skew) of the rows).
+    """
+    log = log or (lambda message: None)
+    rng = random.Random(seed)
+    until = until or timezone.now().replace(minute=0, second=0, microsecond=0)
+
+    with transaction.atomic():
+        # the benchmark authenticates them directly, nobody can log in as a seeded user
+        password = make_password(None)
+        user_rows = User.objects.bulk_create([
+            User(username=f'lt{i:06}@{USER_DOMAIN}', email=f'lt{i:06}@{USER_DOMAIN}', password=password,
+                 first_name='Load', last_name=f'Test {i}', date_joined=until - timedelta(days=days))
+            for i in range(users)
+        ], batch_size=1000)
+
+        asset_rows, roles = [], []
+        for user in user_rows:
+            for _ in range(rng.randint(1, 2 * assets_per_user - 1)):
+                number = f'{LOAD_PREFIX}{len(asset_rows):06}'
+                hotel = rng.random() < hotel_share
+                asset_rows.append(Asset(
+                    asset_number=number, asset_type='hotel' if hotel else 'vehicle', asset_name=f'Load test {number}',
+                    location=rng.choice(['Lagos', 'Abuja', 'Kano', 'Ibadan', 'Port Harcourt']),
+                    details={'stars': rng.randint(1, 5)} if hotel else {'make': rng.choice(['Toyota', 'Honda', 'Kia'])},
+                    account_number=f'{rng.randrange(10 ** 10):010}', bank='Load Test Bank',
+                ))
+                roles.append(Role(user=user, asset_id=number, role='admin'))
+                for member in rng.sample(user_rows, min(rng.randint(0, 2 * members_per_asset), len(user_rows))):
+                    if member is not user:
+                        roles.append(Role(user=member, asset_id=number, role=rng.choice(['manager', 'viewer'])))
+        Asset.objects.bulk_create(asset_rows, batch_size=1000)
+        Role.objects.bulk_create(roles, batch_size=5000, ignore_conflicts=True)
+
+        rooms, vehicles = [], []
+        for asset in asset_rows:
+            hotel = asset.asset_type == 'hotel'
+            for index in range(rng.randint(1, 2 * (rooms_per_hotel if hotel else vehicles_per_fleet) - 1)):
+                active = rng.random() < active_share
+                session = {
+                    'status': active,
+                    'activation_timestamp': until - timedelta(hours=rng.randint(1, 48)) if active else None,
+                    'expiry_timestamp': until + timedelta(hours=rng.randint(1, 72)) if active else None,
+                }
+                if hotel:
+                    rooms.append(HotelRoom(
+                        hotel_id=asset.asset_number, room_number=str(100 + index), price=rng.choice([80, 120, 200, 350]),
+                        room_type=rng.choice(['Standard', 'Deluxe', 'Suite']), **session
+                    ))
+                else:
+                    vehicles.append(Vehicle(
+                        fleet_id=asset.asset_number, vehicle_number=f'V{index:03}', brand=rng.choice(['Toyota', 'Honda', 'Kia']),
+                        vehicle_type=rng.choice(['Sedan', 'Bus', 'Truck']), last_latitude=6.5, last_longitude=3.4, **session
+                    ))
+        HotelRoom.objects.bulk_create(rooms, batch_size=5000)
+        Vehicle.objects.bulk_create(vehicles, batch_size=5000)
+    log(f"Created {len(user_rows)} users, {len(asset_rows)} assets, {len(roles)} roles, {len(rooms)} rooms and {len(vehicles)} vehicles")
+
+    with connection.cursor() as cursor:
+        _create_sub_asset_table(cursor)
+        cursor.execute("SELECT setseed(%s)", [rng.random() * 2 - 1])
+        for start in range(0, events, 1_000_000):
+            _insert_events(cursor, start, min(start + 1_000_000, events), events, until, days, skew)
+            log(f"Created {min(start + 1_000_000, events)}/{events} events")
+        for start in range(0, transactions, 1_000_000):
+            _insert_transactions(cursor, start, min(start + 1_000_000, transactions), transactions, until, days, skew, completed_share)
+            log(f"Created {min(start + 1_000_000, transactions)}/{transactions} transactions")
+        cursor.execute(
+            "UPDATE core_asset a SET total_revenue = t.total FROM ("
+            "SELECT asset_id, sum(amount) AS total FROM core_transaction "
+            "WHERE asset_id LIKE %s AND payment_status = 'completed' GROUP BY asset_id) t WHERE a.asset_number = t.asset_id",
+            [f'{LOAD_PREFIX}%']
+        )
+        cursor.execute("DROP TABLE loadtest_sub_assets")
+        cursor.execute(f"ANALYZE {AssetEvent._meta.db_table}")
+        cursor.execute(f"ANALYZE {Transaction._meta.db_table}")
+
+    if rollups:
+        call_command('backfill_rollups', start=timezone.localdate(until - timedelta(days=days)), end=timezone.localdate(until),
+                     chunk_days=7, stdout=_Discard())
+        call_command('backfill_sub_asset_state', batch_size=5000, stdout=_Discard())
+        log("Rebuilt the daily rollups and sub-asset states")
+
+    return {
+        'users': len(user_rows), 'assets': len(asset_rows), 'roles': len(roles), 'rooms': len(rooms),
+        'vehicles': len(vehicles), 'events': events, 'transactions': transactions,
+    }
+
+
+def clear_load_data():
+    """
+    Delete everything created by seed_load_data(), bulk deleting the large tables first.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {AssetEvent._meta.db_table} WHERE asset_id LIKE %s", [f'{LOAD_PREFIX}%'])
+        cursor.execute(f"DELETE FROM {Transaction._meta.db_table} WHERE asset_id LIKE %s", [f'{LOAD_PREFIX}%'])
+    Asset.objects.filter(asset_number__startswith=LOAD_PREFIX).delete()
+    User.objects.filter(email__endswith=f'@{USER_DOMAIN}').delete()
+
+
+def _create_sub_asset_table(cursor):
+    # every seeded room and vehicle, numbered from 1, for the generators to pick from
+    cursor.execute(
+        "CREATE TEMPORARY TABLE loadtest_sub_assets AS "
+        "SELECT row_number() OVER (ORDER BY hotel DESC, asset_id, object_id) AS n, * FROM ("
+        "SELECT hotel_id AS asset_id, %s AS content_type_id, room_number AS object_id, true AS hotel, price "
+        "FROM core_hotelroom WHERE hotel_id LIKE %s "
+        "UNION ALL SELECT fleet_id, %s, vehicle_number, false, NULL FROM core_vehicle WHERE fleet_id LIKE %s) s",
+        [ContentType.objects.get_for_model(HotelRoom).pk, f'{LOAD_PREFIX}%',
+         ContentType.objects.get_for_model(Vehicle).pk, f'{LOAD_PREFIX}%']
+    )
+    cursor.execute("CREATE UNIQUE INDEX ON loadtest_sub_assets (n)")
+    cursor.execute("ANALYZE loadtest_sub_assets")
+
+
+def _mix_case(column, mix):
+    # CASE picking a key of `mix` by its cumulative share
+    cases, total = [], 0.0
+    for key, share in list(mix.items())[:-1]:
+        total += share
+        cases.append(f"WHEN {column} < {total} THEN '{key}'")
+    return f"CASE {' '.join(cases)} ELSE '{list(mix)[-1]}' END"
+
+
+def _generated_rows(sql, cursor, start, end, count, until, days, skew, **params):
+    # row g of `count` gets a random sub-asset s, random numbers r1..r3 and a timestamp growing with g
+    cursor.execute(
+        f"""
+        WITH rows AS MATERIALIZED (
+            SELECT g, floor(power(random(), %(skew)s) * (SELECT count(*) FROM loadtest_sub_assets))::bigint + 1 AS n,
+                   random() AS r1, random() AS r2, random() AS r3,
+                   %(until)s::timestamptz - make_interval(secs => %(seconds)s * (%(count)s - g)::float / %(count)s) AS ts
+            FROM generate_series(%(start)s, %(end)s) g
+        )
+        {sql}
+        """,
+        {'skew': skew, 'until': until, 'seconds': days * 86400, 'count': count, 'start': start, 'end': end - 1, **params}
+    )
+
+
+def _insert_events(cursor, start, end, count, until, days, skew):
+    _generated_rows(
+        f"""
+        INSERT INTO {AssetEvent._meta.db_table} (asset_id, content_type_id, object_id, event_type, data, timestamp)
+        SELECT asset_id, content_type_id, object_id, event_type,
+               CASE event_type
+                   WHEN 'occupancy' THEN (r2 < 0.5)::int::text
+                   WHEN 'access' THEN CASE WHEN r2 < 0.5 THEN 'unlock' ELSE 'lock' END
+                   WHEN 'electricity' THEN CASE WHEN r2 < 0.5 THEN 'on' ELSE 'off' END
+                   WHEN 'ignition' THEN CASE WHEN r2 < 0.5 THEN 'turn_on' ELSE 'turn_off' END
+                   WHEN 'passenger_count' THEN floor(r2 * 15)::int::text
+                   ELSE concat_ws(',', round((6.4 + r2 / 5)::numeric, 6), round((3.3 + r3 / 5)::numeric, 6))
+               END,
+               ts
+        FROM (
+            SELECT s.*, rows.*,
+                   CASE WHEN s.hotel THEN {_mix_case('r1', HOTEL_EVENT_MIX)} ELSE {_mix_case('r1', VEHICLE_EVENT_MIX)} END AS event_type
+            FROM rows JOIN loadtest_sub_assets s USING (n)
+        ) e
+        ORDER BY g
+        """,
+        cursor, start, end, count, until, days, skew
+    )
+
+
+def _insert_transactions(cursor, start, end, count, until, days, skew, completed_share):
+    failed_share = (1 - completed_share) / 3
+    _generated_rows(
+        f"""
+        INSERT INTO {Transaction._meta.db_table} (
+            name, email, amount, currency, asset_id, sub_asset_number, transaction_ref, payment_status, payment_type,
+            is_outgoing, is_verified, timestamp, updated_at
+        )
+        SELECT 'Guest ' || g, 'guest' || g || '@{USER_DOMAIN}',
+               CASE WHEN hotel THEN price * (1 + floor(r3 * 4)) ELSE round((20 + r3 * 480)::numeric, 2) END,
+               'NGN', asset_id, object_id, %(prefix)s || g, status,
+               (ARRAY['card', 'transfer', 'mobile_money'])[1 + floor(r2 * 3)::int],
+               false, status = 'completed', ts, ts
+        FROM (
+            SELECT rows.*, s.*,
+                   CASE WHEN r1 < %(completed)s THEN 'completed' WHEN r1 < %(completed)s + %(failed)s THEN 'failed'
+                        WHEN r1 < %(completed)s + 2 * %(failed)s THEN 'canceled' ELSE 'pending' END AS status
+            FROM rows JOIN loadtest_sub_assets s USING (n)
+        ) t
+        ORDER BY g
+        """,
+        cursor, start, end, count, until, days, skew,
+        prefix=LOAD_PREFIX, completed=completed_share, failed=failed_share
+    )
+
+
+class _Discard:
+    def write(self, *args, **kwargs):
+        pass
+
+    def flush(self):
+        pass
+
+
+def load_test_user():
+    """
+    The seeded user with the most assets.
+    """
+    return (
+        User.objects.filter(email__endswith=f'@{USER_DOMAIN}')
+        .annotate(assets=Count('roles')).order_by('-assets', 'id').first()
+    )
+
+
+def benchmark_endpoints(user, runs=5):
+    """
+    Request each endpoint `runs` times as `user` and time it. Results are keyed by endpoint name;
+    `queries` is the query count of the last (warm) request, `cold_queries` that of the first.
+    """
+    assets = Asset.objects.filter(roles__user=user).order_by('asset_number')
+    hotel = assets.filter(asset_type='hotel').first()
+    fleet = assets.filter(asset_type='vehicle').first()
+    if hotel is None or fleet is None:
+        raise ValueError(f"{user} needs a hotel and a fleet to benchmark the endpoints")
+    room = hotel.rooms.order_by('room_number').first()
+    vehicle = fleet.fleet.order_by('vehicle_number').first()
+
+    endpoints = {
+        'asset_list': reverse('asset-list'),
+        'hotel_status': reverse('check-asset-status', args=[hotel.asset_number]) + '?days=7',
+        'fleet_status': reverse('check-asset-status', args=[fleet.asset_number]) + '?days=7',
+        'room_status': reverse('check_sub_asset_status', args=[hotel.asset_number, room.room_number]),
+        'vehicle_status': reverse('check_sub_asset_status', args=[fleet.asset_number, vehicle.vehicle_number]),
+        'index_stats': reverse('user-asset-statistics'),
+        'transaction_history': reverse('asset-transaction-history', args=[hotel.asset_number]),
+        'user_data': reverse('user-data') + '?limit=100',
+    }
+
+    client = APIClient(SERVER_NAME='localhost')
+    client.force_authenticate(user)
+    results = {}
+    for name, url in endpoints.items():
+        timings, query_counts = [], []
+        for _ in range(runs):
+            with CaptureQueriesContext(connection) as queries:
+                started_at = time.perf_counter()
+                response = client.get(url)
+                body = b''.join(response.streaming_content) if response.streaming else response.content
+                timings.append((time.perf_counter() - started_at) * 1000)
+            query_counts.append(len(queries))
+
+        timings.sort()
+        results[name] = {
+            'url': url,
+            'status': response.status_code,
+            'bytes': len(body),
+            'queries': query_counts[-1],
+            'cold_queries': query_counts[0],
+            'min_ms': round(timings[0], 2),
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(timings[min(len(timings) - 1, round(0.95 * (len(timings) - 1)))], 2),
+            'max_ms': round(timings[-1], 2),
+        }
+    return results
@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.rollups import backfill_daily_rollups, oldest_day
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily asset and sub-asset rollups of past days from transactions and events. Dashboards read "
+        "closed days from the rollups only: run it after deploying them (the first update_daily_rollups run does "
+        "it when there are no rollups at all) and after celery beat was stopped for more than a day."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help="First day (YYYY-MM-DD), defaults to the oldest record.")
+        parser.add_argument('--end', type=date.fromisoformat, help="Last day (YYYY-MM-DD), defaults to today.")
+        parser.add_argument('--chunk-days', type=int, default=31, help="Days rebuilt per transaction.")
+
+    def handle(self, *args, **options):
+        end = options['end'] or timezone.localdate()
+        start = options['start'] or oldest_day()
+        if start is None:
+            self.stdout.write("Nothing to backfill.")
+            return
+        if start > end:
+            raise CommandError("--start must not be after --end")
+        if options['chunk_days'] < 1:
+            raise CommandError("--chunk-days must be positive")
+
+        written = 0
+        for first_day, last_day, chunk_written in backfill_daily_rollups(start, end, options['chunk_days']):
+            written += chunk_written
+            self.stdout.write(f"Rebuilt {first_day} to {last_day}")
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} daily asset rollups between {start} and {end}."))
+
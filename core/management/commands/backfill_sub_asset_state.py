@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from core.models import AssetEvent, SubAssetState
+
+
+class Command(BaseCommand):
+    help = "Rebuild SubAssetState from the latest AssetEvent of each sub-asset and event type."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--asset', help="Only rebuild the state of this asset (asset number).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        key = ['asset', 'content_type', 'object_id', 'event_type']
+        events = AssetEvent.objects.filter(asset__isnull=False)
+        if options['asset']:
+            events = events.filter(asset_id=options['asset'])
+        # DISTINCT ON keeps the first row of each key, i.e. the most recent event
+        latest = events.order_by(*key, '-timestamp', '-id').distinct(*key)
+
+        batch, recorded = [], 0
+        for event in latest.iterator(chunk_size=options['batch_size']):
+            batch.append(event)
+            if len(batch) >= options['batch_size']:
+                recorded += SubAssetState.record(batch)
+                batch = []
+        recorded += SubAssetState.record(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Recorded the state of {recorded} sub-asset event types."))
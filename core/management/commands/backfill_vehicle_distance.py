@@ -0,0 +1,91 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import AssetEvent, Vehicle
+from utils.geo import METHODS, track_distances
+
+
+class Command(BaseCommand):
+    help = "Recompute total_distance and the last position of vehicles from their stored location events."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fleet', help="Only backfill vehicles of this fleet (asset number).")
+        parser.add_argument('--method', choices=METHODS, default='ellipsoidal')
+        parser.add_argument('--chunk-size', type=int, default=50000, help="Location events processed per batch.")
+        parser.add_argument('--dry-run', action='store_true', help="Print the recomputed distances without saving them.")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        vehicles = Vehicle.objects.all()
+        events = AssetEvent.objects.filter(
+            content_type=ContentType.objects.get_for_model(Vehicle),
+            event_type='location'
+        )
+        if options['fleet']:
+            vehicles = vehicles.filter(fleet_id=options['fleet'])
+            events = events.filter(asset_id=options['fleet'])
+
+        # location events reference vehicles by (fleet, vehicle_number)
+        vehicle_ids = {
+            (fleet_id, vehicle_number): pk
+            for pk, fleet_id, vehicle_number in vehicles.values_list('pk', 'fleet_id', 'vehicle_number')
+        }
+
+        totals = {}  # vehicle pk -> (distance, last latitude, last longitude)
+        chunk, skipped = [], 0
+        rows = events.order_by('asset_id', 'object_id', 'timestamp', 'id').values_list('asset_id', 'object_id', 'data')
+        for asset_number, object_id, data in rows.iterator(chunk_size=options['chunk_size']):
+            vehicle_id = vehicle_ids.get((asset_number, object_id))
+            try:
+                latitude, longitude = map(float, data.split(','))
+            except ValueError:
+                vehicle_id = None
+            if vehicle_id is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                skipped += 1
+                continue
+
+            chunk.append((vehicle_id, latitude, longitude))
+            if len(chunk) >= options['chunk_size']:
+                self.integrate(totals, chunk, options['method'])
+                chunk = []
+        self.integrate(totals, chunk, options['method'])
+
+        updates = [
+            Vehicle(pk=vehicle_id, total_distance=distance, last_latitude=latitude, last_longitude=longitude)
+            for vehicle_id, (distance, latitude, longitude) in totals.items()
+        ]
+        if options['dry_run']:
+            for vehicle in updates:
+                self.stdout.write(f"vehicle {vehicle.pk}: {vehicle.total_distance:.3f} km")
+        else:
+            Vehicle.objects.bulk_update(updates, ['total_distance', 'last_latitude', 'last_longitude'], batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Computed' if options['dry_run'] else 'Updated'} distance of {len(updates)} vehicles "
+            f"({skipped} invalid or orphaned location events skipped)."
+        ))
+
+    def integrate(self, totals, chunk, method):
+        """
+        Add the distances of a chunk of fixes to `totals`, continuing each track from the
+        last point of the previous chunk.
+        """
+        if not chunk:
+            return
+        track_ids, latitudes, longitudes = [], [], []
+        for vehicle_id in {fix[0] for fix in chunk}:
+            if vehicle_id in totals:
+                _, latitude, longitude = totals[vehicle_id]
+                track_ids.append(vehicle_id)
+                latitudes.append(latitude)
+                longitudes.append(longitude)
+        for vehicle_id, latitude, longitude in chunk:
+            track_ids.append(vehicle_id)
+            latitudes.append(latitude)
+            longitudes.append(longitude)
+
+        for vehicle_id, (distance, latitude, longitude) in track_distances(track_ids, latitudes, longitudes, method).items():
+            previous = totals.get(vehicle_id, (0.0,))[0]
+            totals[vehicle_id] = (previous + distance, latitude, longitude)
@@ -0,0 +1,62 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from geopy.distance import geodesic
+
+from utils.geo import METHODS, track_distances
+
+
+class Command(BaseCommand):
+    help = "Benchmark per-point geopy geodesic() against the vectorised distance helpers in utils/geo.py."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vehicles', type=int, default=100)
+        parser.add_argument('--points', type=int, default=200, help="GPS fixes per vehicle.")
+        parser.add_argument('--step-km', type=float, default=0.2, help="Typical distance between consecutive fixes.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        track_ids, latitudes, longitudes = self.random_tracks(
+            options['vehicles'], options['points'], options['step_km'], options['seed']
+        )
+        fixes = track_ids.size
+        self.stdout.write(f"{options['vehicles']} vehicles x {options['points']} fixes = {fixes} fixes")
+
+        # current path: one geodesic() per consecutive pair, as Vehicle.update_location used to do
+        started_at = time.perf_counter()
+        reference = {}
+        previous = {}
+        for vehicle_id, latitude, longitude in zip(track_ids.tolist(), latitudes.tolist(), longitudes.tolist()):
+            if vehicle_id in previous:
+                reference[vehicle_id] = reference.get(vehicle_id, 0.0) + geodesic(previous[vehicle_id], (latitude, longitude)).kilometers
+            previous[vehicle_id] = (latitude, longitude)
+        baseline = time.perf_counter() - started_at
+        self.stdout.write(f"geodesic (per point): {baseline * 1000:9.1f} ms  {fixes / baseline:12.0f} fixes/s")
+
+        expected = np.array([reference[vehicle_id] for vehicle_id in sorted(reference)])
+        for method in METHODS:
+            started_at = time.perf_counter()
+            result = track_distances(track_ids, latitudes, longitudes, method)
+            elapsed = time.perf_counter() - started_at
+
+            computed = np.array([result[vehicle_id][0] for vehicle_id in sorted(reference)])
+            error = np.max(np.abs(computed - expected) / expected)
+            self.stdout.write(
+                f"{method + ' (batch)':21} {elapsed * 1000:9.1f} ms  {fixes / elapsed:12.0f} fixes/s  "
+                f"x{baseline / elapsed:7.1f}  max relative error {error:.2e}"
+            )
+
+    def random_tracks(self, vehicles, points, step_km, seed):
+        """
+        Random walks starting anywhere within ±70° latitude, interleaved like live traffic.
+        """
+        rng = np.random.default_rng(seed)
+        start_lat = rng.uniform(-70, 70, vehicles)
+        start_lon = rng.uniform(-180, 180, vehicles)
+        step_deg = step_km / 111.0
+        latitudes = start_lat + np.cumsum(rng.normal(0, step_deg, (points, vehicles)), axis=0)
+        longitudes = start_lon + np.cumsum(rng.normal(0, step_deg, (points, vehicles)), axis=0) / np.cos(np.radians(start_lat))
+        longitudes = (longitudes + 180.0) % 360.0 - 180.0
+        track_ids = np.tile(np.arange(vehicles), points)
+        return track_ids, latitudes.ravel(), longitudes.ravel()
@@ -0,0 +1,75 @@
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.loadtest import benchmark_endpoints, load_test_user
+from core.models import AssetEvent, Transaction, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the key API endpoints and count their queries as a user of the seed_load_data dataset. "
+        "Write the results with --output and compare them with the file of an earlier commit with --compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Email of the user to request the endpoints as (default: the seeded user with the most assets).")
+        parser.add_argument('--runs', type=int, default=5, help="Requests per endpoint.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="JSON file of an earlier run to compare the results with.")
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError("--runs must be positive")
+        user = User.objects.filter(email=options['user']).first() if options['user'] else load_test_user()
+        if user is None:
+            raise CommandError("No user to benchmark as, generate a dataset with seed_load_data first")
+
+        try:
+            results = benchmark_endpoints(user, options['runs'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"{'endpoint':20} {'status':>6} {'queries':>7} {'p50 ms':>9} {'p95 ms':>9} {'bytes':>9}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:20} {result['status']:6} {result['queries']:7} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f} {result['bytes']:9}"
+            )
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                before = json.load(f)
+            self.stdout.write(f"Compared with {before.get('commit') or options['compare']}:")
+            for name, result in results.items():
+                previous = before['endpoints'].get(name)
+                if previous:
+                    self.stdout.write(
+                        f"{name:20} queries {previous['queries']:4} -> {result['queries']:4}  "
+                        f"p50 {previous['p50_ms']:9.2f} -> {result['p50_ms']:9.2f} ms  x{previous['p50_ms'] / max(result['p50_ms'], 0.01):.1f}"
+                    )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'commit': self.commit(),
+                    'run_at': timezone.now().isoformat(),
+                    'user': user.email,
+                    'runs': options['runs'],
+                    'dataset': {
+                        'users': User.objects.count(),
+                        'events': AssetEvent.objects.count(),
+                        'transactions': Transaction.objects.count(),
+                    },
+                    'endpoints': results,
+                }, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,219 @@
+import json
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models import Asset, AssetEvent, HotelRoom, Vehicle
+
+
+TABLE = AssetEvent._meta.db_table
+BENCH_PREFIX = 'BENCH'
+
+
+def hot_queries(hotel, fleet, now):
+    """
+    The AssetEvent queries the indexes are tuned for, as issued by the views and rollups.
+    """
+    today = timezone.make_aware(datetime.combine(timezone.localdate(now), dt_time.min))
+    room_type = ContentType.objects.get_for_model(HotelRoom)
+    vehicle_type = ContentType.objects.get_for_model(Vehicle)
+    room = AssetEvent.objects.filter(asset=hotel, content_type=room_type).values_list('object_id', flat=True).first()
+
+    return {
+        # CheckAssetStatusView.get_hotel_data
+        'hotel_occupied_today': AssetEvent.objects.filter(
+            asset=hotel, event_type='occupancy', timestamp__gte=today, data='1'
+        ).order_by().values_list('object_id', flat=True).distinct(),
+        # CheckAssetStatusView.get_vehicle_data
+        'vehicles_in_use_today': AssetEvent.objects.filter(
+            asset=fleet, content_type=vehicle_type, timestamp__gte=today
+        ).order_by().values('object_id').distinct(),
+        # event history of one sub-asset
+        'sub_asset_history': AssetEvent.objects.filter(
+            asset=hotel, content_type=room_type, object_id=room, event_type='access'
+        ).order_by('-timestamp')[:50],
+        # core.rollups.compute_daily_rollups
+        'daily_activity': AssetEvent.objects.filter(
+            asset__isnull=False, timestamp__gte=today - timedelta(days=1), timestamp__lt=today
+        ).annotate(date=TruncDate('timestamp')).values(
+            'asset_id', 'content_type_id', 'object_id', 'date'
+        ).annotate(events=Count('id'), occupancy=Count('id', filter=Q(event_type='occupancy', data='1'))),
+    }
+
+
+def plan_indexes(plan):
+    indexes = {plan['Index Name']} if 'Index Name' in plan else set()
+    for child in plan.get('Plans', []):
+        indexes |= plan_indexes(child)
+    return indexes
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN (ANALYZE, BUFFERS) on the hot AssetEvent queries and save the plans. Seed a scratch database "
+        "with --seed-events, then compare runs with and without the indexes: "
+        "create_event_indexes --drop; bench_event_queries --output before.json; create_event_indexes; "
+        "bench_event_queries --output after.json --compare before.json"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-events', type=int, default=0,
+                            help=f"First insert this many synthetic events for {BENCH_PREFIX}* hotels and fleets.")
+        parser.add_argument('--assets', type=int, default=100, help="Seeded hotels and fleets (each).")
+        parser.add_argument('--sub-assets', type=int, default=50, help="Rooms or vehicles per seeded asset.")
+        parser.add_argument('--days', type=int, default=90, help="Seeded events are spread over this many days up to now.")
+        parser.add_argument('--hotel', help="Hotel to query (default: the first seeded one, else the first hotel).")
+        parser.add_argument('--fleet', help="Fleet to query (default: the first seeded one, else the first fleet).")
+        parser.add_argument('--runs', type=int, default=3, help="Keep the fastest of this many executions of each query.")
+        parser.add_argument('--output', help="Write the plans and timings to this JSON file.")
+        parser.add_argument('--compare', help="JSON file of an earlier run to compare the timings with.")
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError("--runs must be positive")
+        if options['seed_events']:
+            self.seed(options['seed_events'], options['assets'], options['sub_assets'], options['days'])
+
+        hotel = self.asset('hotel', options['hotel'])
+        fleet = self.asset('vehicle', options['fleet'])
+        events, = self.fetch(f"SELECT count(*) FROM {TABLE}")[0]
+        indexes = sorted(name for name, in self.fetch(
+            "SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = to_regclass(%s)", [TABLE]
+        ))
+        self.stdout.write(f"{events} events, indexes: {', '.join(indexes) or 'none'}")
+
+        results = {}
+        for name, queryset in hot_queries(hotel, fleet, timezone.now()).items():
+            results[name] = self.explain(queryset, options['runs'])
+            self.stdout.write(
+                f"{name:24} {results[name]['execution_ms']:10.2f} ms  {results[name]['node']:24} "
+                f"{', '.join(results[name]['indexes']) or 'no index'}"
+            )
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                before = json.load(f)['queries']
+            for name, result in results.items():
+                if name in before:
+                    previous = before[name]['execution_ms']
+                    self.stdout.write(
+                        f"{name:24} {previous:10.2f} ms -> {result['execution_ms']:10.2f} ms  "
+                        f"x{previous / max(result['execution_ms'], 0.001):.1f}"
+                    )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'events': events, 'indexes': indexes, 'hotel': hotel.asset_number, 'fleet': fleet.asset_number,
+                    'queries': results,
+                }, f, indent=2, default=str)
+            self.stdout.write(self.style.SUCCESS(f"Plans written to {options['output']}"))
+
+    def fetch(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def asset(self, asset_type, asset_number):
+        assets = Asset.objects.filter(asset_type=asset_type)
+        if asset_number:
+            assets = assets.filter(asset_number=asset_number)
+        asset = assets.filter(asset_number__startswith=BENCH_PREFIX).order_by('asset_number').first() \
+            or assets.order_by('asset_number').first()
+        if asset is None:
+            raise CommandError(f"No {asset_type} asset to query, seed some events with --seed-events")
+        return asset
+
+    def explain(self, queryset, runs):
+        sql, params = queryset.query.sql_with_params()
+        best = None
+        for _ in range(runs):
+            plan, = self.fetch(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)[0]
+            plan = json.loads(plan)[0] if isinstance(plan, str) else plan[0]
+            if best is None or plan['Execution Time'] < best['Execution Time']:
+                best = plan
+        return {
+            'execution_ms': best['Execution Time'],
+            'planning_ms': best['Planning Time'],
+            'node': best['Plan']['Node Type'],
+            'indexes': self.root_indexes(plan_indexes(best['Plan'])),
+            'shared_hit_blocks': best['Plan'].get('Shared Hit Blocks'),
+            'shared_read_blocks': best['Plan'].get('Shared Read Blocks'),
+            'sql': connection.ops.compose_sql(sql, params),
+            'plan': best,
+        }
+
+    def root_indexes(self, indexes):
+        # plans of a partitioned table name the index of each partition, report the index of the table
+        return sorted({root for root, in self.fetch(
+            "WITH RECURSIVE tree AS ("
+            "SELECT oid FROM pg_class WHERE relname = ANY(%s) "
+            "UNION SELECT i.inhparent FROM tree JOIN pg_inherits i ON i.inhrelid = tree.oid) "
+            "SELECT c.relname FROM tree JOIN pg_class c ON c.oid = tree.oid "
+            "WHERE NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = tree.oid)",
+            [list(indexes)]
+        )})
+
+    def seed(self, count, assets, sub_assets, days):
+        """
+        Insert `count` events in timestamp order, as the MQTT subscriber writes them, for `assets` hotels
+        and fleets: access/electricity/occupancy events of rooms and mostly location events of vehicles.
+        """
+        hotels = [f'{BENCH_PREFIX}-H{i:04}' for i in range(assets)]
+        fleets = [f'{BENCH_PREFIX}-F{i:04}' for i in range(assets)]
+        with transaction.atomic():
+            Asset.objects.bulk_create([
+                Asset(asset_number=number, asset_type=asset_type, asset_name=number, location='Benchmark',
+                      details={}, account_number='0000000000', bank='Benchmark')
+                for numbers, asset_type in [(hotels, 'hotel'), (fleets, 'vehicle')] for number in numbers
+            ], ignore_conflicts=True)
+            HotelRoom.objects.bulk_create([
+                HotelRoom(hotel_id=hotel, room_number=f'R{i}', room_type='Standard', price=100)
+                for hotel in hotels for i in range(sub_assets)
+            ], ignore_conflicts=True, batch_size=5000)
+            Vehicle.objects.bulk_create([
+                Vehicle(fleet_id=fleet, vehicle_number=f'V{i}', brand='Benchmark', vehicle_type='Sedan')
+                for fleet in fleets for i in range(sub_assets)
+            ], ignore_conflicts=True, batch_size=5000)
+
+        room_type = ContentType.objects.get_for_model(HotelRoom).pk
+        vehicle_type = ContentType.objects.get_for_model(Vehicle).pk
+        now = timezone.now()
+        chunk_size = 1_000_000
+        started_at = time.perf_counter()
+        for start in range(0, count, chunk_size):
+            # row g: asset g % (2 * assets), hotels first; timestamps grow with g
+            self.execute_sql(
+                f"""
+                INSERT INTO {TABLE} (asset_id, content_type_id, object_id, event_type, data, timestamp)
+                SELECT
+                    CASE WHEN hotel THEN '{BENCH_PREFIX}-H' ELSE '{BENCH_PREFIX}-F' END || lpad((a %% %(assets)s)::text, 4, '0'),
+                    CASE WHEN hotel THEN %(room_type)s ELSE %(vehicle_type)s END,
+                    CASE WHEN hotel THEN 'R' ELSE 'V' END || (g / (2 * %(assets)s) %% %(sub_assets)s),
+                    CASE WHEN hotel THEN (ARRAY['access', 'electricity', 'occupancy'])[g %% 3 + 1]
+                         WHEN g %% 4 = 0 THEN 'ignition' ELSE 'location' END,
+                    CASE WHEN hotel THEN (g / 3 %% 2)::text
+                         WHEN g %% 4 = 0 THEN 'turn_on'
+                         ELSE concat_ws(',', 6.5 + random() / 10, 3.4 + random() / 10) END,
+                    %(now)s::timestamptz - make_interval(secs => %(seconds)s * (%(count)s - g)::float / %(count)s)
+                FROM generate_series(%(start)s, %(end)s) g,
+                     LATERAL (SELECT g %% (2 * %(assets)s) AS a) asset,
+                     LATERAL (SELECT a < %(assets)s AS hotel) kind
+                """,
+                {
+                    'assets': assets, 'sub_assets': sub_assets, 'room_type': room_type, 'vehicle_type': vehicle_type,
+                    'now': now, 'seconds': days * 86400, 'count': count, 'start': start, 'end': min(start + chunk_size, count) - 1,
+                }
+            )
+            self.stdout.write(f"Seeded {min(start + chunk_size, count)}/{count} events ({time.perf_counter() - started_at:.0f} s)")
+        self.execute_sql(f"ANALYZE {TABLE}")
+
+    def execute_sql(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
@@ -0,0 +1,118 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.utils import truncate_name
+
+from core.models import AssetEvent
+
+
+TABLE = AssetEvent._meta.db_table
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the indexes declared on AssetEvent without blocking event writes. CREATE INDEX CONCURRENTLY is not "
+        "supported on partitioned tables, so each index is created on the partitioned tables only (ON ONLY), built "
+        "concurrently on every partition and attached. Use it instead of the generated AddIndex migration on a "
+        "populated table, then record that migration with migrate --fake. Indexes that exist already are kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help="Indexes to build (default: every index declared on AssetEvent).")
+        parser.add_argument('--drop', action='store_true',
+                            help="Drop the indexes instead, e.g. to benchmark the queries without them (see bench_event_queries).")
+        parser.add_argument('--dry-run', action='store_true', help="Print the SQL instead of running it.")
+
+    def handle(self, *args, **options):
+        declared = {index.name: index for index in AssetEvent._meta.indexes}
+        unknown = set(options['names']) - set(declared)
+        if unknown:
+            raise CommandError(f"Unknown AssetEvent indexes: {', '.join(sorted(unknown))}")
+        indexes = [declared[name] for name in options['names']] if options['names'] else list(declared.values())
+
+        self.dry_run = options['dry_run']
+        # CONCURRENTLY cannot run in a transaction block (e.g. in tests), the indexes are then built with a lock
+        self.concurrently = self.dry_run or not connection.in_atomic_block
+        if not self.concurrently:
+            self.stderr.write("Running inside a transaction, building the indexes without CONCURRENTLY")
+        self.schema_editor = connection.schema_editor()
+
+        for index in indexes:
+            if options['drop']:
+                self.drop(index)
+            else:
+                self.build(index, TABLE, index.name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Dropped' if options['drop'] else 'Built'} {len(indexes)} indexes on {TABLE}{' (dry run)' if self.dry_run else ''}."
+        ))
+
+    def execute_sql(self, sql):
+        if self.dry_run:
+            self.stdout.write(sql + ';')
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+
+    def fetch(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def children(self, table):
+        return [
+            name for name, in self.fetch(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+                [table]
+            )
+        ]
+
+    def is_partitioned(self, table):
+        rows = self.fetch("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+        return bool(rows) and rows[0][0] == 'p'
+
+    def index_sql(self, index, table, name, concurrently=False, only=False):
+        statement = index.create_sql(AssetEvent, self.schema_editor, concurrently=concurrently)
+        statement.rename_table_references(TABLE, table)
+        statement.parts['name'] = self.schema_editor.quote_name(name)
+        statement.template = statement.template.replace(
+            '%(name)s ON %(table)s', f"IF NOT EXISTS %(name)s ON {'ONLY ' if only else ''}%(table)s"
+        )
+        return str(statement)
+
+    def build(self, index, table, name):
+        """
+        Create `name` on `table` and, when it is partitioned, on each of its partitions (named after the
+        partition), attaching them so the index becomes valid once the last partition is done.
+        """
+        valid = self.is_valid(name)
+        if valid:
+            return
+        if not self.is_partitioned(table):
+            # a concurrent build that failed leaves an invalid index behind, IF NOT EXISTS would keep it
+            if valid is False:
+                self.execute_sql(f"DROP INDEX {'CONCURRENTLY ' if self.concurrently else ''}{name}")
+            self.execute_sql(self.index_sql(index, table, name, concurrently=self.concurrently))
+            return
+
+        # the index of a partitioned table stays invalid until every partition has one attached
+        self.execute_sql(self.index_sql(index, table, name, only=True))
+        for partition in self.children(table):
+            partition_index = truncate_name(f'{partition}_{index.name}', connection.ops.max_name_length())
+            self.build(index, partition, partition_index)
+            if not self.attached(partition_index, name):
+                self.execute_sql(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}")
+
+    def is_valid(self, index):
+        rows = self.fetch("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", [index])
+        return rows[0][0] if rows else None
+
+    def attached(self, index, parent):
+        return bool(self.fetch(
+            "SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(%s) AND inhparent = to_regclass(%s)", [index, parent]
+        ))
+
+    def drop(self, index):
+        # dropping the index of a partitioned table drops those of its partitions, but not concurrently
+        concurrently = self.concurrently and not self.is_partitioned(TABLE)
+        self.execute_sql(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {index.name}")
@@ -0,0 +1,238 @@
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core import EVENT_TYPE_CHOICES, event_partitioning_config
+from core.models import AssetEvent
+
+
+TABLE = AssetEvent._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+MONTH_PARTITION = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+EVENT_TYPE = re.compile(r'^[a-z0-9_]+$')
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def literal(month):
+    return f"'{month:%Y-%m-%d} 00:00:00+00'"
+
+
+def is_partitioned():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain monthly range partitions of AssetEvent. Each month is sub-partitioned by event type so "
+        "expired event types can be detached or dropped on their own (see event_partitioning in conf.yml). "
+        "Run once with --convert to move the existing table to partitions (locks the table, stop the MQTT "
+        "subscriber first), then regularly (celery beat runs it daily) to create upcoming months and expire old ones. "
+        "Late events of removed months are stored in the default partition: they are deleted once expired with "
+        "--action drop, and kept with --action detach."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true', help="Convert the plain AssetEvent table to a partitioned one.")
+        parser.add_argument('--keep-legacy', action='store_true', help=f"With --convert, keep the old table as {TABLE}_legacy.")
+        parser.add_argument('--months-ahead', type=int, default=event_partitioning_config['months_ahead'])
+        parser.add_argument('--action', choices=['detach', 'drop'], default=event_partitioning_config['expired_action'],
+                            help="What to do with expired partitions.")
+        parser.add_argument('--dry-run', action='store_true', help="Print the SQL instead of running it.")
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.event_types = [event_type for event_type, _ in EVENT_TYPE_CHOICES]
+        for event_type in self.event_types:
+            if not EVENT_TYPE.match(event_type):
+                raise CommandError(f"Event type {event_type!r} cannot be used as a partition name")
+
+        current_month = month_start(timezone.now())
+        with transaction.atomic():
+            if not self.is_partitioned():
+                if not options['convert']:
+                    raise CommandError(f"{TABLE} is not partitioned yet, run with --convert first")
+                self.convert(current_month, options['keep_legacy'])
+            elif options['convert']:
+                self.stdout.write(f"{TABLE} is already partitioned")
+
+            created = 0
+            for offset in range(options['months_ahead'] + 1):
+                month = add_months(current_month, offset)
+                if partition_name(month) not in self.month_partitions():
+                    self.create_month(month)
+                    created += 1
+
+            expired = self.expire(current_month, options['action'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created} monthly partitions, {'dropped' if options['action'] == 'drop' else 'detached'} "
+            f"{expired} expired partitions{' (dry run)' if self.dry_run else ''}."
+        ))
+
+    def execute_sql(self, sql):
+        if self.dry_run:
+            self.stdout.write(sql + ';')
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+
+    def fetch(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def is_partitioned(self):
+        return is_partitioned()
+
+    def children(self, table):
+        return [
+            name for name, in self.fetch(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+                [table]
+            )
+        ]
+
+    def month_partitions(self):
+        if self.dry_run and not self.is_partitioned():
+            return []
+        return [name for name in self.children(TABLE) if MONTH_PARTITION.match(name)]
+
+    def create_month(self, month):
+        """
+        Create the partition of one month with a sub-partition per event type, move any rows of that
+        month out of the default partition and attach it.
+        """
+        name = partition_name(month)
+        start, end = literal(month), literal(add_months(month, 1))
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in AssetEvent._meta.concrete_fields)
+
+        self.execute_sql(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS) PARTITION BY LIST (event_type)")
+        for event_type in self.event_types:
+            self.execute_sql(f"CREATE TABLE {name}_{event_type} PARTITION OF {name} FOR VALUES IN ('{event_type}')")
+        self.execute_sql(f"CREATE TABLE {name}_default PARTITION OF {name} DEFAULT")
+        self.execute_sql(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= {start} AND timestamp < {end} "
+            f"RETURNING {columns}) INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+        )
+        self.execute_sql(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ({start}) TO ({end})")
+
+    def expire(self, current_month, action):
+        """
+        Detach or drop the sub-partitions whose whole month is older than the retention of their event type.
+        A month whose sub-partitions have all expired is removed as a whole.
+
+        Events received after their month was removed are stored in the default partition, which
+        cannot be detached: with `drop` the expired ones are deleted, with `detach` they are kept.
+        """
+        retention = event_partitioning_config['retention_months']
+        expired = 0
+        for name in self.month_partitions():
+            year, month = map(int, MONTH_PARTITION.match(name).groups())
+            end = add_months(datetime(year, month, 1, tzinfo=dt_timezone.utc), 1)
+
+            subpartitions = self.children(name)
+            to_expire = []
+            for subpartition in subpartitions:
+                event_type = subpartition[len(name) + 1:]
+                months = retention.get(event_type, retention['default'])
+                if months is not None and end <= add_months(current_month, -months):
+                    to_expire.append(subpartition)
+
+            if to_expire and len(to_expire) == len(subpartitions):
+                to_expire, parent = [name], TABLE
+            else:
+                parent = name
+            for table in to_expire:
+                self.execute_sql(f"ALTER TABLE {parent} DETACH PARTITION {table}")
+                if action == 'drop':
+                    self.execute_sql(f"DROP TABLE {table}")
+                expired += 1
+
+        if action == 'drop':
+            # late events of removed months end up in the default partition
+            for event_type in self.event_types + [None]:
+                months = retention.get(event_type, retention['default']) if event_type else retention['default']
+                if months is None:
+                    continue
+                condition = f"event_type = '{event_type}'" if event_type else \
+                    "event_type NOT IN (" + ', '.join(f"'{t}'" for t in self.event_types) + ")"
+                self.execute_sql(
+                    f"DELETE FROM {DEFAULT_PARTITION} WHERE {condition} AND timestamp < {literal(add_months(current_month, -months))}"
+                )
+        return expired
+
+    def convert(self, current_month, keep_legacy):
+        """
+        Recreate AssetEvent as a table partitioned by month and copy the existing rows into it.
+        Indexes and foreign keys of the old table are recreated on the partitioned one.
+        """
+        legacy = f'{TABLE}_legacy'
+        indexes = self.fetch(
+            "SELECT c.relname, pg_get_indexdef(i.indexrelid) FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE i.indrelid = to_regclass(%s)",
+            [TABLE]
+        )
+        foreign_keys = self.fetch(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+            [TABLE]
+        )
+        identity, = self.fetch(
+            "SELECT attidentity FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = 'id'", [TABLE]
+        )[0]
+        sequence, = self.fetch("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])[0]
+        oldest, = self.fetch(f"SELECT min(timestamp) FROM {TABLE}")[0]
+
+        # ALTER TABLE refuses to run while deferred foreign key checks are pending
+        self.execute_sql("SET CONSTRAINTS ALL IMMEDIATE")
+        self.execute_sql(f"ALTER TABLE {TABLE} RENAME TO {legacy}")
+        for index, _ in indexes:
+            self.execute_sql(f"ALTER INDEX {index} RENAME TO {index[:56]}_legacy")
+        # free the id sequence name, the partitioned table gets a plain sequence (identity columns
+        # are not supported on partitioned tables before PostgreSQL 17)
+        if identity:
+            self.execute_sql(f"ALTER TABLE {legacy} ALTER COLUMN id DROP IDENTITY")
+        elif sequence:
+            self.execute_sql(f"ALTER TABLE {legacy} ALTER COLUMN id DROP DEFAULT")
+            self.execute_sql(f"DROP SEQUENCE {sequence}")
+
+        self.execute_sql(f"CREATE TABLE {TABLE} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)")
+        self.execute_sql(f"CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+        self.execute_sql(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+        # the partition keys have to be part of the primary key, ids stay unique through the sequence
+        self.execute_sql(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, timestamp, event_type)")
+        for name, definition in foreign_keys:
+            self.execute_sql(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+        for name, definition in indexes:
+            if name != f'{TABLE}_pkey':
+                self.execute_sql(definition)
+
+        self.execute_sql(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+        month = month_start(oldest) if oldest else current_month
+        while month < current_month:
+            self.create_month(month)
+            month = add_months(month, 1)
+
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in AssetEvent._meta.concrete_fields)
+        self.execute_sql(f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {legacy}")
+        self.execute_sql(f"SELECT setval('{TABLE}_id_seq', COALESCE((SELECT max(id) FROM {TABLE}), 0) + 1, false)")
+        if not keep_legacy:
+            self.execute_sql(f"DROP TABLE {legacy}")
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.loadtest import LOAD_PREFIX, USER_DOMAIN, clear_load_data, seed_load_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a deterministic synthetic dataset for load tests: users, hotels and fleets with rooms, vehicles "
+        f"and roles, AssetEvents and Transactions, plus their rollups. Assets are numbered {LOAD_PREFIX}NNNNNN and "
+        f"users are ltNNNNNN@{USER_DOMAIN} (without a usable password). The same options give the same dataset. "
+        "Only runs with DEBUG on, unless --allow-non-debug is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--assets-per-user', type=int, default=3, help="Mean number of assets each user administers.")
+        parser.add_argument('--hotel-share', type=float, default=0.5, help="Share of the assets that are hotels, the rest are fleets.")
+        parser.add_argument('--rooms-per-hotel', type=int, default=40, help="Mean number of rooms per hotel.")
+        parser.add_argument('--vehicles-per-fleet', type=int, default=25, help="Mean number of vehicles per fleet.")
+        parser.add_argument('--members-per-asset', type=int, default=2, help="Mean number of managers and viewers per asset.")
+        parser.add_argument('--active-share', type=float, default=0.3, help="Share of rooms and vehicles currently in use.")
+        parser.add_argument('--events', type=int, default=1_000_000)
+        parser.add_argument('--transactions', type=int, default=100_000)
+        parser.add_argument('--completed-share', type=float, default=0.8, help="Share of completed transactions.")
+        parser.add_argument('--days', type=int, default=90, help="Events and transactions are spread over this many days.")
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help="1 spreads events and transactions evenly over the sub-assets, larger values concentrate them.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--until', type=datetime.fromisoformat,
+                            help="End of the generated history (ISO datetime), defaults to the current hour.")
+        parser.add_argument('--no-rollups', action='store_true', help="Do not rebuild the daily rollups and sub-asset states.")
+        parser.add_argument('--clear', action='store_true', help="Delete the previously generated dataset first.")
+        parser.add_argument('--allow-non-debug', action='store_true',
+                            help="Run even though DEBUG is off. Never point this at a production database.")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['allow_non_debug']:
+            raise CommandError("DEBUG is off, this may be a production database. Pass --allow-non-debug to seed it anyway.")
+        for option in ['users', 'assets_per_user', 'rooms_per_hotel', 'vehicles_per_fleet', 'days']:
+            if options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be positive")
+        for option in ['hotel_share', 'active_share', 'completed_share']:
+            if not 0 <= options[option] <= 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be between 0 and 1")
+        if options['skew'] <= 0:
+            raise CommandError("--skew must be positive")
+
+        until = options['until']
+        if until is not None and timezone.is_naive(until):
+            until = timezone.make_aware(until)
+
+        if options['clear']:
+            clear_load_data()
+            self.stdout.write("Deleted the previous load test dataset")
+
+        counts = seed_load_data(
+            users=options['users'], assets_per_user=options['assets_per_user'], hotel_share=options['hotel_share'],
+            rooms_per_hotel=options['rooms_per_hotel'], vehicles_per_fleet=options['vehicles_per_fleet'],
+            members_per_asset=options['members_per_asset'], active_share=options['active_share'],
+            events=options['events'], transactions=options['transactions'], completed_share=options['completed_share'],
+            days=options['days'], skew=options['skew'], seed=options['seed'], until=until,
+            rollups=not options['no_rollups'], log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "Generated " + ', '.join(f"{count} {name}" for name, count in counts.items()) + "."
+        ))
@@ -1,13 +1,18 @@
-from django.db import models
+import uuid
+
+from django.db import connection, models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from geopy.distance import geodesic
+from django.contrib.postgres.indexes import BrinIndex
 
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 
+from utils.geo import ellipsoidal_km
+
 from core import * #import the global variables from conf
 
 
@@ -59,6 +64,8 @@ class Transaction(models.Model):
             models.Index(fields=['transaction_ref']),
             models.Index(fields=['payment_status']),
             models.Index(fields=['timestamp']),
+            # keyset pages of an asset's history, newest first (see assets.views.TransactionHistoryView)
+            models.Index(fields=['asset', '-timestamp', '-id'], name='transaction_asset_time_idx'),
         ]
 
 
@@ -128,7 +135,7 @@ class Asset(models.Model):
 class AssetEvent(models.Model):
     asset = models.ForeignKey(Asset, to_field='asset_number', on_delete=models.CASCADE, null=True) # Retain events even if asset is deleted
     event_type = models.CharField(max_length=50, choices=EVENT_TYPE_CHOICES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now) # set when the event is received, not when it is written
     data = models.CharField(max_length=255)
 
     # Generic Foreign Key fields
@@ -137,12 +144,182 @@ class AssetEvent(models.Model):
     sub_asset = GenericForeignKey('content_type', 'object_id')
 
     class Meta:
+        # The table is range partitioned by month in PostgreSQL (see manage_event_partitions)
         ordering = ['-timestamp']
+        # Build these on a populated table with create_event_indexes, see bench_event_queries for the plans
+        indexes = [
+            # history and latest state of a sub-asset, per event type
+            models.Index(fields=['asset', 'content_type', 'object_id', 'event_type', '-timestamp'], name='assetevent_lookup_idx'),
+            # rooms occupied today (CheckAssetStatusView), index-only
+            models.Index(fields=['asset', 'timestamp'], include=['object_id'], condition=models.Q(event_type='occupancy', data='1'),
+                         name='assetevent_occupied_idx'),
+            # sub-assets of one kind with events since a given time (CheckAssetStatusView), index-only
+            models.Index(fields=['asset', 'content_type', 'timestamp'], include=['object_id'], name='assetevent_asset_ct_time_idx'),
+            # daily rollups scan one day of every asset; events arrive in timestamp order
+            BrinIndex(fields=['timestamp'], name='assetevent_timestamp_brin'),
+        ]
 
     def __str__(self):
         return f"{self.event_type} for {self.asset.asset_name if self.asset else 'Unknown Asset'} at {self.timestamp}"
 
 
+class SubAssetState(models.Model):
+    """
+    Latest event of each type per sub-asset, upserted whenever events are written so status
+    reads are a single lookup instead of a scan of AssetEvent.
+    """
+    asset = models.ForeignKey(Asset, to_field='asset_number', on_delete=models.CASCADE, related_name='sub_asset_states')
+    event_type = models.CharField(max_length=50, choices=EVENT_TYPE_CHOICES)
+    timestamp = models.DateTimeField()
+    data = models.CharField(max_length=255)
+
+    # Generic Foreign Key fields
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.CharField(max_length=10)
+    sub_asset = GenericForeignKey('content_type', 'object_id')
+
+    KEY_FIELDS = ['asset', 'content_type', 'object_id', 'event_type']
+    RECORD_BATCH_SIZE = 5000  # rows per upsert, 6 parameters each
+
+    class Meta:
+        unique_together = ('asset', 'content_type', 'object_id', 'event_type')
+
+    def __str__(self):
+        return f"{self.event_type} of {self.object_id} in {self.asset_id}: {self.data}"
+
+    @classmethod
+    def record(cls, events):
+        """
+        Upsert the state from AssetEvent instances with one query. When a batch holds several events
+        for the same key the most recent one wins, and a stored state is only replaced by an event
+        at least as recent: buffered or backfilled events can arrive after a newer state was written
+        (e.g. by send_control_command or the expiry sweep).
+        """
+        latest = {}
+        for event in events:
+            if event.asset_id is None:
+                continue
+            key = (event.asset_id, event.content_type_id, str(event.object_id), event.event_type)
+            if key not in latest or event.timestamp >= latest[key].timestamp:
+                latest[key] = event
+
+        rows = [
+            (asset_id, content_type_id, object_id, event_type, event.data, event.timestamp)
+            for (asset_id, content_type_id, object_id, event_type), event in latest.items()
+        ]
+        # bulk_create(update_conflicts=True) cannot make the update conditional
+        table = connection.ops.quote_name(cls._meta.db_table)
+        for start in range(0, len(rows), cls.RECORD_BATCH_SIZE):
+            batch = rows[start:start + cls.RECORD_BATCH_SIZE]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {table} (asset_id, content_type_id, object_id, event_type, data, timestamp) '
+                    f'VALUES {", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(batch))} '
+                    'ON CONFLICT (asset_id, content_type_id, object_id, event_type) DO UPDATE '
+                    'SET data = EXCLUDED.data, timestamp = EXCLUDED.timestamp '
+                    f'WHERE EXCLUDED.timestamp >= {table}.timestamp',
+                    [value for row in batch for value in row]
+                )
+        return len(rows)
+
+    @classmethod
+    def for_sub_asset(cls, asset_id, model, object_id, event_types=None):
+        """
+        Latest state of a sub-asset as {event_type: SubAssetState}.
+        """
+        states = cls.objects.filter(
+            asset_id=asset_id, content_type=ContentType.objects.get_for_model(model), object_id=str(object_id)
+        )
+        if event_types is not None:
+            states = states.filter(event_type__in=event_types)
+        return {state.event_type: state for state in states}
+
+    @classmethod
+    def latest_data(cls, model, event_type, asset_field, object_field):
+        """
+        Subquery of the latest `event_type` data of each sub-asset in a queryset of `model`, whose
+        asset and number are its `asset_field` and `object_field` (e.g. 'hotel_id', 'room_number'),
+        so a listing annotates the state of all its rows in one query. Sub-assets without a state
+        (events written before backfill_sub_asset_state was run) fall back to their latest event.
+        """
+        lookup = dict(
+            asset_id=models.OuterRef(asset_field),
+            content_type=ContentType.objects.get_for_model(model),
+            object_id=models.OuterRef(object_field),
+            event_type=event_type,
+        )
+        return Coalesce(
+            models.Subquery(cls.objects.filter(**lookup).values('data')[:1]),
+            models.Subquery(AssetEvent.objects.filter(**lookup).order_by('-timestamp').values('data')[:1]),
+        )
+
+
+class SubAssetExpiry(models.Model):
+    """
+    The expiry command of a room or vehicle deactivated by the expiry sweep, kept until it is
+    published (see core/expiry.py). A sub-asset has at most one.
+    """
+    asset = models.ForeignKey(Asset, to_field='asset_number', on_delete=models.CASCADE, related_name='sub_asset_expiries')
+    expires_at = models.DateTimeField(db_index=True)
+    action_type = models.CharField(max_length=50, choices=EVENT_TYPE_CHOICES)
+    data = models.CharField(max_length=255)
+    scheduled_at = models.DateTimeField(auto_now=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)  # being sent by a worker since
+
+    # Generic Foreign Key fields
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.CharField(max_length=10)
+    sub_asset = GenericForeignKey('content_type', 'object_id')
+
+    KEY_FIELDS = ['asset', 'content_type', 'object_id']
+
+    class Meta:
+        unique_together = ('asset', 'content_type', 'object_id')
+
+    def __str__(self):
+        return f"{self.action_type}={self.data} for {self.object_id} in {self.asset_id} at {self.expires_at}"
+
+
+class ControlCommand(models.Model):
+    """
+    Ledger of control commands published over MQTT (see mqtt_handler/ledger.py).
+
+    acked_at is set when the broker acknowledged the publish (PUBACK for QoS 1), confirmed_at
+    when the device reported the new state on `<topic>/state`. dropped commands never left
+    the process because the outbound queue was full.
+    """
+    correlation_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    asset = models.ForeignKey(Asset, to_field='asset_number', on_delete=models.CASCADE, related_name='control_commands')
+    sub_asset_id = models.CharField(max_length=10)  # room_number or vehicle_number
+    action_type = models.CharField(max_length=50, choices=EVENT_TYPE_CHOICES)
+    payload = models.CharField(max_length=255)
+    topic = models.CharField(max_length=255)
+    qos = models.PositiveSmallIntegerField(default=1)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='control_commands')
+    published_at = models.DateTimeField(default=timezone.now)
+    acked_at = models.DateTimeField(null=True, blank=True)
+    confirmed_at = models.DateTimeField(null=True, blank=True)
+    dropped = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # matching device confirmations to the oldest pending command
+            models.Index(fields=['asset', 'sub_asset_id', 'action_type', 'published_at'], name='controlcommand_pending_idx'),
+            models.Index(fields=['published_at'], name='controlcommand_published_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.action_type}={self.payload} for {self.sub_asset_id} in {self.asset_id} ({self.correlation_id})"
+
+    @property
+    def ack_latency(self):
+        return self.acked_at - self.published_at if self.acked_at else None
+
+    @property
+    def confirm_latency(self):
+        return self.confirmed_at - self.published_at if self.confirmed_at else None
+
+
 class Role(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='roles')
     asset = models.ForeignKey(Asset, to_field='asset_number', on_delete=models.CASCADE, related_name='roles')
@@ -167,6 +344,13 @@ class HotelRoom(models.Model):
 
     class Meta:
         unique_together = ['hotel', 'room_number']
+        indexes = [
+            # expiry sweep (see core/expiry.py)
+            models.Index(fields=['expiry_timestamp'], condition=models.Q(status=True), name='hotelroom_active_expiry_idx'),
+            # room lists filtered by status or type, in room_number order (see assets/filters.py)
+            models.Index(fields=['hotel', 'status', 'room_number'], name='hotelroom_hotel_status_idx'),
+            models.Index(fields=['hotel', 'room_type', 'room_number'], name='hotelroom_hotel_type_idx'),
+        ]
 
     def __str__(self):
         return f"{self.room_number} - {self.room_type} in {self.hotel.asset_name}"
@@ -193,19 +377,24 @@ class Vehicle(models.Model):
 
     class Meta:
         unique_together = ['fleet', 'vehicle_number']
+        indexes = [
+            # expiry sweep (see core/expiry.py)
+            models.Index(fields=['expiry_timestamp'], condition=models.Q(status=True), name='vehicle_active_expiry_idx'),
+            # vehicle lists filtered by status or type, in vehicle_number order (see assets/filters.py)
+            models.Index(fields=['fleet', 'status', 'vehicle_number'], name='vehicle_fleet_status_idx'),
+            models.Index(fields=['fleet', 'vehicle_type', 'vehicle_number'], name='vehicle_fleet_type_idx'),
+        ]
 
     def __str__(self):
         return f"{self.vehicle_number} - {self.brand} {self.vehicle_type} in {self.fleet.asset_name}"
 
     def update_location(self, latitude, longitude):
-        new_location = (latitude, longitude)
         if self.last_latitude is not None and self.last_longitude is not None:
-            last_location = (self.last_latitude, self.last_longitude)
-            distance = geodesic(last_location, new_location).kilometers
-            self.total_distance += distance
+            distance = ellipsoidal_km(self.last_latitude, self.last_longitude, latitude, longitude)
+            self.total_distance += float(distance)
         self.last_latitude = latitude
         self.last_longitude = longitude
-        self.save()
+        self.save(update_fields=['last_latitude', 'last_longitude', 'total_distance'])
 
     def get_location(self):
         if self.last_latitude is not None and self.last_longitude is not None:
@@ -213,4 +402,48 @@ class Vehicle(models.Model):
                 'latitude': self.last_latitude,
                 'longitude': self.last_longitude
             }
-        return None
\ No newline at end of file
+        return None
+
+class DailyAssetRollup(models.Model):
+    """
+    Revenue and activity of an asset for one day (in TIME_ZONE), maintained by core/rollups.py.
+    """
+    asset = models.ForeignKey(Asset, to_field='asset_number', on_delete=models.CASCADE, related_name='daily_rollups')
+    date = models.DateField()
+    revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    completed_transactions = models.PositiveIntegerField(default=0)
+    occupied_rooms = models.PositiveIntegerField(default=0)
+    vehicles_with_events = models.PositiveIntegerField(default=0)
+    expected_yield = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('asset', 'date')
+
+    def __str__(self):
+        return f"{self.asset_id} on {self.date}"
+
+
+class DailySubAssetRollup(models.Model):
+    """
+    Revenue and activity of a room or vehicle for one day (in TIME_ZONE), maintained by core/rollups.py.
+    """
+    asset = models.ForeignKey(Asset, to_field='asset_number', on_delete=models.CASCADE, related_name='daily_sub_asset_rollups')
+    date = models.DateField()
+    revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    completed_transactions = models.PositiveIntegerField(default=0)
+    events = models.PositiveIntegerField(default=0)
+    occupied = models.BooleanField(default=False)
+    expected_yield = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Generic Foreign Key fields
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.CharField(max_length=10)
+    sub_asset = GenericForeignKey('content_type', 'object_id')
+
+    class Meta:
+        unique_together = ('asset', 'content_type', 'object_id', 'date')
+
+    def __str__(self):
+        return f"{self.object_id} in {self.asset_id} on {self.date}"
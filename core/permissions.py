@@ -1,5 +1,6 @@
 from rest_framework import permissions, authentication
-from core.models import Role
+from core.identity import system_identity
+from core.roles import role_resolver
 from rest_framework import exceptions
 from django.contrib.auth import get_user_model
 import os
@@ -17,9 +18,11 @@ class SystemUserAuthentication(authentication.BaseAuthentication):
             raise exceptions.AuthenticationFailed('Invalid system token')
 
         try:
-            user = User.objects.get(username='info@trykey.com')
+            user = system_identity.get_user()
         except User.DoesNotExist:
             raise exceptions.AuthenticationFailed('System user does not exist')
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('System user is inactive')
 
         return (user, None)
 
@@ -36,11 +39,7 @@ class IsAdmin(permissions.BasePermission):
         if asset_number is None:
             return False
 
-        return Role.objects.filter(
-            user=request.user, 
-            asset_id=asset_number, 
-            role='admin'
-        ).exists()
+        return role_resolver.has_role(request, asset_number, 'admin')
 
 
 class IsManager(permissions.BasePermission):
@@ -58,4 +57,4 @@ class IsManager(permissions.BasePermission):
             # depending on the specific requirements of the use case
             return True  # or False, depending on the security needs
 
-        return Role.objects.filter(user=request.user, asset_id=asset_number, role='manager').exists()
+        return role_resolver.has_role(request, asset_number, 'manager')
@@ -0,0 +1,76 @@
+"""
+Roles of the requesting user, resolved once per request.
+
+All roles of a user ({asset_number: role}) are loaded with one query and kept in the Django
+cache (Redis when CACHE_REDIS_URL is set) for ROLE_CACHE_TTL seconds; the receivers in
+core/signals.py drop them whenever one of the user's roles is saved or deleted (only with a
+shared cache, see SHARED_CACHE: otherwise they are read on every request). Within a request
+they are memoized on the request itself, so the permission classes, the view and its serializers
+share them: authorization costs at most one query per request, for a single asset as well as
+for list views.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Role
+
+
+ROLE_LEVELS = {'admin': 3, 'manager': 2, 'viewer': 1}
+
+
+def _cache_key(user_id):
+    return f'user_roles:{user_id}'
+
+
+class RoleResolver:
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+
+    def roles(self, request):
+        """
+        {asset_number: role} of the request's user (empty for anonymous users).
+        """
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return {}
+
+        # DRF's Request wraps the HttpRequest, which is shared with the middleware and other views
+        http_request = getattr(request, '_request', request)
+        memo = getattr(http_request, '_asset_roles', None)
+        if memo is None or memo[0] != user.pk:
+            memo = (user.pk, self.load(user.pk))
+            http_request._asset_roles = memo
+        return memo[1]
+
+    def role(self, request, asset_number):
+        return self.roles(request).get(asset_number)
+
+    def has_role(self, request, asset_number, *roles):
+        """
+        Whether the user has one of `roles` on the asset, or any role if none are given.
+        """
+        role = self.role(request, asset_number)
+        return role is not None and (not roles or role in roles)
+
+    def load(self, user_id):
+        if not settings.SHARED_CACHE:
+            return self.query(user_id)
+        key = _cache_key(user_id)
+        roles = cache.get(key)
+        if roles is None:
+            roles = self.query(user_id)
+            cache.set(key, roles, timeout=self.ttl)
+        return roles
+
+    def query(self, user_id):
+        return dict(Role.objects.filter(user_id=user_id).values_list('asset_id', 'role'))
+
+    def invalidate(self, user_id):
+        cache.delete(_cache_key(user_id))
+
+
+role_resolver = RoleResolver(ttl=settings.ROLE_CACHE_TTL)
+
+
+def role_level(role):
+    return ROLE_LEVELS.get(role, 0)
@@ -0,0 +1,207 @@
+"""
+Daily rollups of revenue and activity per asset and per sub-asset.
+
+Dashboards read closed days from DailyAssetRollup / DailySubAssetRollup and only compute the
+current day from raw Transaction and AssetEvent rows. Days are calendar days in TIME_ZONE.
+
+rebuild_daily_rollups() recomputes whole days, so it is safe to re-run. update_recent_rollups()
+is run by celery beat every ANALYTICS_ROLLUP_INTERVAL seconds: it refreshes today, yesterday and
+every day with a transaction that changed or an event written since the previous run (e.g. a
+payment verified late, or events buffered while the database was unreachable). While there are
+no rollups at all (a fresh deploy) its first run backfills every past day, as the
+backfill_rollups command does.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models import (
+    AssetEvent, DailyAssetRollup, DailySubAssetRollup, HotelRoom, Transaction, Vehicle
+)
+
+
+SUB_ASSET_MODELS = {'hotel': HotelRoom, 'vehicle': Vehicle}
+
+
+def day_bounds(first_day, last_day):
+    """
+    Aware datetimes [start, end) covering the calendar days first_day to last_day.
+    """
+    start = timezone.make_aware(datetime.combine(first_day, time.min))
+    end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min))
+    return start, end
+
+
+def compute_daily_rollups(first_day, last_day):
+    """
+    Aggregate transactions and events of the given days without saving anything.
+    Returns unsaved (asset_rollups, sub_asset_rollups).
+    """
+    start, end = day_bounds(first_day, last_day)
+    content_types = {
+        asset_type: ContentType.objects.get_for_model(model).id for asset_type, model in SUB_ASSET_MODELS.items()
+    }
+    room_type = content_types['hotel']
+
+    assets = defaultdict(lambda: DailyAssetRollup(revenue=Decimal('0'), expected_yield=Decimal('0')))
+    sub_assets = defaultdict(lambda: DailySubAssetRollup(revenue=Decimal('0'), expected_yield=Decimal('0')))
+
+    revenue = Transaction.objects.filter(
+        payment_status='completed',
+        asset__isnull=False,
+        timestamp__gte=start,
+        timestamp__lt=end
+    ).annotate(date=TruncDate('timestamp')).values(
+        'asset_id', 'asset__asset_type', 'sub_asset_number', 'date'
+    ).annotate(revenue=Sum('amount'), count=Count('id'))
+
+    for row in revenue:
+        asset = assets[(row['asset_id'], row['date'])]
+        asset.revenue += row['revenue']
+        asset.completed_transactions += row['count']
+
+        content_type_id = content_types.get(row['asset__asset_type'])
+        if row['sub_asset_number'] and content_type_id:
+            sub_asset = sub_assets[(row['asset_id'], content_type_id, row['sub_asset_number'], row['date'])]
+            sub_asset.revenue += row['revenue']
+            sub_asset.completed_transactions += row['count']
+
+    activity = AssetEvent.objects.filter(
+        asset__isnull=False,
+        timestamp__gte=start,
+        timestamp__lt=end
+    ).annotate(date=TruncDate('timestamp')).values(
+        'asset_id', 'content_type_id', 'object_id', 'date'
+    ).annotate(events=Count('id'), occupancy=Count('id', filter=Q(event_type='occupancy', data='1')))
+
+    for row in activity:
+        sub_asset = sub_assets[(row['asset_id'], row['content_type_id'], row['object_id'], row['date'])]
+        sub_asset.events = row['events']
+        sub_asset.occupied = row['occupancy'] > 0
+
+    # expected yield of an occupied room is its current price
+    hotels = {asset_id for asset_id, content_type_id, _, _ in sub_assets if content_type_id == room_type}
+    prices = {
+        (hotel_id, room_number): price
+        for hotel_id, room_number, price in HotelRoom.objects.filter(hotel_id__in=hotels).values_list('hotel_id', 'room_number', 'price')
+    }
+
+    for (asset_id, content_type_id, object_id, date), sub_asset in sub_assets.items():
+        sub_asset.asset_id, sub_asset.content_type_id, sub_asset.object_id, sub_asset.date = asset_id, content_type_id, object_id, date
+        asset = assets[(asset_id, date)]
+        if content_type_id == room_type:
+            if sub_asset.occupied:
+                sub_asset.expected_yield = prices.get((asset_id, object_id), Decimal('0'))
+                asset.occupied_rooms += 1
+                asset.expected_yield += sub_asset.expected_yield
+        elif sub_asset.events:
+            asset.vehicles_with_events += 1
+
+    for (asset_id, date), asset in assets.items():
+        asset.asset_id, asset.date = asset_id, date
+
+    return list(assets.values()), list(sub_assets.values())
+
+
+def rebuild_daily_rollups(days):
+    """
+    Replace the rollups of the given days. Returns the number of asset rollups written.
+    """
+    days = sorted(set(days))
+    if not days:
+        return 0
+
+    # aggregate runs of consecutive days together, so a single old day does not widen the scan
+    spans = [[days[0], days[0]]]
+    for day in days[1:]:
+        if day == spans[-1][1] + timedelta(days=1):
+            spans[-1][1] = day
+        else:
+            spans.append([day, day])
+
+    asset_rollups, sub_asset_rollups = [], []
+    for first_day, last_day in spans:
+        assets, sub_assets = compute_daily_rollups(first_day, last_day)
+        asset_rollups.extend(assets)
+        sub_asset_rollups.extend(sub_assets)
+
+    with transaction.atomic():
+        DailyAssetRollup.objects.filter(date__in=days).delete()
+        DailySubAssetRollup.objects.filter(date__in=days).delete()
+        DailyAssetRollup.objects.bulk_create(asset_rollups, batch_size=1000)
+        DailySubAssetRollup.objects.bulk_create(sub_asset_rollups, batch_size=1000)
+    return len(asset_rollups)
+
+
+def oldest_day():
+    """
+    Day of the oldest transaction or event, None if there are none.
+    """
+    oldest = [
+        timestamp for timestamp in (
+            Transaction.objects.aggregate(oldest=Min('timestamp'))['oldest'],
+            AssetEvent.objects.aggregate(oldest=Min('timestamp'))['oldest'],
+        ) if timestamp is not None
+    ]
+    return timezone.localdate(min(oldest)) if oldest else None
+
+
+def backfill_daily_rollups(start, end, chunk_days=31):
+    """
+    Rebuild the days from start to end, chunk_days per transaction.
+    Yields (first_day, last_day, asset rollups written) for each chunk.
+    """
+    day = start
+    while day <= end:
+        last_day = min(day + timedelta(days=chunk_days - 1), end)
+        written = rebuild_daily_rollups(day + timedelta(days=offset) for offset in range((last_day - day).days + 1))
+        yield day, last_day, written
+        day = last_day + timedelta(days=1)
+
+
+def late_event_days(since, before):
+    """
+    Days before `before` of the events written after `since`. Timestamps are set when an event is
+    received, so these are events written late; ids follow the write order, so they are the old
+    events with a higher id than the first event received since `since`.
+    """
+    first_id = AssetEvent.objects.filter(timestamp__gte=since).aggregate(first=Min('id'))['first']
+    if first_id is None:
+        return set()
+    start, _ = day_bounds(before, before)
+    return set(
+        AssetEvent.objects.filter(id__gt=first_id, timestamp__lt=start)
+        .annotate(date=TruncDate('timestamp'))
+        .order_by()
+        .values_list('date', flat=True)
+        .distinct()
+    )
+
+
+def update_recent_rollups(since):
+    """
+    Rebuild today, yesterday and the days of transactions updated or events written after `since`,
+    or every past day while there are no rollups yet.
+    """
+    today = timezone.localdate()
+    if not DailyAssetRollup.objects.exists():
+        first_day = oldest_day()
+        if first_day is not None:
+            return sum(written for _, _, written in backfill_daily_rollups(first_day, today))
+
+    yesterday = today - timedelta(days=1)
+    days = {today, yesterday}
+    days.update(
+        Transaction.objects.filter(updated_at__gte=since)
+        .annotate(date=TruncDate('timestamp'))
+        .values_list('date', flat=True)
+        .distinct()
+    )
+    days.update(late_event_days(since, yesterday))
+    return rebuild_daily_rollups(days)
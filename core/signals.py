@@ -1,6 +1,9 @@
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Transaction
+from .identity import system_identity
+from .models import Role, Transaction, User
+from .roles import role_resolver
 from .utils import payment_aggregator
 
 @receiver(post_save, sender=Transaction)
@@ -8,4 +11,21 @@ from .utils import payment_aggregator
 def update_total_revenue(sender, instance, **kwargs):
     if instance.payment_status == 'completed':
         asset = instance.asset
-        payment_aggregator(asset)
\ No newline at end of file
+        payment_aggregator(asset)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_system_identity(sender, instance, **kwargs):
+    if instance.username == system_identity.username:
+        # again once committed, in case another process reloaded the user in between
+        system_identity.invalidate()
+        transaction.on_commit(system_identity.invalidate)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_user_roles(sender, instance, **kwargs):
+    # again once committed, in case a request cached the roles from before the write in between
+    role_resolver.invalidate(instance.user_id)
+    transaction.on_commit(lambda: role_resolver.invalidate(instance.user_id))
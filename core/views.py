@@ -5,8 +5,8 @@ import hmac
 import hashlib
 
 from django.db import transaction, IntegrityError
-from django.db.models import Q, F
-from django.http import HttpResponse
+from django.db.models import Q, F, Prefetch
+from django.http import StreamingHttpResponse
 from django.contrib.auth import get_user_model
 from django.utils.datetime_safe import datetime
 from django.utils import timezone
@@ -27,9 +27,11 @@ from utils.helpers import *
 from utils.payment import *
 from core import *
 from .serializers import UserSerializer, TransactionSerializer
-from .models import User, Asset, HotelRoom, Transaction, Vehicle, PaystackTransferRecipient
+from .models import User, Asset, HotelRoom, Role, Transaction, Vehicle, PaystackTransferRecipient
 from .permissions import IsAdmin,IsManager
-from hotel_demo.tasks import schedule_sub_asset_expiry, send_control_request
+from .expiry import cancel_expiry
+from assets.cache import bump_asset_version
+from hotel_demo.tasks import send_control_request
 
 User = get_user_model()
 logger = logging.getLogger()
@@ -89,105 +91,120 @@ class ProfileView(APIView):
 # ---------- USER VIEWS ----------
 
 class UserDataView(APIView):
+    """
+    Export of every user with their assets, sub-assets and payments, streamed as a JSON array.
+
+    Users are loaded in chunks of `chunk_size` with their related rows prefetched, so the export
+    costs a fixed number of queries per chunk. Optional cursor pagination: `?after=<user id>&limit=<n>`
+    returns at most n users with an id greater than `after`; the cursor of the next page is sent in
+    the X-Next-Cursor header (absent on the last page).
+    """
+    chunk_size = 200
+    max_limit = 1000
+
     def get(self, request, *args, **kwargs):
         try:
-            users = User.objects.all()
-            data = []
-            
-            for user in users:
-                user_data = {
-                    "id": user.id,
-                    "first_name": user.first_name,
-                    "last_name": user.last_name,
-                    "email": user.email,
-                    "avatar": user.avatar.url if user.avatar else None,
-                    "assets": {
-                        "hotel": [],
-                        "logistics": [],
-                        "machinery": []
-                    },
-                    "payments": []
-                }
-
-                # Get user's assets
-                assets = Asset.objects.filter(roles__user_id=user)
-                for asset in assets:
-                    asset_data = {
-                        "asset_id": str(asset.id),
-                        "asset_name": asset.asset_name,
-                        "created_at": asset.created_at.isoformat(),
-                        "location": asset.location,
-                        "details": asset.details,
-                    }
+            after = int(request.query_params.get('after', 0))
+            limit = request.query_params.get('limit')
+            limit = int(limit) if limit is not None else None
+        except ValueError:
+            return Response({'error': 'after and limit must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit is not None and not 0 < limit <= self.max_limit:
+            return Response({'error': f'limit must be between 1 and {self.max_limit}.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        users = User.objects.filter(id__gt=after).order_by('id')
+        next_cursor = None
+        if limit is not None:
+            user_ids = list(users.values_list('id', flat=True)[:limit + 1])
+            if len(user_ids) > limit:
+                next_cursor = user_ids[limit - 1]
+            users = users.filter(id__in=user_ids[:limit])
+
+        users = users.prefetch_related(
+            Prefetch('roles', queryset=Role.objects.select_related('asset').order_by('asset_id')),
+            'roles__asset__rooms',
+            'roles__asset__fleet',
+            'roles__asset__transactions',
+        )
 
-                    # Differentiate asset types
-                    if asset.asset_type == 'hotel':
-                        asset_data["rooms"] = []
-                        # Fetch related HotelRooms
-                        rooms = HotelRoom.objects.filter(hotel=asset)
-                        for room in rooms:
-                            room_data = {
-                                "id": room.id,
-                                "room_number": room.room_number,
-                                "room_type": room.room_type,
-                                "price": room.price,
-                                "status": "active" if room.status else "inactive"
-                            }
-                            asset_data["rooms"].append(room_data)
-                        user_data["assets"]["hotel"].append(asset_data)
-
-                    elif asset.asset_type == 'vehicle':
-                        asset_data["vehicles"] = []
-                        # Fetch related Vehicles
-                        vehicles = Vehicle.objects.filter(fleet=asset)
-                        for vehicle in vehicles:
-                            vehicle_data = {
-                                "id": vehicle.id,
-                                "vehicle_number": vehicle.vehicle_number,
-                                "type": vehicle.vehicle_type,
-                                "brand": vehicle.brand,
-                                "status": "active" if vehicle.status else "inactive"
-                            }
-                            asset_data["vehicles"].append(vehicle_data)
-                        user_data["assets"]["logistics"].append(asset_data)
-
-                    
-                    # elif asset.asset_type == 'machine':
-                    #     # Fetch related Machinery
-                    #     machinery = Machinery.objects.filter(fleet=asset)
-                    #     for machine in machinery:
-                    #         machine_data = {
-                    #             "id": machine.id,
-                    #             "machine_number": machine.machine_number,
-                    #             "machine_type": machine.machine_type,
-                    #             "petrol_level": machine.petrol_level,
-                    #             "status": "active" if machine.timestamp else "inactive"
-                    #         }
-                    #         asset_data["machines"].append(machine_data)
-                    #     user_data["assets"]["machinery"].append(asset_data)
-
-                # Get user's payments
-                payments = Transaction.objects.filter(asset_id__in=assets)
-                for payment in payments:
-                    payment_data = {
-                        "id": payment.id,
-                        "asset_id": str(payment.asset_id.id),  # Fixed to reference asset_id's id
-                        "sub_asset_id": payment.sub_asset_id,
-                        "amount": payment.amount,
-                        "status": payment.payment_status,
-                        "timestamp": payment.timestamp.isoformat(),
-                        "payment_type": payment.payment_type
-                    }
-                    user_data["payments"].append(payment_data)
+        response = StreamingHttpResponse(self.stream(users), content_type="application/json")
+        if next_cursor is not None:
+            response['X-Next-Cursor'] = str(next_cursor)
+        return response
+
+    def stream(self, users):
+        yield '['
+        for index, user in enumerate(users.iterator(chunk_size=self.chunk_size)):
+            yield (',' if index else '') + json.dumps(self.user_data(user), cls=CustomJSONEncoder)
+        yield ']'
+
+    def user_data(self, user):
+        user_data = {
+            "id": user.id,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "email": user.email,
+            "avatar": user.avatar.url if user.avatar else None,
+            "assets": {
+                "hotel": [],
+                "logistics": [],
+                "machinery": []
+            },
+            "payments": []
+        }
 
-                data.append(user_data)
-            
-            pretty_data = json.dumps(data, indent=4, cls=CustomJSONEncoder)
-            return HttpResponse(pretty_data, content_type="application/json")
-            
-        except Exception as e:
-            # Log the error
-            return Response({'error': 'An error occurred while processing your request.'}, status=status.HTTP_400_BAD_REQUEST)
+        # Get user's assets
+        assets = [role.asset for role in user.roles.all()]
+        for asset in assets:
+            asset_data = {
+                "asset_id": str(asset.id),
+                "asset_name": asset.asset_name,
+                "created_at": asset.created_at.isoformat(),
+                "location": asset.location,
+                "details": asset.details,
+            }
+
+            # Differentiate asset types
+            if asset.asset_type == 'hotel':
+                asset_data["rooms"] = [
+                    {
+                        "id": room.id,
+                        "room_number": room.room_number,
+                        "room_type": room.room_type,
+                        "price": room.price,
+                        "status": "active" if room.status else "inactive"
+                    }
+                    for room in asset.rooms.all()
+                ]
+                user_data["assets"]["hotel"].append(asset_data)
+
+            elif asset.asset_type == 'vehicle':
+                asset_data["vehicles"] = [
+                    {
+                        "id": vehicle.id,
+                        "vehicle_number": vehicle.vehicle_number,
+                        "type": vehicle.vehicle_type,
+                        "brand": vehicle.brand,
+                        "status": "active" if vehicle.status else "inactive"
+                    }
+                    for vehicle in asset.fleet.all()
+                ]
+                user_data["assets"]["logistics"].append(asset_data)
+
+        # Get user's payments
+        for asset in assets:
+            for payment in asset.transactions.all():
+                user_data["payments"].append({
+                    "id": payment.id,
+                    "asset_id": str(asset.id),
+                    "sub_asset_id": payment.sub_asset_number,
+                    "amount": payment.amount,
+                    "status": payment.payment_status,
+                    "timestamp": payment.timestamp.isoformat(),
+                    "payment_type": payment.payment_type
+                })
+
+        return user_data
 
 
 # ---------- PAYMENT VIEWS ----------
@@ -354,6 +371,7 @@ class VerifyPaymentView(APIView):
         Asset.objects.filter(asset_number=transaction.asset.asset_number).update(
             total_revenue=F('total_revenue') + transaction.amount
         )
+        bump_asset_version(transaction.asset.asset_number)  # update() sends no post_save
         logger.info(f"Updated total revenue for asset {transaction.asset.asset_number}")
 
     def update_sub_asset(self, transaction):
@@ -384,11 +402,8 @@ class VerifyPaymentView(APIView):
             room.expiry_timestamp = new_expiry
             room.save()
             
-            # Cancel any existing expiry task and schedule a new one
-            schedule_sub_asset_expiry.apply_async(
-                args=[asset.asset_number, sub_asset_number, "access", "lock", True],
-                eta=new_expiry
-            )
+            # expires at expiry_timestamp; an unsent lock of the previous session must not lock this one (see core/expiry.py)
+            cancel_expiry(room)
             
             logger.info(f"Updated HotelRoom {room.room_number} status and timestamps. New expiry: {new_expiry}")
 
@@ -406,12 +421,10 @@ class VerifyPaymentView(APIView):
             send_control_request.apply_async(args=[asset.asset_number, sub_asset_number, "ignition", "turn_on"], eta=datetime.now())
             vehicle.status = True
             vehicle.expiry_timestamp = new_expiry
-            vehicle.save()
-            # Cancel any existing expiry task and schedule a new one
-            schedule_sub_asset_expiry.apply_async(
-                args=[asset.asset_number, sub_asset_number, "ignition", "turn_off", True],
-                eta=new_expiry
-            )
+            # location fields are owned by the MQTT location accumulator
+            vehicle.save(update_fields=['status', 'activation_timestamp', 'expiry_timestamp'])
+            # expires at expiry_timestamp; an unsent turn_off of the previous session must not stop this one (see core/expiry.py)
+            cancel_expiry(vehicle)
             logger.info(f"Updated Vehicle {vehicle.vehicle_number} status and timestamps. New expiry: {new_expiry}")
 
         else:
@@ -27,6 +27,11 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # system domain
 DOMAIN = os.getenv('SYSTEM_USER_REQUEST_DOMAIN', 'localhost:8000')
 
+# System user identity shared by internal jobs (see core/identity.py)
+SYSTEM_IDENTITY_CACHE_TTL = int(os.getenv('SYSTEM_IDENTITY_CACHE_TTL', 300))  # seconds the system user is kept in memory
+SYSTEM_TOKEN_LIFETIME = int(os.getenv('SYSTEM_TOKEN_LIFETIME', 900))  # seconds
+SYSTEM_TOKEN_REFRESH_MARGIN = int(os.getenv('SYSTEM_TOKEN_REFRESH_MARGIN', 60))  # re-sign this many seconds before expiry
+
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.environ.get('SECRET_KEY')
 
@@ -36,6 +41,47 @@ DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
 # Duration for directly controlling sub asset (seconds if DEBUG else hours)
 DIRECT_CONTROL_EXPIRY = os.getenv('DIRECT_CONTROL_EXPIRY', 2)
 
+# MQTT broker shared by the subscriber and the control publisher (see mqtt_handler/publisher.py)
+MQTT_BROKER = os.getenv('MQTT_BROKER', 'broker.emqx.io')
+MQTT_PORT = int(os.getenv('MQTT_PORT', 1883))
+MQTT_PUBLISH_QOS = int(os.getenv('MQTT_PUBLISH_QOS', 1))  # QoS of control commands
+MQTT_PUBLISH_QUEUE_SIZE = int(os.getenv('MQTT_PUBLISH_QUEUE_SIZE', 1000))  # max commands held while the broker is unreachable
+
+# Control command ledger (see mqtt_handler/ledger.py)
+MQTT_COMMAND_ACK_FLUSH_INTERVAL = float(os.getenv('MQTT_COMMAND_ACK_FLUSH_INTERVAL', 1.0))  # seconds between writes of broker acks
+MQTT_COMMAND_CONFIRM_WINDOW = int(os.getenv('MQTT_COMMAND_CONFIRM_WINDOW', 60))  # seconds a device has to confirm a command
+
+# MQTT ingestion buffer (see mqtt_handler/buffer.py)
+MQTT_EVENT_BUFFER_SIZE = int(os.getenv('MQTT_EVENT_BUFFER_SIZE', 10000))  # max events held in memory
+MQTT_EVENT_FLUSH_SIZE = int(os.getenv('MQTT_EVENT_FLUSH_SIZE', 500))  # events per bulk insert
+MQTT_EVENT_FLUSH_INTERVAL = float(os.getenv('MQTT_EVENT_FLUSH_INTERVAL', 1.0))  # seconds
+MQTT_EVENT_BLOCK_TIMEOUT = float(os.getenv('MQTT_EVENT_BLOCK_TIMEOUT', 0.5))  # seconds to wait on a full buffer before dropping
+
+# MQTT topic -> sub-asset resolution cache (see mqtt_handler/resolver.py)
+MQTT_RESOLVER_CACHE_SIZE = int(os.getenv('MQTT_RESOLVER_CACHE_SIZE', 10000))
+MQTT_RESOLVER_CACHE_TTL = int(os.getenv('MQTT_RESOLVER_CACHE_TTL', 300))  # seconds
+
+# MQTT ingestion worker pool (see mqtt_handler/workers.py)
+MQTT_INGEST_WORKERS = int(os.getenv('MQTT_INGEST_WORKERS', 4))  # DB worker threads, one connection each
+MQTT_INGEST_QUEUE_SIZE = int(os.getenv('MQTT_INGEST_QUEUE_SIZE', 1000))  # max queued messages per worker
+MQTT_INGEST_PUT_TIMEOUT = float(os.getenv('MQTT_INGEST_PUT_TIMEOUT', 0.5))  # seconds the network thread waits on a full queue
+
+# Vehicle location accumulator (see mqtt_handler/location.py)
+MQTT_LOCATION_FLUSH_INTERVAL = float(os.getenv('MQTT_LOCATION_FLUSH_INTERVAL', 5.0))  # seconds between location bulk updates
+
+# Daily analytics rollups (see core/rollups.py)
+ANALYTICS_ROLLUP_INTERVAL = int(os.getenv('ANALYTICS_ROLLUP_INTERVAL', 300))  # seconds between refreshes of recent days
+
+# Roles of the requesting user (see core/roles.py)
+ROLE_CACHE_TTL = int(os.getenv('ROLE_CACHE_TTL', 30))  # seconds a user's roles are cached if none of them changes
+
+# Per-user asset list cache (see assets/cache.py)
+ASSET_LIST_CACHE_TTL = int(os.getenv('ASSET_LIST_CACHE_TTL', 300))  # seconds a list is kept if no write invalidates it
+
+# Room and vehicle expiry (see core/expiry.py)
+SUB_ASSET_EXPIRY_POLL_INTERVAL = int(os.getenv('SUB_ASSET_EXPIRY_POLL_INTERVAL', 30))  # seconds between runs of the expiry task
+SUB_ASSET_EXPIRY_CLAIM_TIMEOUT = int(os.getenv('SUB_ASSET_EXPIRY_CLAIM_TIMEOUT', 300))  # seconds before an unsent claimed expiry is claimed again
+
 # Flutterwave keys
 FLW_PUBLIC_KEY = os.getenv('FLW_PUBLIC_KEY')
 FLW_SECRET_KEY = os.getenv('FLW_SECRET_KEY')
@@ -67,6 +113,9 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# cursor of the next page of keyset-paginated lists (see utils/helpers.py and core/views.py UserDataView)
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor']
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -163,6 +212,19 @@ DATABASES = {
     }
 }
 
+# Cache
+# Redis when CACHE_REDIS_URL is set, shared by the web and Celery processes. Otherwise each process
+# has its own memory cache, which never sees the invalidations made by the others, so the role and
+# asset list caches (core/roles.py, assets/cache.py) are bypassed.
+SHARED_CACHE = bool(os.getenv('CACHE_REDIS_URL'))
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL'),
+        }
+    }
+
 # Celery Configuration Options
 CELERY_TIMEZONE = "Africa/Lagos"
 CELERY_ENABLE_UTC = True
@@ -174,6 +236,20 @@ CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TASK_SERIALIZER = 'json'
+CELERY_BEAT_SCHEDULE = {
+    'maintain-event-partitions': {
+        'task': 'hotel_demo.tasks.maintain_event_partitions',
+        'schedule': 24 * 60 * 60,  # daily
+    },
+    'update-daily-rollups': {
+        'task': 'hotel_demo.tasks.update_daily_rollups',
+        'schedule': ANALYTICS_ROLLUP_INTERVAL,
+    },
+    'process-sub-asset-expiries': {
+        'task': 'hotel_demo.tasks.process_sub_asset_expiries',
+        'schedule': SUB_ASSET_EXPIRY_POLL_INTERVAL,
+    },
+}
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -1,70 +1,78 @@
 from django.conf import settings
+from django.core.management import call_command
+from django.utils import timezone
 from celery import shared_task
-import requests
 import logging
-import json
-from utils.helpers import get_system_user_token
-from django.conf import settings
-from core.models import HotelRoom, Asset 
+from datetime import timedelta
+from core.expiry import process_due_expiries, sweep_expired_sub_assets
+from core.management.commands.manage_event_partitions import is_partitioned
+from core.models import Asset
+from core.rollups import update_recent_rollups
+from mqtt_handler.control import ControlError, send_control_command
+from mqtt_handler.publisher import PublishQueueFull
 
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
+def _send_control(asset_number, sub_asset_number, action_type, data):
+    """Publish a control command in-process as the system user (see mqtt_handler/control.py)"""
+    try:
+        asset = Asset.objects.get(asset_number=asset_number)
+        command = send_control_command(asset, sub_asset_number, action_type, data)
+    except Asset.DoesNotExist:
+        logger.error(f"Failed to send control command: asset {asset_number} not found")
+        return None
+    except ControlError as e:
+        logger.error(f"Failed to send control command to {asset_number}/{sub_asset_number}: {str(e)}")
+        return None
+    logger.info(f"Control command {command.correlation_id} sent: {command.topic} = {data}")
+    return str(command.correlation_id)
+
+
 @shared_task
 def schedule_sub_asset_expiry(asset_number, sub_asset_number, action_type, data, update_status):
-    logger.info(f"Expiry task started for asset {asset_number}, sub-asset {sub_asset_number}")
-    url = f'{settings.DOMAIN}/api/assets/{asset_number}/control/{sub_asset_number}/'
-    headers = {
-        'Authorization': f'Bearer {get_system_user_token()}'
-    }
-    payload = {
-        'action_type': action_type,
-        'data': data,
-        'update_status': update_status  # Add this flag to indicate status update is needed (currently only handles sub-asset deactivation)
-    }
-    try:
-        response = requests.post(url, json=payload, headers=headers)
-        response.raise_for_status()
-        logger.info(f"Control request sent successfully: {url}, Status: {response.status_code}")
-        logger.info(f"Response content: {response.text}")
-        
-        # Update room status directly in the task
-        try:
-            asset = Asset.objects.get(asset_number=asset_number)
-            if asset.asset_type == 'hotel' and update_status:
-                room = HotelRoom.objects.get(hotel=asset, room_number=sub_asset_number)
-                room.status = False
-                room.save()
-                logger.info(f"Room status updated to False for room {sub_asset_number}")
-        except Exception as e:
-            logger.error(f"Failed to update room status: {str(e)}")
-        
-    except requests.RequestException as e:
-        logger.error(f"Failed to send control request: {str(e)}")
-        if hasattr(e, 'response'):
-            logger.error(f"Response status code: {e.response.status_code}")
-            logger.error(f"Response content: {e.response.content}")
-
-
-@shared_task()
+    # Expiries are now sent by process_sub_asset_expiries from the sub-asset's expiry_timestamp
+    # (see core/expiry.py); ETA tasks queued before that are ignored, an extension may have
+    # replaced their expiry.
+    logger.info(f"Ignoring expiry task of {sub_asset_number} in {asset_number}, expiries are handled by the expiry sweep")
+    return None
+
+
+@shared_task(autoretry_for=(PublishQueueFull,), retry_backoff=True, max_retries=5)
 def send_control_request(asset_number, sub_asset_number, action_type, data):
-    url = f'{settings.DOMAIN}/api/assets/{asset_number}/control/{sub_asset_number}/'
-    headers = {
-        'Authorization': f'Bearer {get_system_user_token()}',
-        'Content-Type': 'application/json'
-    }
-    payload = {
-        'action_type': action_type,
-        'data': data
-    }
-    try:
-        response = requests.post(url, json=payload, headers=headers)
-        response.raise_for_status()
-        logger.info(f"Control request sent successfully: {url}")
-    except Exception as e:
-        logger.error(f"Failed to send control request: {str(e)}")
+    return _send_control(asset_number, sub_asset_number, action_type, data)
+
+
+@shared_task
+def process_sub_asset_expiries():
+    """Deactivate expired rooms and vehicles and send their expiry commands (see core/expiry.py)"""
+    limit = 1000
+    swept = batch = sweep_expired_sub_assets(limit=limit)
+    while batch >= limit:
+        batch = sweep_expired_sub_assets(limit=limit)
+        swept += batch
+    sent = process_due_expiries()
+    if swept or sent:
+        logger.info(f"Expired {swept} sub-assets in bulk and sent {sent} scheduled expiry commands")
+
+
+@shared_task
+def maintain_event_partitions():
+    """Create upcoming AssetEvent partitions and expire old ones (see conf.yml event_partitioning)"""
+    if not is_partitioned():
+        logger.info("AssetEvent is not partitioned, run manage_event_partitions --convert to enable partition maintenance")
+        return
+    call_command('manage_event_partitions')
+
+
+@shared_task
+def update_daily_rollups():
+    """Refresh the daily analytics rollups of recent days (see core/rollups.py)"""
+    # overlap with the previous run so no late transaction update is missed
+    since = timezone.now() - timedelta(seconds=2 * settings.ANALYTICS_ROLLUP_INTERVAL)
+    update_recent_rollups(since)
 
 
 # ----------- Email & sms helpers -------------
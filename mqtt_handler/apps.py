@@ -5,5 +5,6 @@ class MqttHandlerConfig(AppConfig):
     name = 'mqtt_handler'
 
     def ready(self):
+        import mqtt_handler.signals
         from .management.commands.mqtt_subscriber import start_mqtt_subscriber
         start_mqtt_subscriber()  # Start the MQTT subscriber thread
@@ -0,0 +1,310 @@
+"""
+Ingestion benchmark: replay a stream of MQTT messages into MQTTSubscriber and measure it.
+
+A stream is a list of (topic, payload) pairs, generated for the rooms and vehicles in the
+database (synthetic_stream) or recorded with `mosquitto_sub -v` (read_stream). run_benchmark()
+feeds it to a fresh subscriber, with its own worker pool, event buffer, resolver and location
+accumulator, either directly through on_message() or through LocalBroker, so the paho network
+path is included without an external broker. It reports the throughput from the first message
+to the last event written, the handling latency of the workers, the database queries per
+message and the memory growth.
+"""
+import contextlib
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.client import topic_matches_sub
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from core.models import HotelRoom, Vehicle
+from .buffer import EventBuffer
+from .localbroker import LocalBroker
+from .location import LocationAccumulator
+from .management.commands.mqtt_subscriber import TOPICS, MQTTSubscriber, extract_event_info
+from .metrics import LatencyStats
+from .resolver import SubAssetResolver
+from .workers import IngestWorkerPool
+
+
+def synthetic_stream(count, devices=1000, unknown_share=0.0, seed=0):
+    """
+    `count` messages from up to `devices` rooms and vehicles of the database: occupancy, access
+    and electricity reports of rooms, mostly GPS fixes (a random walk) and some ignition and
+    passenger counts of vehicles. unknown_share of the messages come from devices that do not exist.
+    """
+    rng = random.Random(seed)
+    half = max(devices // 2, 1)
+    sub_assets = [
+        ('rooms', hotel, number, None)
+        for hotel, number in HotelRoom.objects.order_by('hotel_id', 'room_number').values_list('hotel_id', 'room_number')[:half]
+    ]
+    sub_assets += [
+        ('vehicles', fleet, number, [latitude or 6.5, longitude or 3.4])
+        for fleet, number, latitude, longitude in Vehicle.objects.order_by('fleet_id', 'vehicle_number').values_list(
+            'fleet_id', 'vehicle_number', 'last_latitude', 'last_longitude'
+        )[:devices - len(sub_assets)]
+    ]
+    if not sub_assets:
+        raise ValueError("There are no rooms or vehicles to generate messages for")
+
+    stream = []
+    for _ in range(count):
+        if rng.random() < unknown_share:
+            stream.append((f'vehicles/UNKNOWN/{rng.randrange(1000)}/ignition', b'turn_on'))
+            continue
+
+        kind, asset_number, number, position = rng.choice(sub_assets)
+        if kind == 'rooms':
+            event_type = rng.choice(['occupancy', 'access', 'electricity'])
+            payload = {'occupancy': rng.choice(['0', '1']), 'access': rng.choice(['lock', 'unlock']),
+                       'electricity': rng.choice(['on', 'off'])}[event_type]
+        elif rng.random() < 0.8:
+            event_type = 'location'
+            position[0] += rng.uniform(-0.001, 0.001)
+            position[1] += rng.uniform(-0.001, 0.001)
+            payload = f'{position[0]:.6f},{position[1]:.6f}'
+        else:
+            event_type = rng.choice(['ignition', 'passenger_count'])
+            payload = rng.choice(['turn_on', 'turn_off']) if event_type == 'ignition' else str(rng.randrange(15))
+        stream.append((f'{kind}/{asset_number}/{number}/{event_type}', payload.encode()))
+    return stream
+
+
+def read_stream(path):
+    """
+    Read a stream recorded with `mosquitto_sub -v` ("<topic> <payload>" lines) or written by write_stream().
+    """
+    stream = []
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.rstrip(b'\r\n')
+            if line:
+                topic, _, payload = line.partition(b' ')
+                stream.append((topic.decode(), payload))
+    return stream
+
+
+def write_stream(stream, path):
+    with open(path, 'wb') as f:
+        for topic, payload in stream:
+            f.write(topic.encode() + b' ' + payload + b'\n')
+
+
+class QueryCounter:
+    """
+    Counts the queries of every database connection, including those opened by other threads
+    while it is active, and the connections opened.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.connects = 0
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def _connected(self, sender=None, connection=None, **kwargs):
+        with self._lock:
+            self.connects += 1
+        self._install(connection)
+
+    def _install(self, connection):
+        # connection_created is sent again when a connection reconnects
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+            with self._lock:
+                self._connections.append(connection)
+
+    def __enter__(self):
+        connection_created.connect(self._connected)
+        for connection in connections.all(initialized_only=True):
+            self._install(connection)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self._connected)
+        for connection in self._connections:
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+def make_subscriber(broker='127.0.0.1', port=1883, workers=None, window=100_000):
+    """
+    A subscriber with private components, so the benchmark neither shares state with nor
+    disturbs the one running in this process.
+    """
+    subscriber = MQTTSubscriber(
+        broker, port, TOPICS,
+        buffer=EventBuffer(
+            max_size=settings.MQTT_EVENT_BUFFER_SIZE,
+            flush_size=settings.MQTT_EVENT_FLUSH_SIZE,
+            flush_interval=settings.MQTT_EVENT_FLUSH_INTERVAL,
+            block_timeout=settings.MQTT_EVENT_BLOCK_TIMEOUT,
+        ),
+        resolver=SubAssetResolver(max_entries=settings.MQTT_RESOLVER_CACHE_SIZE, ttl=settings.MQTT_RESOLVER_CACHE_TTL),
+        locations=LocationAccumulator(flush_interval=settings.MQTT_LOCATION_FLUSH_INTERVAL),
+    )
+    subscriber.workers = IngestWorkerPool(
+        subscriber.process_message,
+        workers=workers or settings.MQTT_INGEST_WORKERS,
+        queue_size=settings.MQTT_INGEST_QUEUE_SIZE,
+        put_timeout=settings.MQTT_INGEST_PUT_TIMEOUT,
+    )
+    # percentiles over the whole run instead of the last samples
+    subscriber.workers.queue_wait = LatencyStats(window=window)
+    subscriber.workers.handling = LatencyStats(window=window)
+    return subscriber
+
+
+def run_benchmark(stream, mode='direct', workers=None, qos=0, timeout=300, trace_memory=False):
+    """
+    Replay `stream` into a new subscriber and return its measurements. `mode` is 'direct'
+    (on_message() is called for each message) or 'broker' (published to a LocalBroker the
+    subscriber is connected to, at `qos`).
+    """
+    if mode not in ('direct', 'broker'):
+        raise ValueError(f"Unknown mode {mode!r}")
+    expected = sum(1 for topic, _ in stream if _is_supported(topic, subscribed_only=mode == 'broker'))
+    broker = LocalBroker().start() if mode == 'broker' else None
+    subscriber = make_subscriber(port=broker.port if broker else 1883, workers=workers, window=max(len(stream), 1))
+
+    if trace_memory:
+        tracemalloc.start()
+    rss_before = _peak_rss_kb()
+    # the subscriber prints every message, which would dominate the output
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), QueryCounter() as queries:
+        try:
+            started_at = time.perf_counter()
+            if broker:
+                _replay_through_broker(subscriber, broker, stream, qos, timeout)
+            else:
+                subscriber.buffer.start()
+                subscriber.locations.start()
+                subscriber.workers.start()
+                for topic, payload in stream:
+                    message = mqtt.MQTTMessage(topic=topic.encode())
+                    message.payload = payload
+                    subscriber.on_message(None, None, message)
+
+            complete = _wait_until(lambda: _handled(subscriber.workers) >= expected, timeout)
+            handled_at = time.perf_counter()
+            subscriber.stop()
+            finished_at = time.perf_counter()
+        finally:
+            if broker:
+                broker.stop()
+    python_memory = tracemalloc.get_traced_memory() if trace_memory else None
+    if trace_memory:
+        tracemalloc.stop()
+
+    workers_stats = subscriber.workers.stats()
+    buffer_stats = subscriber.buffer.stats()
+    elapsed = finished_at - started_at
+    return {
+        'mode': mode,
+        'messages': len(stream),
+        'complete': complete,
+        'workers': len(subscriber.workers.queues),
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_sec': round(len(stream) / elapsed, 1) if elapsed else None,
+        'handled_per_sec': round(expected / (handled_at - started_at), 1) if handled_at > started_at else None,
+        'handled': workers_stats['latency']['handling']['count'],
+        'dropped': workers_stats['dropped'] + buffer_stats['dropped'],
+        'failed': workers_stats['failed'],
+        'events_written': buffer_stats['flushed'],
+        'latency': workers_stats['latency'],
+        'queries': queries.count,
+        'queries_per_message': round(queries.count / len(stream), 3) if stream else None,
+        'connections_opened': queries.connects,
+        'memory': {
+            'peak_rss_growth_kb': _peak_rss_kb() - rss_before,
+            'python_kb': round(python_memory[0] / 1024, 1) if python_memory else None,
+            'python_peak_kb': round(python_memory[1] / 1024, 1) if python_memory else None,
+        },
+        'resolver': subscriber.resolver.stats(),
+        'broker': broker.stats() if broker else None,
+    }
+
+
+def _replay_through_broker(subscriber, broker, stream, qos, timeout):
+    subscriber.start()
+    if not _wait_until(lambda: broker.subscriptions() >= len(TOPICS), timeout):
+        raise RuntimeError("The subscriber did not subscribe to the local broker")
+
+    published = threading.Event()
+    remaining = [len(stream)]
+
+    def on_publish(client, userdata, mid):
+        remaining[0] -= 1
+        if not remaining[0]:
+            published.set()
+
+    publisher = mqtt.Client()
+    publisher.max_queued_messages_set(0)
+    publisher.max_inflight_messages_set(1000)
+    publisher.on_publish = on_publish
+    publisher.connect(broker.host, broker.port)
+    publisher.loop_start()
+    try:
+        for topic, payload in stream:
+            publisher.publish(topic, payload, qos=qos)
+        if stream and not published.wait(timeout):
+            raise RuntimeError("The local broker did not take every message")
+    finally:
+        publisher.disconnect()
+        publisher.loop_stop()
+
+
+def _is_supported(topic, subscribed_only=False):
+    # the messages the subscriber hands to its workers
+    if subscribed_only and not any(topic_matches_sub(topic_filter, topic) for topic_filter in TOPICS):
+        return False
+    try:
+        extract_event_info(topic)
+    except (IndexError, ValueError):
+        return False
+    return True
+
+
+def _handled(workers):
+    return workers.handling.count + workers.dropped
+
+
+def _wait_until(condition, timeout, interval=0.01):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(interval)
+    return True
+
+
+def _peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # bytes on macOS, KB elsewhere
+
+
+def compare(before, after):
+    """
+    Lines comparing the main measurements of two run_benchmark() results.
+    """
+    rows = [
+        ('messages/s', lambda result: result['messages_per_sec']),
+        ('queries/message', lambda result: result['queries_per_message']),
+        ('handling p50 ms', lambda result: result['latency']['handling']['p50_ms']),
+        ('handling p99 ms', lambda result: result['latency']['handling']['p99_ms']),
+        ('peak RSS growth KB', lambda result: result['memory']['peak_rss_growth_kb']),
+    ]
+    return [f"{label:20} {value(before)!s:>12} -> {value(after)!s:>12}" for label, value in rows]
@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from django.db import close_old_connections, transaction
+
+from core.models import AssetEvent, SubAssetState
+from .metrics import LatencyStats
+
+
+logger = logging.getLogger(__name__)
+
+
+class EventBuffer:
+    """
+    Bounded in-memory buffer of unsaved AssetEvent instances.
+
+    Events are written with a single bulk_create once `flush_size` events are pending
+    or every `flush_interval` seconds, whichever comes first. The latest event of each
+    sub-asset and type is upserted into SubAssetState in the same transaction.
+
+    Backpressure: when `max_size` events are pending, add() blocks the caller for at most
+    `block_timeout` seconds waiting for a flush to free space. If the buffer is still full
+    the event is dropped and counted, so a stalled database can never grow memory unbounded.
+    close() stops accepting events and flushes whatever is left.
+    """
+
+    def __init__(self, max_size=10000, flush_size=500, flush_interval=1.0, block_timeout=0.5):
+        if flush_size > max_size:
+            raise ValueError("flush_size cannot be larger than max_size")
+
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()  # only one flush writes to the database at a time
+        self._flush_requested = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+
+        # counters
+        self.buffered = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.flush_latency = LatencyStats()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='asset-event-flusher', daemon=True)
+            self._thread.start()
+        return self
+
+    def add(self, event):
+        """
+        Queue an unsaved AssetEvent. Returns False if the event was dropped.
+        """
+        with self._not_full:
+            if self._closed.is_set():
+                self.dropped += 1
+                logger.warning("Event buffer is closed, dropping event")
+                return False
+
+            if len(self._events) >= self.max_size:
+                self._flush_requested.set()
+                self._not_full.wait_for(lambda: len(self._events) < self.max_size, timeout=self.block_timeout)
+                if len(self._events) >= self.max_size:
+                    self.dropped += 1
+                    logger.warning(f"Event buffer full ({self.max_size} pending), dropping {event.event_type} event")
+                    return False
+
+            self._events.append(event)
+            self.buffered += 1
+            if len(self._events) >= self.flush_size:
+                self._flush_requested.set()
+        return True
+
+    def flush(self):
+        """
+        Write all pending events to the database. Returns the number of events written.
+        """
+        with self._flush_lock:
+            with self._not_full:
+                batch = list(self._events)
+                self._events.clear()
+                self._not_full.notify_all()
+
+            if not batch:
+                return 0
+
+            started_at = time.monotonic()
+            try:
+                with transaction.atomic():
+                    AssetEvent.objects.bulk_create(batch, batch_size=self.flush_size)
+                    SubAssetState.record(batch)
+            except Exception as e:
+                with self._lock:
+                    self.dropped += len(batch)
+                logger.error(f"Failed to flush {len(batch)} asset events: {str(e)}", exc_info=True)
+                return 0
+
+            self.flush_latency.record(time.monotonic() - started_at)
+            with self._lock:
+                self.flushed += len(batch)
+            return len(batch)
+
+    def close(self, timeout=None):
+        """
+        Stop accepting events, stop the flusher thread and flush everything still pending.
+        """
+        self._closed.set()
+        self._flush_requested.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    @property
+    def pending(self):
+        return len(self._events)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._events),
+                'buffered': self.buffered,
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+                'flush_latency': self.flush_latency.summary(),
+            }
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            if self._closed.is_set():
+                break  # close() does the final flush on the calling thread
+            close_old_connections()
+            self.flush()
@@ -0,0 +1,92 @@
+"""
+Control commands for rooms and vehicles, shared by ControlAssetView and the celery tasks.
+
+send_control_command() validates the sub-asset and action, publishes the command through the
+process-wide publisher (recorded in the command ledger) and logs the AssetEvent. Callers are
+responsible for checking that the user may control the asset; commands without a user are
+sent on behalf of the system.
+"""
+from django.contrib.contenttypes.models import ContentType
+
+from core.identity import system_identity
+from core.models import AssetEvent, HotelRoom, SubAssetState, Vehicle
+from .ledger import ledger
+
+
+class ControlError(Exception):
+    """
+    The command was rejected before publishing; status_code is the matching HTTP status.
+    """
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# asset type -> first level of its sub-assets' topics
+TOPIC_PREFIXES = {'hotel': 'rooms', 'vehicle': 'vehicles'}
+
+
+def control_topic(asset_type, asset_number, sub_asset_id, action_type):
+    return f"{TOPIC_PREFIXES[asset_type]}/{asset_number}/{sub_asset_id}/{action_type}"
+
+
+def is_system_user(user):
+    return user is None or system_identity.is_system_user(user)
+
+
+def send_control_command(asset, sub_asset_id, action_type, data, user=None, update_status=False, force=False):
+    """
+    Publish `data` to the sub-asset's action topic and log it. Returns the ControlCommand.
+
+    Raises ControlError for an unknown sub-asset, an invalid action or a sub-asset that is in
+    use (rooms may still be controlled by the system, vehicles only with `force`, which only the
+    expiry path passes), and PublishQueueFull when the broker has been unreachable for too long.
+    update_status deactivates the sub-asset once the command is sent (used on expiry).
+    """
+    if asset.asset_type == 'hotel':
+        # Validate the sub-asset (room)
+        try:
+            sub_asset = HotelRoom.objects.get(room_number=sub_asset_id, hotel=asset)
+        except HotelRoom.DoesNotExist:
+            raise ControlError('Room not found for the specified hotel.', status_code=404)
+        if sub_asset.status and not is_system_user(user):
+            raise ControlError('Cannot control an active hotel room. Please check out the guest first.')
+
+        if action_type not in ('electricity', 'access'):
+            raise ControlError(f'Invalid action type for {asset.asset_type} asset.')
+
+    elif asset.asset_type == 'vehicle':
+        # Validate the sub-asset (vehicle)
+        try:
+            sub_asset = Vehicle.objects.get(vehicle_number=sub_asset_id, fleet=asset)
+        except Vehicle.DoesNotExist:
+            raise ControlError('Vehicle not found for the specified fleet.', status_code=404)
+        if sub_asset.status and not force:
+            raise ControlError('Cannot control an active vehicle. Please ensure the vehicle is parked and not in use.')
+
+        if action_type != 'ignition':
+            raise ControlError(f'Invalid action type for {asset.asset_type} asset.')
+
+    else:
+        raise ControlError('Invalid asset type.')
+
+    topic = control_topic(asset.asset_type, asset.asset_number, sub_asset_id, action_type)
+    command = ledger.send(asset, sub_asset_id, action_type, topic, data, user=user)
+
+    # Log the action with sub-asset
+    event = AssetEvent.objects.create(
+        asset=asset,
+        event_type=action_type,
+        data=data,
+        timestamp=command.published_at,
+        content_type=ContentType.objects.get_for_model(sub_asset),
+        object_id=sub_asset_id
+    )
+    SubAssetState.record([event])
+
+    if update_status:
+        sub_asset.status = False
+        sub_asset.save(update_fields=['status'])
+
+    return command
@@ -0,0 +1,227 @@
+import atexit
+import logging
+import threading
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Aggregate, Count, DurationField, F, Q, Subquery
+from django.utils import timezone
+
+from core.models import ControlCommand
+from .publisher import PublishQueueFull, get_publisher
+
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 95, 99)
+
+
+class Percentile(Aggregate):
+    """
+    PostgreSQL percentile_cont over a duration, e.g. Percentile(F('acked_at') - F('published_at'), 0.95).
+    """
+    function = 'percentile_cont'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = DurationField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+class CommandLedger:
+    """
+    Records every control command in ControlCommand and follows it until the device confirms it.
+
+    send() writes the row and publishes through the shared publisher with the row's pk attached
+    to the publish. Broker acknowledgements arrive on the paho network thread; they are only
+    collected there and written by a background thread every `flush_interval` seconds with one
+    bulk_update. Device confirmations arrive on the subscriber's worker threads: confirm() marks
+    the oldest unconfirmed command with the same asset, sub-asset, action and payload that was
+    published at most `confirm_window` seconds earlier.
+    """
+
+    def __init__(self, publisher=None, flush_interval=1.0, confirm_window=60):
+        self._publisher = publisher
+        self.flush_interval = flush_interval
+        self.confirm_window = confirm_window
+        self._acks = []  # (pk, acked_at) not written yet
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+
+        # counters
+        self.sent = 0
+        self.dropped = 0
+        self.confirmed = 0
+        self.unmatched_confirmations = 0
+        self.failed_flushes = 0
+
+    @property
+    def publisher(self):
+        return self._publisher or get_publisher()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='control-command-acks', daemon=True)
+                self._thread.start()
+        return self
+
+    def send(self, asset, sub_asset_id, action_type, topic, payload, user=None, retain=True):
+        """
+        Record and publish a command. Returns the ControlCommand; raises PublishQueueFull
+        (after marking the command as dropped) when the publisher cannot take it.
+        """
+        if self._thread is None:
+            self.start()
+        command = ControlCommand.objects.create(
+            asset=asset,
+            sub_asset_id=sub_asset_id,
+            action_type=action_type,
+            payload=payload,
+            topic=topic,
+            qos=self.publisher.qos,
+            user=user if user is not None and user.is_authenticated else None,
+        )
+        try:
+            self.publisher.publish(topic, payload, retain=retain, on_ack=partial(self.acked, command.pk))
+        except PublishQueueFull:
+            self.dropped += 1
+            ControlCommand.objects.filter(pk=command.pk).update(dropped=True)
+            raise
+        self.sent += 1
+        return command
+
+    def send_many(self, commands, retain=True):
+        """
+        Record unsaved ControlCommand instances with one bulk insert and publish them in order.
+        Returns (published, dropped); once the publisher's queue is full the remaining commands
+        are marked as dropped and not published.
+        """
+        if self._thread is None:
+            self.start()
+        if not commands:
+            return [], []
+        qos = self.publisher.qos
+        for command in commands:
+            command.qos = qos
+        ControlCommand.objects.bulk_create(commands)
+
+        for index, command in enumerate(commands):
+            try:
+                self.publisher.publish(command.topic, command.payload, retain=retain, on_ack=partial(self.acked, command.pk))
+            except PublishQueueFull:
+                dropped = commands[index:]
+                for command in dropped:
+                    command.dropped = True
+                ControlCommand.objects.filter(pk__in=[command.pk for command in dropped]).update(dropped=True)
+                self.sent += index
+                self.dropped += len(dropped)
+                return commands[:index], dropped
+        self.sent += len(commands)
+        return commands, []
+
+    def acked(self, pk, acked_at):
+        with self._lock:
+            self._acks.append((pk, acked_at))
+
+    def confirm(self, asset_number, sub_asset_id, action_type, payload, received_at):
+        """
+        Mark the command a device state message answers. Returns True if one was pending.
+        """
+        pending = ControlCommand.objects.filter(
+            asset_id=asset_number,
+            sub_asset_id=sub_asset_id,
+            action_type=action_type,
+            payload=payload,
+            dropped=False,
+            confirmed_at__isnull=True,
+            published_at__gte=received_at - timedelta(seconds=self.confirm_window),
+            published_at__lte=received_at,
+        ).order_by('published_at').values('pk')[:1]
+        matched = ControlCommand.objects.filter(pk__in=Subquery(pending)).update(confirmed_at=received_at) > 0
+        if matched:
+            self.confirmed += 1
+        else:
+            self.unmatched_confirmations += 1
+        return matched
+
+    def flush(self):
+        with self._lock:
+            acks, self._acks = self._acks, []
+        if not acks:
+            return 0
+        try:
+            ControlCommand.objects.bulk_update(
+                [ControlCommand(pk=pk, acked_at=acked_at) for pk, acked_at in acks], ['acked_at'], batch_size=500
+            )
+        except Exception:
+            self.failed_flushes += 1
+            logger.exception(f"Failed to record {len(acks)} command acknowledgements")
+            return 0
+        return len(acks)
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            close_old_connections()
+            self.flush()
+        close_old_connections()
+
+    def close(self):
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'confirmed': self.confirmed,
+            'unmatched_confirmations': self.unmatched_confirmations,
+            'pending_acks': len(self._acks),
+            'failed_flushes': self.failed_flushes,
+        }
+
+
+def command_latency(since, confirm_window=None):
+    """
+    Delivery counts and ack / end-to-end latency percentiles (ms) of commands published
+    after `since`, per asset type. Commands without a confirmation after `confirm_window`
+    seconds are counted as lost.
+    """
+    confirm_window = settings.MQTT_COMMAND_CONFIRM_WINDOW if confirm_window is None else confirm_window
+    lost_before = timezone.now() - timedelta(seconds=confirm_window)
+    ack_latency = F('acked_at') - F('published_at')
+    confirm_latency = F('confirmed_at') - F('published_at')
+
+    aggregates = {
+        'sent': Count('id'),
+        'queue_full': Count('id', filter=Q(dropped=True)),  # not 'dropped', which would shadow the field
+        'acked': Count('id', filter=Q(acked_at__isnull=False)),
+        'confirmed': Count('id', filter=Q(confirmed_at__isnull=False)),
+        'lost': Count('id', filter=Q(dropped=False, confirmed_at__isnull=True, published_at__lt=lost_before)),
+    }
+    for pct in PERCENTILES:
+        aggregates[f'ack_p{pct}_ms'] = Percentile(ack_latency, pct / 100)
+        aggregates[f'confirm_p{pct}_ms'] = Percentile(confirm_latency, pct / 100)
+
+    rows = ControlCommand.objects.filter(published_at__gte=since).values('asset__asset_type').annotate(**aggregates)
+
+    result = {}
+    for row in rows:
+        asset_type = row.pop('asset__asset_type')
+        result[asset_type] = {
+            key: round(value.total_seconds() * 1000, 3) if isinstance(value, timedelta) else value
+            for key, value in row.items()
+        }
+    return result
+
+
+ledger = CommandLedger(
+    flush_interval=settings.MQTT_COMMAND_ACK_FLUSH_INTERVAL,
+    confirm_window=settings.MQTT_COMMAND_CONFIRM_WINDOW,
+)
+atexit.register(ledger.close)
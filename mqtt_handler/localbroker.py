@@ -0,0 +1,237 @@
+import logging
+import socket
+import socketserver
+import struct
+import threading
+
+from paho.mqtt.client import topic_matches_sub
+
+
+logger = logging.getLogger(__name__)
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 0x10, 0x20, 0x30, 0x40
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 0x80, 0x90, 0xA0, 0xB0
+PINGREQ, PINGRESP, DISCONNECT = 0xC0, 0xD0, 0xE0
+
+
+def _packet(header, body=b''):
+    # fixed header with the variable length "remaining length" encoding
+    length, encoded = len(body), bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            break
+    return bytes([header]) + bytes(encoded) + body
+
+
+def _string(value):
+    return struct.pack('!H', len(value)) + value
+
+
+class _Session:
+    def __init__(self, sock):
+        self.sock = sock
+        self.subscriptions = {}  # topic filter -> granted QoS
+        self._send_lock = threading.Lock()
+        self._packet_id = 0
+
+    def send(self, data):
+        with self._send_lock:
+            self.sock.sendall(data)
+
+    def deliver(self, topic, payload, qos, retain=False):
+        body = _string(topic)
+        if qos:
+            with self._send_lock:
+                self._packet_id = self._packet_id % 65535 + 1
+                packet_id = self._packet_id
+            body += struct.pack('!H', packet_id)
+        self.send(_packet(PUBLISH | (qos << 1) | int(retain), body + payload))
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.broker._serve(self.request, self._read_packet)
+
+    def _read(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("client closed the connection")
+            data += chunk
+        return data
+
+    def _read_packet(self):
+        header = self._read(1)[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = self._read(1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return header, self._read(length) if length else b''
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class LocalBroker:
+    """
+    In-process MQTT 3.1.1 broker stand-in, so the subscriber can be exercised through paho
+    without an external broker (benchmarks and tests).
+
+    Supports CONNECT, SUBSCRIBE/UNSUBSCRIBE with + and # wildcards, PUBLISH at QoS 0 and 1
+    (acknowledged, and delivered at the lower of the publish and subscription QoS), retained
+    messages, PINGREQ and DISCONNECT. There is no authentication, no persistent session, no QoS 2
+    and no will message.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self._sessions = []
+        self._retained = {}  # topic -> (payload, qos)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+        # counters
+        self.received = 0
+        self.delivered = 0
+
+    def start(self):
+        if self._server is None:
+            self._server = _Server((self.host, self.port), _Handler)
+            self._server.broker = self
+            self.host, self.port = self._server.server_address[:2]
+            self._thread = threading.Thread(target=self._server.serve_forever, name='mqtt-local-broker', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            with self._lock:
+                sessions, self._sessions = self._sessions, []
+            for session in sessions:
+                try:
+                    session.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self._thread.join()
+            self._server = self._thread = None
+
+    def subscriptions(self):
+        with self._lock:
+            return sum(len(session.subscriptions) for session in self._sessions)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._sessions),
+                'subscriptions': sum(len(session.subscriptions) for session in self._sessions),
+                'retained': len(self._retained),
+                'received': self.received,
+                'delivered': self.delivered,
+            }
+
+    def _serve(self, sock, read_packet):
+        session = _Session(sock)
+        try:
+            header, body = read_packet()
+            if header & 0xF0 != CONNECT:
+                return
+            session.send(_packet(CONNACK, b'\x00\x00'))
+            with self._lock:
+                self._sessions.append(session)
+
+            while True:
+                header, body = read_packet()
+                kind = header & 0xF0
+                if kind == PUBLISH:
+                    self._publish(session, header, body)
+                elif kind == SUBSCRIBE:
+                    self._subscribe(session, body)
+                elif kind == UNSUBSCRIBE:
+                    self._unsubscribe(session, body)
+                elif kind == PINGREQ:
+                    session.send(_packet(PINGRESP))
+                elif kind == DISCONNECT:
+                    return
+                # PUBACKs of the messages we deliver need no bookkeeping
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self._lock:
+                if session in self._sessions:
+                    self._sessions.remove(session)
+
+    def _publish(self, session, header, body):
+        qos, retain = (header >> 1) & 0x03, header & 0x01
+        length, = struct.unpack('!H', body[:2])
+        topic, offset = body[2:2 + length], 2 + length
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+        payload = body[offset:]
+
+        with self._lock:
+            self.received += 1
+            if retain:
+                if payload:
+                    self._retained[topic] = (payload, qos)
+                else:
+                    self._retained.pop(topic, None)
+            topic_name = topic.decode()
+            targets = []
+            for subscriber in self._sessions:
+                granted = [
+                    granted_qos for topic_filter, granted_qos in subscriber.subscriptions.items()
+                    if topic_matches_sub(topic_filter, topic_name)
+                ]
+                if granted:
+                    targets.append((subscriber, min(qos, max(granted))))
+            self.delivered += len(targets)
+
+        if qos:
+            session.send(_packet(PUBACK, packet_id))
+        for subscriber, delivery_qos in targets:
+            try:
+                subscriber.deliver(topic, payload, delivery_qos)
+            except OSError:
+                logger.debug("Dropping message for a disconnected client")
+
+    def _subscribe(self, session, body):
+        packet_id, offset, granted, retained = body[:2], 2, [], []
+        while offset < len(body):
+            length, = struct.unpack('!H', body[offset:offset + 2])
+            topic_filter = body[offset + 2:offset + 2 + length].decode()
+            qos = min(body[offset + 2 + length], 1)
+            offset += 3 + length
+            with self._lock:
+                session.subscriptions[topic_filter] = qos
+                retained += [
+                    (topic, payload, min(qos, retained_qos)) for topic, (payload, retained_qos) in self._retained.items()
+                    if topic_matches_sub(topic_filter, topic.decode())
+                ]
+            granted.append(qos)
+
+        session.send(_packet(SUBACK, packet_id + bytes(granted)))
+        for topic, payload, delivery_qos in retained:
+            session.deliver(topic, payload, delivery_qos, retain=True)
+
+    def _unsubscribe(self, session, body):
+        packet_id, offset = body[:2], 2
+        while offset < len(body):
+            length, = struct.unpack('!H', body[offset:offset + 2])
+            with self._lock:
+                session.subscriptions.pop(body[offset + 2:offset + 2 + length].decode(), None)
+            offset += 2 + length
+        session.send(_packet(UNSUBACK, packet_id))
@@ -0,0 +1,167 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+
+from core.models import Vehicle
+from utils.geo import track_distances
+
+
+logger = logging.getLogger(__name__)
+
+LOCATION_FIELDS = ['last_latitude', 'last_longitude', 'total_distance']
+
+
+class _VehicleTrack:
+    __slots__ = ('latitude', 'longitude', 'fixes')
+
+    def __init__(self, latitude, longitude):
+        # last position included in a flush; the next segment is measured from here
+        self.latitude = latitude
+        self.longitude = longitude
+        self.fixes = []  # (latitude, longitude) received since the last flush
+
+
+class LocationAccumulator:
+    """
+    Collects GPS fixes per vehicle in memory and periodically writes the latest position
+    and travelled distance with one bulk_update of the location fields only.
+
+    Distances of all pending fixes are computed together at flush time with the vectorised
+    helpers in utils/geo.py. total_distance is flushed as `F('total_distance') + pending`, so
+    other writers are never overwritten, and the position and distance of a vehicle are always
+    written together. After a restart the first fix of a vehicle is measured from the last
+    persisted position, so the distance covered while the process was down is still counted.
+    close() flushes everything that is pending.
+    """
+
+    def __init__(self, flush_interval=5.0, method='ellipsoidal'):
+        self.flush_interval = flush_interval
+        self.method = method
+        self._tracks = {}  # vehicle pk -> _VehicleTrack
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+
+        # counters
+        self.fixes = 0
+        self.flushed_vehicles = 0
+        self.failed_flushes = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='vehicle-location-flusher', daemon=True)
+            self._thread.start()
+        return self
+
+    def add(self, vehicle_id, latitude, longitude):
+        """
+        Record a validated GPS fix.
+        """
+        with self._lock:
+            track = self._tracks.get(vehicle_id)
+        if track is None:
+            track = self._load_track(vehicle_id)
+
+        with self._lock:
+            track = self._tracks.setdefault(vehicle_id, track)
+            track.fixes.append((latitude, longitude))
+            self.fixes += 1
+
+    def flush(self):
+        """
+        Write the position and distance of every vehicle that moved since the last flush.
+        Returns the number of vehicles updated.
+        """
+        with self._flush_lock:
+            track_ids, latitudes, longitudes = [], [], []
+            with self._lock:
+                pending = {}
+                for vehicle_id, track in self._tracks.items():
+                    if not track.fixes:
+                        continue
+                    points = track.fixes
+                    if track.latitude is not None and track.longitude is not None:
+                        points = [(track.latitude, track.longitude)] + points
+                    pending[vehicle_id] = track.fixes
+                    track.fixes = []
+                    track_ids.extend([vehicle_id] * len(points))
+                    latitudes.extend(point[0] for point in points)
+                    longitudes.extend(point[1] for point in points)
+
+            if not pending:
+                return 0
+
+            distances = track_distances(track_ids, latitudes, longitudes, self.method)
+            vehicles = [
+                Vehicle(
+                    pk=vehicle_id,
+                    last_latitude=latitude,
+                    last_longitude=longitude,
+                    total_distance=F('total_distance') + distance
+                )
+                for vehicle_id, (distance, latitude, longitude) in distances.items()
+            ]
+
+            try:
+                Vehicle.objects.bulk_update(vehicles, LOCATION_FIELDS, batch_size=500)
+            except Exception as e:
+                # put the fixes back so the next flush retries them
+                with self._lock:
+                    for vehicle_id, fixes in pending.items():
+                        track = self._tracks.get(vehicle_id)
+                        if track is not None:
+                            track.fixes = fixes + track.fixes
+                    self.failed_flushes += 1
+                logger.error(f"Failed to flush locations of {len(pending)} vehicles: {str(e)}", exc_info=True)
+                return 0
+
+            with self._lock:
+                for vehicle_id, (_, latitude, longitude) in distances.items():
+                    track = self._tracks.get(vehicle_id)
+                    if track is not None:
+                        track.latitude, track.longitude = latitude, longitude
+                self.flushed_vehicles += len(pending)
+            return len(pending)
+
+    def forget(self, vehicle_id):
+        """
+        Drop the in-memory track of a vehicle (e.g. after it was deleted).
+        """
+        with self._lock:
+            self._tracks.pop(vehicle_id, None)
+
+    def close(self, timeout=None):
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tracked_vehicles': len(self._tracks),
+                'pending_vehicles': sum(1 for track in self._tracks.values() if track.fixes),
+                'fixes': self.fixes,
+                'flushed_vehicles': self.flushed_vehicles,
+                'failed_flushes': self.failed_flushes,
+            }
+
+    def _load_track(self, vehicle_id):
+        # resume from the last persisted position
+        location = Vehicle.objects.filter(pk=vehicle_id).values_list('last_latitude', 'last_longitude').first()
+        if location is None:
+            raise Vehicle.DoesNotExist(f"Vehicle {vehicle_id} does not exist")
+        return _VehicleTrack(*location)
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            close_old_connections()
+            self.flush()
+
+
+accumulator = LocationAccumulator(flush_interval=settings.MQTT_LOCATION_FLUSH_INTERVAL)
@@ -0,0 +1,109 @@
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from mqtt_handler.bench import compare, read_stream, run_benchmark, synthetic_stream, write_stream
+from .mqtt_subscriber import get_subscriber
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a synthetic or recorded stream of device messages into a fresh MQTT subscriber and report "
+        "its throughput, handling latency, queries per message and memory growth. Events are written to the "
+        "database, so run it against a scratch database (e.g. one seeded with seed_load_data)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10000, help="Messages of the synthetic stream.")
+        parser.add_argument('--devices', type=int, default=1000, help="Rooms and vehicles the synthetic stream comes from.")
+        parser.add_argument('--unknown-share', type=float, default=0.0, help="Share of messages from devices that do not exist.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic stream.")
+        parser.add_argument('--stream', help="Replay this file instead (`mosquitto_sub -v` output, one \"<topic> <payload>\" per line).")
+        parser.add_argument('--record', help="Write the stream to this file, to replay the same messages later.")
+        parser.add_argument(
+            '--mode', choices=['direct', 'broker', 'both'], default='both',
+            help="Call on_message() directly, publish through an in-process broker, or both.",
+        )
+        parser.add_argument('--workers', type=int, help="Ingest worker threads (default: MQTT_INGEST_WORKERS).")
+        parser.add_argument('--qos', type=int, choices=[0, 1], default=0, help="QoS of the messages in broker mode.")
+        parser.add_argument('--trace-memory', action='store_true', help="Also measure Python allocations (slower).")
+        parser.add_argument('--timeout', type=float, default=300, help="Seconds to wait for the messages to be handled.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="JSON file of an earlier run to compare the results with.")
+
+    def handle(self, *args, **options):
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError("--workers must be positive")
+        if not 0 <= options['unknown_share'] <= 1:
+            raise CommandError("--unknown-share must be between 0 and 1")
+
+        if options['stream']:
+            stream = read_stream(options['stream'])
+        else:
+            try:
+                stream = synthetic_stream(options['messages'], options['devices'], options['unknown_share'], options['seed'])
+            except ValueError as e:
+                raise CommandError(str(e))
+        if not stream:
+            raise CommandError("The stream has no messages")
+        if options['record']:
+            write_stream(stream, options['record'])
+
+        # the subscriber started by the app would compete for the database and count in the queries
+        subscriber = get_subscriber()
+        if subscriber is not None:
+            subscriber.stop()
+
+        modes = ['direct', 'broker'] if options['mode'] == 'both' else [options['mode']]
+        results = {}
+        for mode in modes:
+            result = run_benchmark(
+                stream, mode, workers=options['workers'], qos=options['qos'], timeout=options['timeout'],
+                trace_memory=options['trace_memory'],
+            )
+            results[mode] = result
+            handling = result['latency']['handling']
+            self.stdout.write(
+                f"{mode:6} {result['messages']} messages in {result['elapsed_s']} s: {result['messages_per_sec']} messages/s, "
+                f"handling p50 {handling['p50_ms']} ms p99 {handling['p99_ms']} ms, "
+                f"{result['queries_per_message']} queries/message, {result['events_written']} events written, "
+                f"{result['dropped']} dropped, {result['failed']} failed, "
+                f"peak RSS +{result['memory']['peak_rss_growth_kb']} KB"
+            )
+            if not result['complete']:
+                self.stderr.write(f"{mode}: not every message was handled within {options['timeout']} s")
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                before = json.load(f)
+            self.stdout.write(f"Compared with {before.get('commit') or options['compare']}:")
+            for mode, result in results.items():
+                if mode in before['results']:
+                    self.stdout.write(f"{mode}:")
+                    for line in compare(before['results'][mode], result):
+                        self.stdout.write(f"  {line}")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'commit': self.commit(),
+                    'run_at': timezone.now().isoformat(),
+                    'stream': options['stream'] or {
+                        'messages': options['messages'],
+                        'devices': options['devices'],
+                        'unknown_share': options['unknown_share'],
+                        'seed': options['seed'],
+                    },
+                    'results': results,
+                }, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
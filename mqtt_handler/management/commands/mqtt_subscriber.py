@@ -1,17 +1,39 @@
+import atexit
 import threading
 import paho.mqtt.client as mqtt
-from core.models import AssetEvent, HotelRoom, Vehicle, Asset
+from django.conf import settings
 from django.utils import timezone
-from django.contrib.contenttypes.models import ContentType
+from mqtt_handler.buffer import EventBuffer
+from mqtt_handler.ledger import ledger as default_ledger
+from mqtt_handler.resolver import resolver as default_resolver
+from mqtt_handler.location import accumulator as default_accumulator
+from mqtt_handler.workers import IngestWorkerPool
 import math
 
+_subscriber = None
+
 class MQTTSubscriber(threading.Thread):
-    def __init__(self, broker, port, topics):
-        super().__init__()
+    def __init__(self, broker, port, topics, buffer=None, resolver=None, locations=None, ledger=None):
+        super().__init__(daemon=True)  # must not keep the process alive; stop() flushes on shutdown
         self.broker = broker
         self.port = port
         self.topics = topics
         self.client = mqtt.Client()
+        self.resolver = resolver or default_resolver
+        self.locations = locations or default_accumulator
+        self.ledger = ledger or default_ledger
+        self.buffer = buffer or EventBuffer(
+            max_size=settings.MQTT_EVENT_BUFFER_SIZE,
+            flush_size=settings.MQTT_EVENT_FLUSH_SIZE,
+            flush_interval=settings.MQTT_EVENT_FLUSH_INTERVAL,
+            block_timeout=settings.MQTT_EVENT_BLOCK_TIMEOUT,
+        )
+        self.workers = IngestWorkerPool(
+            self.process_message,
+            workers=settings.MQTT_INGEST_WORKERS,
+            queue_size=settings.MQTT_INGEST_QUEUE_SIZE,
+            put_timeout=settings.MQTT_INGEST_PUT_TIMEOUT,
+        )
 
     def on_connect(self, client, userdata, flags, rc):
         print(f"Connected to MQTT broker with result code: {rc}")
@@ -20,89 +42,64 @@ class MQTTSubscriber(threading.Thread):
             print(f"Subscribed to topic: {topic}")
 
     def on_message(self, client, userdata, message):
-        data = message.payload.decode()
-        print(f"Received message on {message.topic}: {data}")
-
+        """
+        Runs on the paho network thread: only parse the topic and hand the message to the
+        worker pool, sharded by device so per-device ordering is preserved.
+        """
+        received_at = timezone.now()
         try:
-            asset_number, object_id, event_type, content_type = extract_event_info(message.topic)
-            # print(f"Extracted info: asset_number={asset_number}, object_id={object_id}, event_type={event_type}")
+            _, asset_number, object_id, _ = extract_event_info(message.topic)
+        except (IndexError, ValueError):
+            print(f"Ignoring message on unsupported topic: {message.topic}")
+            return
+
+        self.workers.submit((asset_number, object_id), message.topic, message.payload, received_at)
 
-            # Check if the Asset exists
+    def process_message(self, topic, payload, received_at):
+        """
+        Runs on a DB worker thread: resolve the sub-asset and buffer the AssetEvent.
+        """
+        data = payload.decode()
+        print(f"Received message on {topic}: {data}")
+
+        # other errors reach the worker pool, which counts and logs them
+        try:
+            asset_type, asset_number, object_id, event_type = extract_event_info(topic)
+        except (ValueError, IndexError) as e:
+            print(f"Ignoring message on unsupported topic {topic}: {str(e)}")
+            return
+
+        # Devices confirm a control command by reporting the applied state on <topic>/state
+        if is_state_topic(topic):
+            if not self.ledger.confirm(asset_number, object_id, event_type, data, received_at):
+                print(f"No pending {event_type} command matches the state reported on {topic}")
+            return
+
+        # print(f"Extracted info: asset_number={asset_number}, object_id={object_id}, event_type={event_type}")
+
+        # Resolve the asset and sub-asset (cached, see mqtt_handler/resolver.py)
+        sub_asset = self.resolver.resolve(asset_type, asset_number, object_id)
+        if sub_asset is None:
+            print(f"Sub-asset {object_id} does not exist for asset {asset_number}.")
+            return
+
+        if asset_type == 'vehicles' and event_type == 'location':
             try:
-                asset = Asset.objects.get(asset_number=asset_number)
-            except Asset.DoesNotExist:
-                print(f"Asset with number {asset_number} does not exist.")
+                lat, lon = map(float, data.split(','))
+            except ValueError:
+                print(f"Invalid GPS data format: {data}")
                 return
 
-            # Determine if it's a vehicle or hotel room based on the content_type
-            if content_type == ContentType.objects.get_for_model(Vehicle):
-                try:
-                    vehicle = Vehicle.objects.get(vehicle_number=object_id, fleet=asset)
-                    stored_object_id = vehicle.vehicle_number
-
-                    if event_type == 'location':
-                        try:
-                            lat, lon = map(float, data.split(','))
-                            if self.is_valid_location(lat, lon):
-                                vehicle.update_location(lat, lon)
-                                # Create AssetEvent for valid location
-                                AssetEvent.objects.create(
-                                    asset=asset,
-                                    content_type=content_type,
-                                    object_id=stored_object_id,
-                                    event_type=event_type,
-                                    data=data,
-                                    timestamp=timezone.now()
-                                )
-                                print(f"Updated location for vehicle {object_id}: lat={lat}, lon={lon}")
-                            else:
-                                print(f"Invalid or potentially dangerous location data: lat={lat}, lon={lon}")
-                                return
-                        except ValueError:
-                            print(f"Invalid GPS data format: {data}")
-                            return
-
-                    else:
-                        # For non-location events, create AssetEvent as before
-                        AssetEvent.objects.create(
-                            asset=asset,
-                            content_type=content_type,
-                            object_id=stored_object_id,
-                            event_type=event_type,
-                            data=data,
-                            timestamp=timezone.now()
-                        )
-                        # print(f"Successfully created AssetEvent: asset_number={asset_number}, vehicle={stored_object_id}, event_type={event_type}")
-
-                except Vehicle.DoesNotExist:
-                    print(f"Vehicle with number {object_id} does not exist for asset {asset_number}.")
-                    return
-
-            elif content_type == ContentType.objects.get_for_model(HotelRoom):
-                try:
-                    room = HotelRoom.objects.get(room_number=object_id, hotel=asset)
-                    stored_object_id = room.room_number
-                     
-                     # Create AssetEvent for HotelRoom
-                    AssetEvent.objects.create(
-                        asset=asset,
-                        content_type=content_type,
-                        object_id=stored_object_id,
-                        event_type=event_type,
-                        data=data,
-                        timestamp=timezone.now()
-                    )
-                except HotelRoom.DoesNotExist:
-                    print(f"Hotel room with number {object_id} does not exist for asset {asset_number}.")
-                    return
-            else:
-                print(f"Unsupported content type: {content_type}")
+            if not self.is_valid_location(lat, lon):
+                print(f"Invalid or potentially dangerous location data: lat={lat}, lon={lon}")
                 return
 
-            # print(f"Successfully created AssetEvent for asset_number={asset_number}, {content_type.model}={stored_object_id}")
+            # Integrated in memory and written periodically (see mqtt_handler/location.py)
+            self.locations.add(sub_asset.sub_asset_id, lat, lon)
+            print(f"Updated location for vehicle {object_id}: lat={lat}, lon={lon}")
 
-        except Exception as e:
-            print(f"Error processing message: {str(e)}")
+        # Buffer AssetEvent for the sub-asset
+        self.buffer.add(sub_asset.make_event(event_type, data, received_at))
 
     def is_valid_location(self, lat, lon):
         """
@@ -123,12 +120,34 @@ class MQTTSubscriber(threading.Thread):
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
 
+        self.buffer.start()
+        self.locations.start()
+        self.workers.start()
         self.client.connect(self.broker, self.port, keepalive=60)
         self.client.loop_forever()
 
+    def stop(self):
+        """
+        Disconnect from the broker, drain the worker queues and flush any buffered events and locations.
+        """
+        self.client.disconnect()
+        self.workers.stop(timeout=30)
+        self.buffer.close()
+        self.locations.close()
+        print(f"MQTT subscriber stopped: {self.stats()}")
+
+    def stats(self):
+        return {
+            'workers': self.workers.stats(),
+            'buffer': self.buffer.stats(),
+            'resolver': self.resolver.stats(),
+            'locations': self.locations.stats(),
+            'commands': self.ledger.stats(),
+        }
+
 def extract_event_info(topic):
     """
-    Extract asset_number, object_id, event_type, and content_type from the topic string.
+    Extract asset_type, asset_number, object_id and event_type from the topic string.
     Example topic: "vehicles/TAS-0001-001/001/passengers"
     """
     topic_parts = topic.split('/')
@@ -137,27 +156,44 @@ def extract_event_info(topic):
     object_id = topic_parts[2]   # '001'
     event_type = topic_parts[3]  # 'passengers'
 
-    # Determine content type based on asset type
-    if asset_type == 'rooms':
-        content_type = ContentType.objects.get_for_model(HotelRoom)
-    elif asset_type == 'vehicles':
-        content_type = ContentType.objects.get_for_model(Vehicle)
-    else:
+    if asset_type not in ('rooms', 'vehicles'):
         raise ValueError("Unsupported asset type")
 
-    return asset_number, object_id, event_type, content_type
+    return asset_type, asset_number, object_id, event_type
+
+
+def is_state_topic(topic):
+    """
+    Whether the topic is a device state report, e.g. "rooms/TAS-0002-001/101/access/state".
+    """
+    return topic.count('/') == 4 and topic.endswith('/state')
+
+
+TOPICS = [
+    "rooms/+/+/occupancy",
+    "rooms/+/+/electricity",
+    "rooms/+/+/access",
+    "vehicles/+/+/location",
+    "vehicles/+/+/ignition",
+    "vehicles/+/+/passenger_count",
+    "vehicles/+/+/tampering",
+    "vehicles/+/+/payment",
+    "rooms/+/+/+/state",
+    "vehicles/+/+/+/state",
+]
 
 
 def start_mqtt_subscriber():
-    topics = [
-        "rooms/+/+/occupancy",
-        "rooms/+/+/electricity",
-        "rooms/+/+/access",
-        "vehicles/+/+/location",
-        "vehicles/+/+/ignition",
-        "vehicles/+/+/passenger_count",
-        "vehicles/+/+/tampering",
-        "vehicles/+/+/payment"
-    ]
-    subscriber = MQTTSubscriber("broker.emqx.io", 1883, topics) # Replace with your MQTT broker address
-    subscriber.start()
\ No newline at end of file
+    global _subscriber
+    subscriber = MQTTSubscriber(settings.MQTT_BROKER, settings.MQTT_PORT, TOPICS)
+    subscriber.start()
+    atexit.register(subscriber.stop)
+    _subscriber = subscriber
+    return subscriber
+
+
+def get_subscriber():
+    """
+    The subscriber running in this process, or None if it was not started (e.g. in tests).
+    """
+    return _subscriber
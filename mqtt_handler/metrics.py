@@ -0,0 +1,45 @@
+import threading
+from collections import deque
+
+
+class LatencyStats:
+    """
+    Thread-safe latency recorder: running count/mean/max plus percentiles over the most
+    recent `window` samples. Values are in seconds.
+    """
+
+    def __init__(self, window=2048):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, pct):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else None,
+            'p50_ms': _to_ms(self.percentile(50)),
+            'p99_ms': _to_ms(self.percentile(99)),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+def _to_ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
@@ -0,0 +1,160 @@
+import atexit
+import logging
+import threading
+
+import paho.mqtt.client as mqtt
+from django.conf import settings
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+
+class PublishQueueFull(Exception):
+    """
+    The outbound queue is full, usually because the broker has been unreachable for a while.
+    """
+
+
+class MQTTPublisher:
+    """
+    Process-wide MQTT client used to publish control commands.
+
+    The connection is opened once, in the background, and kept alive by paho's network
+    thread (loop_start), which also reconnects with a 1-30s backoff after the broker goes
+    away. publish() only hands the message to that thread and returns immediately, so a
+    request never waits on a TCP or MQTT handshake.
+
+    Messages published while disconnected are held by paho and sent once the connection is
+    back; QoS 1 messages that were in flight are re-sent. At most `queue_size` messages are
+    held; beyond that publish() raises PublishQueueFull instead of growing without bound.
+
+    publish(on_ack=...) calls on_ack(acked_at) on the network thread once the broker has
+    acknowledged the message (PUBACK for QoS 1, the write to the socket for QoS 0).
+    """
+
+    def __init__(self, broker, port=1883, queue_size=1000, qos=1, keepalive=60):
+        self.broker = broker
+        self.port = port
+        self.queue_size = queue_size
+        self.qos = qos
+        self.keepalive = keepalive
+        self._client = None
+        self._lock = threading.Lock()
+        self._connected = threading.Event()
+        self._ack_lock = threading.Lock()
+        self._ack_callbacks = {}  # mid -> on_ack of messages waiting for the broker
+        self._early_acks = {}  # mid -> acked_at of acks that arrived before publish() returned
+
+        # counters
+        self.published = 0
+        self.acked = 0
+        self.dropped = 0
+        self.connects = 0
+        self.disconnects = 0
+
+    def start(self):
+        with self._lock:
+            if self._client is None:
+                client = mqtt.Client()
+                client.on_connect = self.on_connect
+                client.on_disconnect = self.on_disconnect
+                client.on_publish = self.on_publish
+                client.reconnect_delay_set(min_delay=1, max_delay=30)
+                client.max_queued_messages_set(self.queue_size)
+                client.connect_async(self.broker, self.port, self.keepalive)
+                client.loop_start()
+                self._client = client
+        return self
+
+    def stop(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.disconnect()
+            client.loop_stop()
+            self._connected.clear()
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self.connects += 1
+            self._connected.set()
+            logger.info(f"MQTT publisher connected to {self.broker}:{self.port}")
+        else:
+            logger.warning(f"MQTT publisher connection refused with code {rc}")
+
+    def on_disconnect(self, client, userdata, rc):
+        self._connected.clear()
+        self.disconnects += 1
+        if rc != 0:
+            logger.warning(f"MQTT publisher lost its connection (code {rc}), reconnecting")
+
+    def on_publish(self, client, userdata, mid):
+        acked_at = timezone.now()
+        self.acked += 1
+        with self._ack_lock:
+            if mid in self._ack_callbacks:
+                on_ack = self._ack_callbacks.pop(mid)
+            else:
+                on_ack = None
+                self._early_acks[mid] = acked_at
+        if on_ack is not None:
+            on_ack(acked_at)
+
+    def publish(self, topic, payload, qos=None, retain=True, on_ack=None):
+        """
+        Queue a message for the network thread and return its MQTTMessageInfo.
+        """
+        client = self._client or self.start()._client
+        info = client.publish(topic, payload, qos=self.qos if qos is None else qos, retain=retain)
+        if info.rc == mqtt.MQTT_ERR_QUEUE_SIZE:
+            self.dropped += 1
+            raise PublishQueueFull(f"MQTT publish queue is full ({self.queue_size} messages)")
+        self.published += 1
+
+        # mids are reused, so every message is registered even without a callback
+        with self._ack_lock:
+            acked_at = self._early_acks.pop(info.mid, None)
+            if acked_at is None:
+                self._ack_callbacks[info.mid] = on_ack
+        if acked_at is not None and on_ack is not None:
+            on_ack(acked_at)
+        return info
+
+    def stats(self):
+        return {
+            'broker': f"{self.broker}:{self.port}",
+            'connected': self.connected,
+            'published': self.published,
+            'acked': self.acked,
+            'awaiting_ack': len(self._ack_callbacks),
+            'dropped': self.dropped,
+            'connects': self.connects,
+            'disconnects': self.disconnects,
+        }
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher():
+    """
+    The publisher shared by this process, created on first use.
+    """
+    global _publisher
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                _publisher = MQTTPublisher(
+                    settings.MQTT_BROKER,
+                    settings.MQTT_PORT,
+                    queue_size=settings.MQTT_PUBLISH_QUEUE_SIZE,
+                    qos=settings.MQTT_PUBLISH_QOS,
+                )
+                atexit.register(_publisher.stop)
+    return _publisher
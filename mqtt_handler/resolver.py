@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+
+from core.models import AssetEvent, HotelRoom, Vehicle
+
+
+# topic prefix -> (sub-asset model, FK to the parent asset, sub-asset number field)
+TOPIC_MODELS = {
+    'rooms': (HotelRoom, 'hotel', 'room_number'),
+    'vehicles': (Vehicle, 'fleet', 'vehicle_number'),
+}
+
+_MISSING = object()
+
+
+class ResolvedSubAsset(namedtuple('ResolvedSubAsset', ['asset_type', 'asset_number', 'object_id', 'sub_asset_id', 'content_type_id'])):
+    """
+    Primary keys needed to write an AssetEvent for a sub-asset without loading any model instance.
+    `asset_number` is also the AssetEvent.asset FK value (the FK targets Asset.asset_number).
+    """
+    __slots__ = ()
+
+    def make_event(self, event_type, data, timestamp):
+        return AssetEvent(
+            asset_id=self.asset_number,
+            content_type_id=self.content_type_id,
+            object_id=self.object_id,
+            event_type=event_type,
+            data=data,
+            timestamp=timestamp
+        )
+
+
+class SubAssetResolver:
+    """
+    In-process LRU cache mapping (asset_type, asset_number, object_id) from an MQTT topic
+    to the primary keys of the asset and sub-asset.
+
+    Entries expire after `ttl` seconds and the least recently used entry is evicted once
+    `max_entries` is reached. Unknown sub-assets are cached as well so a misconfigured device
+    does not cost a query per message. Entries are invalidated by the post_save/post_delete
+    receivers in mqtt_handler/signals.py; changes made in other processes are picked up
+    when the entry expires.
+    """
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, ResolvedSubAsset or None)
+        self._content_type_ids = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, asset_type, asset_number, object_id):
+        """
+        Return the ResolvedSubAsset for a topic, or None if the asset or sub-asset does not exist.
+        Raises ValueError for an unsupported asset type.
+        """
+        if asset_type not in TOPIC_MODELS:
+            raise ValueError("Unsupported asset type")
+
+        key = (asset_type, asset_number, object_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        resolved = self._load(asset_type, asset_number, object_id)
+
+        with self._lock:
+            self._entries[key] = (now + self.ttl, resolved)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return resolved
+
+    def content_type_id(self, asset_type):
+        model = TOPIC_MODELS[asset_type][0]
+        if asset_type not in self._content_type_ids:
+            self._content_type_ids[asset_type] = ContentType.objects.get_for_model(model).id
+        return self._content_type_ids[asset_type]
+
+    def invalidate(self, asset_type, asset_number, object_id, sub_asset_id=None):
+        """
+        Drop the entry for a sub-asset. When `sub_asset_id` is given, entries pointing at that row
+        under another number (e.g. before a rename) are dropped too.
+        """
+        with self._lock:
+            self._entries.pop((asset_type, asset_number, object_id), None)
+            if sub_asset_id is not None:
+                stale = [
+                    key for key, (_, resolved) in self._entries.items()
+                    if resolved is not None and key[0] == asset_type and resolved.sub_asset_id == sub_asset_id
+                ]
+                for key in stale:
+                    del self._entries[key]
+
+    def invalidate_asset(self, asset_number):
+        with self._lock:
+            stale = [key for key in self._entries if key[1] == asset_number]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def _load(self, asset_type, asset_number, object_id):
+        model, asset_field, number_field = TOPIC_MODELS[asset_type]
+        # a single join resolves both the asset and the sub-asset
+        sub_asset_id = model.objects.filter(**{
+            f'{asset_field}__asset_number': asset_number,
+            number_field: object_id,
+        }).values_list('pk', flat=True).first()
+        if sub_asset_id is None:
+            return None
+        return ResolvedSubAsset(asset_type, asset_number, object_id, sub_asset_id, self.content_type_id(asset_type))
+
+
+resolver = SubAssetResolver(
+    max_entries=settings.MQTT_RESOLVER_CACHE_SIZE,
+    ttl=settings.MQTT_RESOLVER_CACHE_TTL,
+)
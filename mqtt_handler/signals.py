@@ -0,0 +1,28 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from core.models import Asset, HotelRoom, Vehicle
+from .resolver import resolver
+from .location import accumulator
+
+
+@receiver(post_save, sender=Asset)
+@receiver(post_delete, sender=Asset)
+def invalidate_asset_resolution(sender, instance, **kwargs):
+    resolver.invalidate_asset(instance.asset_number)
+
+
+@receiver(post_save, sender=HotelRoom)
+@receiver(post_delete, sender=HotelRoom)
+def invalidate_room_resolution(sender, instance, **kwargs):
+    resolver.invalidate('rooms', instance.hotel_id, instance.room_number, sub_asset_id=instance.pk)
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def invalidate_vehicle_resolution(sender, instance, **kwargs):
+    resolver.invalidate('vehicles', instance.fleet_id, instance.vehicle_number, sub_asset_id=instance.pk)
+
+
+@receiver(post_delete, sender=Vehicle)
+def forget_vehicle_track(sender, instance, **kwargs):
+    accumulator.forget(instance.pk)
@@ -1,9 +1,11 @@
 from django.urls import path
-from .views import ControlAssetView, CheckSubAssetStatusView, CheckAssetStatusView, DirectControlView
+from .views import ControlAssetView, CheckSubAssetStatusView, CheckAssetStatusView, DirectControlView, IngestStatsView, CommandLatencyView
 
 urlpatterns = [
     path('assets/<str:asset_number>/control/<str:sub_asset_id>/', ControlAssetView.as_view(), name='control_asset'),
     path('assets/<str:asset_number>/direct_control/<str:sub_asset_id>/', DirectControlView.as_view(), name='direct_control_asset'),
     path('assets/<str:asset_number>/status/<str:sub_asset_id>/', CheckSubAssetStatusView.as_view(), name='check_sub_asset_status'),
     path('assets/<str:asset_number>/status/', CheckAssetStatusView.as_view(), name='check-asset-status'), # default = /?days=7
+    path('mqtt/stats/', IngestStatsView.as_view(), name='mqtt-ingest-stats'),
+    path('mqtt/commands/latency/', CommandLatencyView.as_view(), name='mqtt-command-latency'),
 ]
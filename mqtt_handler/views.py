@@ -2,29 +2,28 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 
 from django.utils import timezone
-from django.db.models import Sum
+from django.db.models import Count, Q
 from django.contrib.contenttypes.models import ContentType
 
-from core.models import Asset, AssetEvent, HotelRoom, Vehicle
+from core.models import Asset, AssetEvent, DailyAssetRollup, HotelRoom, SubAssetState, Vehicle
 from core.permissions import IsAdmin, IsManager
+from core.roles import role_resolver
 from hotel_demo.tasks import send_control_request, schedule_sub_asset_expiry
+from .management.commands.mqtt_subscriber import get_subscriber
+from .control import ControlError, is_system_user, send_control_command
+from .ledger import command_latency
+from .publisher import PublishQueueFull, get_publisher
 
 import logging
-from datetime import timedelta
-import paho.mqtt.client as mqtt
+from datetime import datetime, time, timedelta
 
 # import settings
 from django.conf import settings
 
 
-# Configure the MQTT client
-MQTT_BROKER = 'broker.emqx.io'  # Replace with your MQTT broker address
-MQTT_PORT = 1883  # Default MQTT port
-
-
 logger = logging.getLogger(__name__)
 
 
@@ -32,12 +31,6 @@ class ControlAssetView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        # self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-        self.mqtt_client = mqtt.Client()
-        self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT)
-
     def post(self, request, *args, **kwargs):
         asset_number = kwargs.get('asset_number')
         sub_asset_id = kwargs.get('sub_asset_id')
@@ -54,66 +47,24 @@ class ControlAssetView(APIView):
             return Response({'error': 'Asset not found.'}, status=status.HTTP_404_NOT_FOUND)
 
         # Ensure the user is an admin for the specified asset or system user
-        if not (request.user.is_superuser or request.user.username == 'info@trykey.com' or request.user.roles.filter(asset=asset, role='admin').exists()):
+        if not (request.user.is_superuser or is_system_user(request.user) or role_resolver.has_role(request, asset.asset_number, 'admin')):
             return Response({'error': 'You do not have permission to control this asset.'}, status=status.HTTP_403_FORBIDDEN)
 
-        topic = None
-
-        # Define action handling based on asset type
-        if asset.asset_type == 'hotel':
-            # Validate the sub-asset (room)
-            try:
-                room = HotelRoom.objects.get(room_number=sub_asset_id, hotel=asset)
-                if room.status and request.user.username != 'info@trykey.com':
-                    return Response({'error': 'Cannot control an active hotel room. Please check out the guest first.'}, status=status.HTTP_400_BAD_REQUEST)
-            except HotelRoom.DoesNotExist:
-                return Response({'error': 'Room not found for the specified hotel.'}, status=status.HTTP_404_NOT_FOUND)
-
-            if action_type == 'electricity':
-                topic = f"rooms/{asset_number}/{sub_asset_id}/electricity"
-            elif action_type == 'access':
-                topic = f"rooms/{asset_number}/{sub_asset_id}/access"
-            else:
-                return Response({'error': f'Invalid action type for {asset.asset_type} asset.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        elif asset.asset_type == 'vehicle':
-            # Validate the sub-asset (vehicle)
-            try:
-                vehicle = Vehicle.objects.get(vehicle_number=sub_asset_id, fleet=asset)
-                if vehicle.status:
-                    return Response({'error': 'Cannot control an active vehicle. Please ensure the vehicle is parked and not in use.'}, status=status.HTTP_400_BAD_REQUEST)
-            except Vehicle.DoesNotExist:
-                return Response({'error': 'Vehicle not found for the specified fleet.'}, status=status.HTTP_404_NOT_FOUND)
-
-            if action_type == 'ignition':
-                topic = f"vehicles/{asset_number}/{sub_asset_id}/ignition"
-            else:
-                return Response({'error': f'Invalid action type for {asset.asset_type} asset.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        else:
-            return Response({'error': 'Invalid asset type.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Publish the MQTT command
+        # Publish the MQTT command (see mqtt_handler/control.py)
         try:
-            self.mqtt_client.publish(topic, data, retain=True)  # Assuming `data` contains the command to send
-            # Log the action with sub-asset
-            AssetEvent.objects.create(
-                asset=asset,
-                event_type=action_type,
-                data=data,
-                timestamp=timezone.now(),
-                content_type=ContentType.objects.get_for_model(room if asset.asset_type == 'hotel' else vehicle),
-                object_id=sub_asset_id
-            )
-
-            # Update room status if the flag is set
-            if update_status and asset.asset_type == 'hotel':
-                room = HotelRoom.objects.get(room_number=sub_asset_id, hotel=asset)
-                room.status = False
-                room.save()
-                logger.info(f"Room status updated to False for room {sub_asset_id}")
+            command = send_control_command(asset, sub_asset_id, action_type, data, user=request.user, update_status=update_status)  # Assuming `data` contains the command to send
+            if update_status:
+                logger.info(f"Status updated to False for sub-asset {sub_asset_id}")
 
-            return Response({'message': f'{action_type.capitalize()} control command sent.'}, status=status.HTTP_200_OK)
+            return Response({
+                'message': f'{action_type.capitalize()} control command sent.',
+                'command_id': str(command.correlation_id),
+            }, status=status.HTTP_200_OK)
+        except ControlError as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        except PublishQueueFull:
+            logger.warning(f"Dropped {action_type} command for {asset_number}/{sub_asset_id}: publish queue is full")
+            return Response({'error': 'MQTT broker is unavailable, please retry later.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             return Response({'error': f'Failed to send command: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -129,7 +80,7 @@ class CheckSubAssetStatusView(APIView):
             return Response({'error': 'Asset not found.'}, status=status.HTTP_404_NOT_FOUND)
 
         # Ensure the user is associated with the asset (admin, manager, or viewer)
-        if not request.user.roles.filter(asset=asset).exists():
+        if not role_resolver.has_role(request, asset.asset_number):
             return Response({'error': 'You do not have permission to access this asset.'}, status=status.HTTP_403_FORBIDDEN)
 
         # Determine the asset type
@@ -140,22 +91,11 @@ class CheckSubAssetStatusView(APIView):
             except HotelRoom.DoesNotExist:
                 return Response({'error': 'Room not found for the specified hotel.'}, status=status.HTTP_404_NOT_FOUND)
 
-            # Get the last access and electricity commands with timestamps
-            access_event = AssetEvent.objects.filter(
-                content_type=ContentType.objects.get_for_model(HotelRoom),
-                object_id=sub_asset_id, event_type='access'
-            ).first()
-            
-            electricity_event = AssetEvent.objects.filter(
-                content_type=ContentType.objects.get_for_model(HotelRoom),
-                object_id=sub_asset_id, event_type='electricity'
-            ).first()
-
-            # Get the last occupancy event
-            occupancy_event = AssetEvent.objects.filter(
-                content_type=ContentType.objects.get_for_model(HotelRoom),
-                object_id=sub_asset_id, event_type='occupancy'
-            ).first()
+            # Get the last access and electricity commands and the last occupancy with timestamps
+            states = SubAssetState.for_sub_asset(asset.asset_number, HotelRoom, sub_asset_id, ['access', 'electricity', 'occupancy'])
+            access_event = states.get('access')
+            electricity_event = states.get('electricity')
+            occupancy_event = states.get('occupancy')
 
             data = {
                 'last_access_command': {
@@ -179,23 +119,11 @@ class CheckSubAssetStatusView(APIView):
             except Vehicle.DoesNotExist:
                 return Response({'error': 'Vehicle not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-            # Get the last ignition command with timestamp
-            ignition_event = AssetEvent.objects.filter(
-                content_type=ContentType.objects.get_for_model(Vehicle),
-                object_id=sub_asset_id, event_type='ignition'
-            ).first()
-
-            # Get the last passenger count event
-            passenger_count_event = AssetEvent.objects.filter(
-                content_type=ContentType.objects.get_for_model(Vehicle),
-                object_id=sub_asset_id, event_type='passenger_count'
-            ).first()
-
-            # Get the last location event
-            location_event = AssetEvent.objects.filter(
-                content_type=ContentType.objects.get_for_model(Vehicle),
-                object_id=sub_asset_id, event_type='location'
-            ).first()
+            # Get the last ignition command, passenger count and location with timestamps
+            states = SubAssetState.for_sub_asset(asset.asset_number, Vehicle, sub_asset_id, ['ignition', 'passenger_count', 'location'])
+            ignition_event = states.get('ignition')
+            passenger_count_event = states.get('passenger_count')
+            location_event = states.get('location')
 
             data = {
                 'last_ignition_command': {
@@ -232,131 +160,100 @@ class CheckAssetStatusView(APIView):
             return Response({'error': 'Asset not found.'}, status=status.HTTP_404_NOT_FOUND)
 
         # Ensure the user is associated with the asset
-        if not request.user.roles.filter(asset=asset).exists():
+        if not role_resolver.has_role(request, asset.asset_number):
             return Response({'error': 'You do not have permission to access this asset.'}, status=status.HTTP_403_FORBIDDEN)
 
         # Get the time range from query parameters, default to last 7 days
         days = int(request.query_params.get('days', 7))
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
+        today = timezone.localdate()
+        # every calendar day (in the configured time zone) from today - days up to today
+        dates = [today - timedelta(days=offset) for offset in range(days, -1, -1)]
 
         if asset.asset_type == 'hotel':
-            return self.get_hotel_data(asset, start_date, end_date)
+            return self.get_hotel_data(asset, dates)
         elif asset.asset_type == 'vehicle':
-            return self.get_vehicle_data(asset, start_date, end_date)
+            return self.get_vehicle_data(asset, dates)
         else:
             return Response({'error': 'Unsupported asset type.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    def get_hotel_data(self, asset, start_date, end_date):
-        total_rooms = HotelRoom.objects.filter(hotel=asset).count()
-        
-        # Get current day stats
-        current_date = timezone.now().date()
-        total_active_rooms = HotelRoom.objects.filter(
-            hotel=asset,
-            status=True
-        ).count()
-
-        occupied_rooms = AssetEvent.objects.filter(
+    def past_rollups(self, asset, dates, *fields):
+        # Closed days come from the daily rollups (see core/rollups.py), only today is computed from events
+        return {
+            row[0]: row[1:]
+            for row in DailyAssetRollup.objects.filter(asset=asset, date__gte=dates[0], date__lt=dates[-1]).values_list('date', *fields)
+        }
+
+    def get_hotel_data(self, asset, dates):
+        rooms = {
+            room_number: (price, room_status)
+            for room_number, price, room_status in HotelRoom.objects.filter(hotel=asset).values_list('room_number', 'price', 'status')
+        }
+        total_rooms = len(rooms)
+        # room status is only known for now, so every day reports the current active rooms
+        total_active_rooms = sum(1 for _, room_status in rooms.values() if room_status)
+
+        today = dates[-1]
+        # no Meta.ordering, its timestamp would become part of the DISTINCT (one row per event)
+        occupied_rooms = set(AssetEvent.objects.filter(
             asset=asset,
             event_type='occupancy',
-            timestamp__date=current_date,
+            timestamp__gte=timezone.make_aware(datetime.combine(today, time.min)),
             data='1'
-        ).values('object_id').distinct()
-
-        total_occupied_rooms = occupied_rooms.count()
-
-        # Calculate expected yield
-        expected_yield = HotelRoom.objects.filter(
-            hotel=asset,
-            room_number__in=occupied_rooms.values_list('object_id', flat=True)
-        ).aggregate(total_price=Sum('price'))['total_price'] or 0
-
-        # Get daily stats
-        daily_stats = []
-        current_date = start_date
-        while current_date <= end_date:
-            next_date = current_date + timedelta(days=1)
-            occupied_rooms = AssetEvent.objects.filter(
-                asset=asset,
-                event_type='occupancy',
-                timestamp__lt=next_date,
-                timestamp__gte=current_date,
-                data='1'
-            ).values('object_id').distinct()
-
-            daily_occupied_count = occupied_rooms.count()
-
-            active_rooms = HotelRoom.objects.filter(
-                hotel=asset,
-                status=True
-            ).count()
-
-            daily_expected_yield = HotelRoom.objects.filter(
-                hotel=asset,
-                room_number__in=occupied_rooms.values_list('object_id', flat=True)
-            ).aggregate(total_price=Sum('price'))['total_price'] or 0
-
-            daily_stats.append({
-                'date': current_date.date(),
-                'occupied_rooms': daily_occupied_count,
-                'active_rooms': active_rooms,
-                'expected_yield': daily_expected_yield
-            })
-            current_date = next_date
+        ).order_by().values_list('object_id', flat=True).distinct())
+
+        # Occupied rooms that no longer exist do not yield anything
+        expected_yield = sum((rooms[room_number][0] for room_number in occupied_rooms if room_number in rooms), 0)
+
+        daily = self.past_rollups(asset, dates, 'occupied_rooms', 'expected_yield')
+        daily[today] = (len(occupied_rooms), expected_yield)
+
+        daily_stats = [
+            {
+                'date': date,
+                'occupied_rooms': daily.get(date, (0, 0))[0],
+                'active_rooms': total_active_rooms,
+                'expected_yield': daily.get(date, (0, 0))[1]
+            }
+            for date in dates
+        ]
 
         return Response({
             'total_rooms': total_rooms,
             'total_active_rooms': total_active_rooms,
-            'total_occupied_rooms': total_occupied_rooms,
+            'total_occupied_rooms': len(occupied_rooms),
             'expected_yield': expected_yield,
             'daily_stats': daily_stats
         })
 
-    def get_vehicle_data(self, asset, start_date, end_date):
-        total_vehicles = Vehicle.objects.filter(fleet=asset).count()
-        
-        # Get current day stats
-        current_date = timezone.now().date()
-        total_active_vehicles = Vehicle.objects.filter(
-            fleet=asset,
-            status=True
-        ).count()
+    def get_vehicle_data(self, asset, dates):
+        vehicles = Vehicle.objects.filter(fleet=asset).aggregate(
+            total=Count('id'),
+            active=Count('id', filter=Q(status=True))
+        )
 
+        today = dates[-1]
         total_in_use_vehicles = AssetEvent.objects.filter(
             asset=asset,
             content_type=ContentType.objects.get_for_model(Vehicle),
-            timestamp__date=current_date
-        ).values('object_id').distinct().count()
-
-        # Get daily stats
-        daily_stats = []
-        current_date = start_date
-        while current_date <= end_date:
-            next_date = current_date + timedelta(days=1)
-            active_vehicles = Vehicle.objects.filter(
-                fleet=asset,
-                status=True
-            ).count()
-
-            # Count vehicles with events on this day
-            vehicles_with_events = AssetEvent.objects.filter(
-                asset=asset,
-                content_type=ContentType.objects.get_for_model(Vehicle),
-                timestamp__gte=current_date,
-                timestamp__lt=next_date
-            ).values('object_id').distinct().count()
-
-            daily_stats.append({
-                'date': current_date.date(),
-                'active_vehicles': active_vehicles,
-                'vehicles_with_events': vehicles_with_events
-            })
-            current_date = next_date
+            timestamp__gte=timezone.make_aware(datetime.combine(today, time.min))
+        ).order_by().values('object_id').distinct().count()
+
+        daily = self.past_rollups(asset, dates, 'vehicles_with_events')
+        daily[today] = (total_in_use_vehicles,)
+
+        daily_stats = [
+            {
+                'date': date,
+                # vehicle status is only known for now, so every day reports the current active vehicles
+                'active_vehicles': vehicles['active'],
+                'vehicles_with_events': daily.get(date, (0,))[0]
+            }
+            for date in dates
+        ]
 
         return Response({
-            'total_vehicles': total_vehicles,
-            'total_active_vehicles': total_active_vehicles,
+            'total_vehicles': vehicles['total'],
+            'total_active_vehicles': vehicles['active'],
             'total_in_use_vehicles': total_in_use_vehicles,
             'daily_stats': daily_stats
         })
@@ -410,4 +307,40 @@ class DirectControlView(APIView):
             'expiry_time': expiry_time,
             'expiry_action_type': "access" if asset.asset_type == 'hotel' else None,
             'expiry_data': expiry_data
-        }, status=status.HTTP_202_ACCEPTED)
\ No newline at end of file
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class IngestStatsView(APIView):
+    """
+    Queue depth, per-stage latency and counters of the MQTT ingestion pipeline in this process,
+    plus the counters of the control publisher and command ledger.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        subscriber = get_subscriber()
+        if subscriber is None:
+            return Response({'error': 'MQTT subscriber is not running in this process.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({
+            **subscriber.stats(),
+            'publisher': get_publisher().stats(),
+        }, status=status.HTTP_200_OK)
+
+
+class CommandLatencyView(APIView):
+    """
+    Delivery counts and broker-ack / device-confirmation latency percentiles of control commands
+    per asset type over the last `hours` (default 24).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            hours = float(request.query_params.get('hours', 24))
+        except ValueError:
+            return Response({'error': 'hours must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+        if hours <= 0:
+            return Response({'error': 'hours must be positive.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        since = timezone.now() - timedelta(hours=hours)
+        return Response({'since': since, 'asset_types': command_latency(since)}, status=status.HTTP_200_OK)
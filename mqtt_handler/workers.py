@@ -0,0 +1,131 @@
+import logging
+import queue
+import threading
+import time
+import zlib
+
+from django.db import close_old_connections, connection
+
+from .metrics import LatencyStats
+
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class IngestWorkerPool:
+    """
+    Pool of database worker threads fed by bounded queues, one queue per worker.
+
+    Work is sharded on a key (the subscriber uses (asset_number, object_id)) so that all
+    messages from one device are handled by the same thread, in arrival order. Each thread
+    uses its own database connection. submit() blocks for at most `put_timeout` seconds when
+    the shard's queue is full and then drops the item, so a slow database never stalls the
+    MQTT network loop for longer than that.
+    """
+
+    def __init__(self, handler, workers=4, queue_size=1000, put_timeout=0.5):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+
+        self.handler = handler
+        self.put_timeout = put_timeout
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+
+        # metrics
+        self.queue_wait = LatencyStats()
+        self.handling = LatencyStats()
+        self.submitted = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        if not self._threads:
+            for index, shard_queue in enumerate(self.queues):
+                thread = threading.Thread(target=self._run, args=(shard_queue,), name=f'mqtt-ingest-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def shard_for(self, key):
+        # crc32 instead of hash(): stable across processes and restarts
+        return zlib.crc32('/'.join(key).encode()) % len(self.queues)
+
+    def submit(self, key, *args):
+        """
+        Queue `handler(*args)` on the shard for `key`. Returns False if the item was dropped.
+        """
+        shard_queue = self.queues[self.shard_for(key)]
+        try:
+            shard_queue.put((time.monotonic(), args), timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.warning(f"Ingest queue for {key} is full, dropping message")
+            return False
+
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def stop(self, timeout=None):
+        """
+        Let the workers drain their queues, then stop them, waiting at most `timeout` seconds in
+        total: a worker stuck on a full queue does not hang the shutdown.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def remaining():
+            return None if deadline is None else max(0, deadline - time.monotonic())
+
+        for shard_queue in self.queues:
+            try:
+                shard_queue.put(_STOP, timeout=remaining())
+            except queue.Full:
+                logger.warning("Ingest queue is still full at shutdown, not waiting for its worker")
+        for thread in self._threads:
+            thread.join(remaining())
+        self._threads = []
+
+    def queue_depths(self):
+        return [shard_queue.qsize() for shard_queue in self.queues]
+
+    def stats(self):
+        depths = self.queue_depths()
+        return {
+            'workers': len(self.queues),
+            'queue_depth': sum(depths),
+            'queue_depths': depths,
+            'submitted': self.submitted,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'latency': {
+                'queue_wait': self.queue_wait.summary(),
+                'handling': self.handling.summary(),
+            },
+        }
+
+    def _run(self, shard_queue):
+        try:
+            while True:
+                item = shard_queue.get()
+                if item is _STOP:
+                    break
+
+                enqueued_at, args = item
+                started_at = time.monotonic()
+                self.queue_wait.record(started_at - enqueued_at)
+
+                close_old_connections()
+                try:
+                    self.handler(*args)
+                except Exception as e:
+                    with self._lock:
+                        self.failed += 1
+                    logger.error(f"Ingest worker failed to handle message: {str(e)}", exc_info=True)
+                self.handling.record(time.monotonic() - started_at)
+        finally:
+            connection.close()
@@ -2,6 +2,7 @@ from rest_framework import generics
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from core.models import HotelRoom, Asset, Role
+from core.roles import role_resolver
 from .serializers import HotelRoomSerializer
 
 class HotelRoomListCreateView(generics.ListCreateAPIView):
@@ -16,7 +17,7 @@ class HotelRoomListCreateView(generics.ListCreateAPIView):
         hotel_id = self.kwargs['hotel_id']
         hotel = get_object_or_404(Asset, id=hotel_id, asset_type='hotel')
         # Check if the user is an admin
-        role = Role.objects.filter(user=self.request.user, asset=hotel, role='admin').exists()
+        role = role_resolver.has_role(self.request, hotel.asset_number, 'admin')
         if not role:
             return Response({"error": "You are not authorized to create rooms for this hotel."}, status=403)
         serializer.save(hotel=hotel)
@@ -29,7 +30,7 @@ class HotelRoomRetrieveUpdateDeleteView(generics.RetrieveUpdateDestroyAPIView):
         room_id = self.kwargs['pk']
         room = get_object_or_404(HotelRoom, id=room_id)
         hotel = room.hotel
-        role = Role.objects.filter(user=self.request.user, asset=hotel, role='admin').exists()
+        role = role_resolver.has_role(self.request, hotel.asset_number, 'admin')
         if self.request.method in ['PUT', 'PATCH', 'DELETE'] and not role: #The patch method works to update just a parameter
             return Response({"error": "You are not authorized to modify rooms for this hotel."}, status=403)
         return HotelRoom.objects.filter(id=room_id)
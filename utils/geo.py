@@ -0,0 +1,111 @@
+"""
+Vectorised distance helpers for batches of GPS fixes.
+
+geopy's geodesic() solves the WGS84 inverse problem iteratively for every pair of points,
+which dominates the cost of integrating vehicle tracks in pure Python. The functions here
+compute all segment lengths of one or many tracks in a few NumPy operations.
+
+Two approximations are available (distances in km):
+
+- 'ellipsoidal' (default): local tangent plane on the WGS84 ellipsoid, using the meridional and
+  prime-vertical radii of curvature at the segment's mid-latitude. Compared with geodesic() the
+  relative error is below 0.005% for segments up to 50 km at latitudes within ±70° (below 0.05%
+  up to ±85°), which covers consecutive fixes of a vehicle by a wide margin. Segments longer
+  than ELLIPSOIDAL_MAX_SEGMENT_KM fall back to haversine.
+- 'haversine': great circle on a sphere of the IUGG mean Earth radius. Valid for any distance,
+  error below 0.6% compared with geodesic().
+"""
+import numpy as np
+
+
+EARTH_MEAN_RADIUS_KM = 6371.0088
+WGS84_A_KM = 6378.137
+WGS84_E2 = 6.69437999014e-3  # first eccentricity squared
+
+# tangent-plane segments longer than this are measured with haversine instead
+ELLIPSOIDAL_MAX_SEGMENT_KM = 50.0
+
+METHODS = ('ellipsoidal', 'haversine')
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance between arrays of points on a spherical Earth.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_MEAN_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def ellipsoidal_km(lat1, lon1, lat2, lon2):
+    """
+    Distance between arrays of points on the WGS84 ellipsoid, projected on the tangent plane
+    at the segment's mid-latitude. Long segments fall back to haversine (see module docstring).
+    """
+    lat1, lon1, lat2, lon2 = (np.asarray(value, dtype=float) for value in (lat1, lon1, lat2, lon2))
+    mid_lat = np.radians((lat1 + lat2) / 2)
+    sin2 = np.sin(mid_lat) ** 2
+    w = np.sqrt(1 - WGS84_E2 * sin2)
+    meridional_radius = WGS84_A_KM * (1 - WGS84_E2) / w ** 3
+    prime_vertical_radius = WGS84_A_KM / w
+
+    d_lat = np.radians(lat2 - lat1)
+    d_lon = np.radians((lon2 - lon1 + 180.0) % 360.0 - 180.0)  # shortest way across the antimeridian
+    distance = np.hypot(d_lat * meridional_radius, d_lon * prime_vertical_radius * np.cos(mid_lat))
+
+    long_segments = distance > ELLIPSOIDAL_MAX_SEGMENT_KM
+    if np.any(long_segments):
+        distance = np.where(long_segments, haversine_km(lat1, lon1, lat2, lon2), distance)
+    return distance
+
+
+def pairwise_km(lat1, lon1, lat2, lon2, method='ellipsoidal'):
+    if method == 'ellipsoidal':
+        return ellipsoidal_km(lat1, lon1, lat2, lon2)
+    if method == 'haversine':
+        return haversine_km(lat1, lon1, lat2, lon2)
+    raise ValueError(f"Unsupported distance method: {method}. Expected one of {METHODS}.")
+
+
+def segment_distances(latitudes, longitudes, method='ellipsoidal'):
+    """
+    Lengths of the n-1 segments of a single track of n points.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    if latitudes.size < 2:
+        return np.zeros(0)
+    return pairwise_km(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:], method)
+
+
+def track_distances(track_ids, latitudes, longitudes, method='ellipsoidal'):
+    """
+    Total distance travelled per track for interleaved fixes of many tracks (e.g. vehicles).
+
+    `track_ids`, `latitudes` and `longitudes` are parallel arrays; fixes of the same track must be
+    in chronological order relative to each other, but tracks may be interleaved.
+
+    Returns {track_id: (distance_km, last_latitude, last_longitude)}.
+    """
+    track_ids = np.asarray(track_ids)
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    if track_ids.size == 0:
+        return {}
+
+    # group fixes by track while keeping their relative order
+    order = np.argsort(track_ids, kind='stable')
+    track_ids, latitudes, longitudes = track_ids[order], latitudes[order], longitudes[order]
+
+    unique_ids, starts = np.unique(track_ids, return_index=True)
+    group = np.repeat(np.arange(unique_ids.size), np.diff(np.append(starts, track_ids.size)))
+
+    segments = segment_distances(latitudes, longitudes, method)
+    same_track = group[1:] == group[:-1]  # drop the segments joining two different tracks
+    totals = np.bincount(group[1:][same_track], weights=segments[same_track], minlength=unique_ids.size)
+
+    last = np.append(starts[1:], track_ids.size) - 1
+    return {
+        track_id.item(): (float(total), float(latitudes[index]), float(longitudes[index]))
+        for track_id, total, index in zip(unique_ids, totals, last)
+    }
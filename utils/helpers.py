@@ -3,24 +3,28 @@ from django.core.cache import cache
 from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
+from django.db.models import Q
+import base64
 import hmac
 import hashlib
+import json
 
 
 from celery import shared_task
 import sendgrid
 from sendgrid.helpers.mail import *
 
-from rest_framework.pagination import PageNumberPagination
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework import exceptions
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from core.identity import system_identity
 from django.contrib.auth import get_user_model
 User = get_user_model()
 
 
 def get_system_user_token():
-    system_user = User.objects.get(username='info@trykey.com')
-    refresh = RefreshToken.for_user(system_user)
-    return str(refresh.access_token)
+    # cached and refreshed before expiry, see core/identity.py
+    return system_identity.get_token()
 
 
 # ----------- Data helpers -------------
@@ -70,6 +74,115 @@ class CustomPageNumberPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination: a page is the first `limit` rows after the cursor in `ordering`,
+    so each page costs one index range scan however deep it is. The last field of `ordering`
+    must be unique (e.g. id) and none of them nullable.
+
+    The response body stays a plain list; the cursor of the next page is sent in the
+    X-Next-Cursor header (absent on the last page) and passed back as `?cursor=`.
+
+    Views with `ordering_fields` also accept `?ordering=<field>` (or `-<field>`), which must be
+    sent again with each cursor.
+
+    With `paginate_by_default = False` (endpoints that used to return every row) a request with
+    neither `?limit=` nor `?cursor=` still gets all rows, in order.
+    """
+    ordering = ('-timestamp', '-id')
+    page_size = 100
+    max_page_size = 500
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    paginate_by_default = True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = self.get_ordering(request, queryset, view)
+        self.next_cursor = None
+        if not self.paginate_by_default and not (
+            self.page_size_query_param in request.query_params or self.cursor_query_param in request.query_params
+        ):
+            return list(queryset.order_by(*ordering))
+
+        self.limit = self.get_page_size(request)
+        fields = [name.lstrip('-') for name in ordering]
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.after_cursor(queryset.model, ordering, self.decode_cursor(cursor, len(fields))))
+
+        rows = list(queryset.order_by(*ordering)[:self.limit + 1])
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            self.next_cursor = self.encode_cursor(queryset.model, fields, rows[-1])
+        return rows
+
+    def get_paginated_response(self, data):
+        headers = {'X-Next-Cursor': self.next_cursor} if self.next_cursor else None
+        return Response(data, headers=headers)
+
+    def get_ordering(self, request, queryset, view):
+        ordering_fields = getattr(view, 'ordering_fields', None)
+        param = request.query_params.get(self.ordering_query_param)
+        if not param or not ordering_fields:
+            return self.ordering
+
+        field = param[1:] if param.startswith('-') else param
+        if field not in ordering_fields:
+            raise exceptions.ValidationError({self.ordering_query_param: f'Must be one of {", ".join(ordering_fields)}, optionally prefixed with "-".'})
+        # the last field of the default ordering is unique, it breaks ties in the same direction
+        tie_breaker = self.ordering[-1].lstrip('-')
+        if field == tie_breaker:
+            return (param,)
+        return (param, f'-{tie_breaker}' if param.startswith('-') else tie_breaker)
+
+    def get_page_size(self, request):
+        limit = request.query_params.get(self.page_size_query_param)
+        if limit is None:
+            return self.page_size
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= self.max_page_size:
+            raise exceptions.ValidationError({self.page_size_query_param: f'Must be an integer between 1 and {self.max_page_size}.'})
+        return limit
+
+    def encode_cursor(self, model, fields, row):
+        values = [model._meta.get_field(field).value_to_string(row) for field in fields]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor, length):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError):
+            values = None
+        if not isinstance(values, list) or len(values) != length:
+            raise exceptions.ValidationError({self.cursor_query_param: 'Invalid cursor.'})
+        return values
+
+    def after_cursor(self, model, ordering, values):
+        """
+        Rows after the cursor: (a > x) or (a = x and b > y) ..., with "<" for descending fields. The
+        redundant bound on the first field lets the database use it as an index condition.
+        """
+        try:
+            values = [model._meta.get_field(name.lstrip('-')).to_python(value) for name, value in zip(ordering, values)]
+        except (ValidationError, TypeError, ValueError):  # e.g. a number for a datetime
+            values = [None]
+        if None in values:  # the ordering fields are not nullable
+            raise exceptions.ValidationError({self.cursor_query_param: 'Invalid cursor.'})
+
+        lookups = [(name.lstrip('-'), 'lt' if name.startswith('-') else 'gt') for name in ordering]
+        after, equal = Q(), Q()
+        for (field, lookup), value in zip(lookups, values):
+            after |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        first_field, first_lookup = lookups[0]
+        return Q(**{f'{first_field}__{first_lookup}e': values[0]}) & after
+
+
 # ----------- SHA512 signature helpers -------------
 def hmac_sha512(key:str, message:bytes) -> str:
     key = key.encode('utf-8')
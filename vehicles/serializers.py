@@ -1,7 +1,8 @@
 from rest_framework import serializers
 from core.models import Vehicle
+from assets.serializers import VehicleUpdateMixin
 
-class VehicleSerializer(serializers.ModelSerializer):
+class VehicleSerializer(VehicleUpdateMixin, serializers.ModelSerializer):
     class Meta:
         model = Vehicle
         fields = ['id', 'fleet', 'brand', 'vehicle_type', 'vehicle_number', 'status']
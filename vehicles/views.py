@@ -1,16 +1,23 @@
 from rest_framework import generics
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from core.models import Vehicle, Asset, Role, AssetEvent
+from django_filters.rest_framework import DjangoFilterBackend
+from core.models import Vehicle, Asset, Role, SubAssetState
+from core.roles import role_resolver
+from assets.filters import VehicleFilter, VehiclePagination
 from .serializers import VehicleSerializer
-from django.contrib.contenttypes.models import ContentType
 
 class VehicleListCreateView(generics.ListCreateAPIView):
     serializer_class = VehicleSerializer
+    # see assets/filters.py
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = VehicleFilter
+    pagination_class = VehiclePagination
+    ordering_fields = ['vehicle_number', 'vehicle_type', 'brand']
 
     def get_queryset(self):
         # Only return vehicles owned by the logged-in user
-        return Vehicle.objects.filter(fleet__roles__user=self.request.user)
+        return Vehicle.objects.filter(fleet_id__in=list(role_resolver.roles(self.request))).select_related('fleet')
 
     def perform_create(self, serializer):
         fleet_id = self.request.data.get('fleet')  # Get the fleet ID from the request, 
@@ -18,7 +25,7 @@ class VehicleListCreateView(generics.ListCreateAPIView):
         fleet = get_object_or_404(Asset, id=fleet_id, asset_type='vehicle')
 
         # Check if the user is an admin of this fleet
-        role = Role.objects.filter(user=self.request.user, asset=fleet, role='admin').exists()
+        role = role_resolver.has_role(self.request, fleet.asset_number, 'admin')
         if not role:
             return Response({"error": "You are not authorized to add vehicles to this fleet."}, status=403)
         
@@ -32,10 +39,10 @@ class VehicleRetrieveUpdateDeleteView(generics.RetrieveUpdateDestroyAPIView):
         vehicle_id = self.kwargs['pk']
         vehicle = get_object_or_404(Vehicle, id=vehicle_id)
         fleet = vehicle.fleet
-        role = Role.objects.filter(user=self.request.user, asset=fleet).exists()
+        role = role_resolver.has_role(self.request, fleet.asset_number)
         if self.request.method in ['PUT', 'DELETE']:
             # Only allow admins to update or delete vehicles
-            is_admin = Role.objects.filter(user=self.request.user, asset=fleet, role='admin').exists()
+            is_admin = role_resolver.has_role(self.request, fleet.asset_number, 'admin')
             if not is_admin:
                 return Response({"error": "You are not authorized to modify this vehicle."}, status=403)
         return Vehicle.objects.filter(id=vehicle_id)
@@ -54,22 +61,16 @@ class VehicleStatusView(generics.RetrieveAPIView):
         fleet = vehicle.fleet
 
         # Check if the user has any role associated with the vehicle's fleet
-        has_access = Role.objects.filter(user=request.user, asset=fleet).exists()
+        has_access = role_resolver.has_role(request, fleet.asset_number)
         if not has_access:
             return Response({"error": "You are not authorized to view the status of this vehicle."}, status=403)
 
-        # Fetch the latest AssetEvents for this vehicle (e.g., location, passenger count, ignition)
-        vehicle_content_type = ContentType.objects.get_for_model(Vehicle)
-        events = AssetEvent.objects.filter(
-            content_type=vehicle_content_type, object_id=vehicle.id
-        ).order_by('-timestamp')
+        # Fetch the latest state of this vehicle (e.g., location, passenger count, ignition)
+        # Events reference vehicles by vehicle_number within the fleet
+        states = SubAssetState.for_sub_asset(fleet.asset_number, Vehicle, vehicle.vehicle_number, ['location', 'passenger_count', 'ignition'])
 
         # Organize the events by event_type (e.g., latest location, passenger count, etc.)
-        event_data = {}
-        for event_type in ['location', 'passenger_count', 'ignition']:
-            latest_event = events.filter(event_type=event_type).first()
-            if latest_event:
-                event_data[event_type] = latest_event.data
+        event_data = {event_type: state.data for event_type, state in states.items()}
 
         # Prepare the vehicle status response
         status_data = {